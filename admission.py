@@ -0,0 +1,146 @@
+"""Допуск заявок: лимит на пользователя и честная очередь к ресурсам.
+
+* TokenBuckets — у каждого пользователя ведро на burst заявок, пополняется
+  со скоростью rate в секунду. Пустое ведро — заявка отклоняется сразу,
+  с подсказкой, через сколько секунд можно повторить.
+* FairLimiter — не больше capacity одновременных владельцев ресурса
+  (рендер, SMTP). Ожидающие обслуживаются по кругу между пользователями,
+  внутри пользователя — FIFO: десять заявок одного не задерживают
+  единственную заявку другого. Ожидающий получает свою позицию в очереди
+  и её изменения через колбэк.
+
+Всё вызывается из event loop, блокировки не нужны.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Callable, Deque, Dict, Hashable, List, Optional, Tuple
+
+PositionCallback = Callable[[int], None]
+
+
+class TokenBuckets:
+    def __init__(self, rate: float, burst: int, max_users: int = 10000):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.max_users = max_users
+        self._buckets: "OrderedDict[Hashable, Tuple[float, float]]" = OrderedDict()   # user → (токены, ts)
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def take(self, user: Hashable) -> float:
+        """0 — токен взят; иначе через сколько секунд появится следующий."""
+        if not self.enabled:
+            return 0.0
+        now = time.monotonic()
+        tokens, ts = self._buckets.pop(user, (float(self.burst), now))
+        tokens = min(float(self.burst), tokens + (now - ts) * self.rate)
+        if tokens >= 1.0:
+            self._buckets[user] = (tokens - 1.0, now)
+            wait = 0.0
+        else:
+            self._buckets[user] = (tokens, now)
+            wait = (1.0 - tokens) / self.rate
+        while len(self._buckets) > self.max_users:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+class _Waiter:
+    __slots__ = ("owner", "future", "on_position", "position")
+
+    def __init__(self, owner: Hashable, future: asyncio.Future, on_position: Optional[PositionCallback]):
+        self.owner = owner
+        self.future = future
+        self.on_position = on_position
+        self.position = 0
+
+
+class FairLimiter:
+    def __init__(self, name: str, capacity: int):
+        self.name = name
+        self.capacity = max(1, capacity)
+        self.active = 0
+        # Порядок ключей — порядок обхода по кругу; у каждого владельца своя FIFO.
+        self._queues: "OrderedDict[Hashable, Deque[_Waiter]]" = OrderedDict()
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def _order(self) -> List[_Waiter]:
+        """Ожидающие в том порядке, в котором их обслужат."""
+        queues = [list(q) for q in self._queues.values()]
+        out: List[_Waiter] = []
+        depth = 0
+        while True:
+            layer = [q[depth] for q in queues if len(q) > depth]
+            if not layer:
+                return out
+            out.extend(layer)
+            depth += 1
+
+    def _notify_positions(self) -> None:
+        for pos, w in enumerate(self._order(), start=1):
+            if w.position != pos:
+                w.position = pos
+                if w.on_position is not None:
+                    w.on_position(pos)
+
+    def _grant_next(self) -> None:
+        while self.active < self.capacity and self._queues:
+            owner, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            if queue:
+                self._queues.move_to_end(owner)
+            else:
+                del self._queues[owner]
+            if waiter.future.done():              # отменён, пока ждал
+                continue
+            self.active += 1
+            waiter.future.set_result(None)
+        self._notify_positions()
+
+    async def acquire(self, owner: Hashable, on_position: Optional[PositionCallback] = None) -> None:
+        if self.active < self.capacity and not self._queues:
+            self.active += 1
+            return
+        waiter = _Waiter(owner, asyncio.get_running_loop().create_future(), on_position)
+        self._queues.setdefault(owner, deque()).append(waiter)
+        self._notify_positions()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self.release()                     # слот уже выдан — вернуть
+            else:
+                self._remove(waiter)
+            raise
+
+    def _remove(self, waiter: _Waiter) -> None:
+        queue = self._queues.get(waiter.owner)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del self._queues[waiter.owner]
+            self._notify_positions()
+
+    def release(self) -> None:
+        self.active -= 1
+        self._grant_next()
+
+    @asynccontextmanager
+    async def slot(self, owner: Hashable, on_position: Optional[PositionCallback] = None):
+        await self.acquire(owner, on_position)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, int]:
+        return {"active": self.active, "waiting": self.waiting, "capacity": self.capacity}
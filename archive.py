@@ -0,0 +1,179 @@
+"""Архив отправленных пропусков: сжатые PDF по хешу + индекс в SQLite.
+
+* Байты PDF лежат в ARCHIVE_DIR/ab/<sha256>.pdf.gz — одинаковый PDF
+  (повторная заявка, пакет) хранится один раз; файл можно открыть zcat'ом.
+* Индекс — строка на каждую заявку пакета: номер задачи, дата, номер машины,
+  компания, сотрудник, пользователь, ссылка на PDF. /find и /resend отвечают
+  из индекса и читают один файл, без повторного рендера и обхода каталога.
+* prune() удаляет записи старше retention_days и PDF, на которые больше
+  никто не ссылается.
+
+Синхронный слой, как и Outbox; из event loop — через asyncio.to_thread.
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256      TEXT    PRIMARY KEY,
+    size        INTEGER NOT NULL,
+    stored_size INTEGER NOT NULL,
+    created_at  REAL    NOT NULL
+);
+CREATE TABLE IF NOT EXISTS passes (
+    job_id     INTEGER NOT NULL,
+    row        INTEGER NOT NULL,              -- номер строки пакета, 0 для одиночной заявки
+    sha256     TEXT    NOT NULL REFERENCES blobs(sha256),
+    filename   TEXT    NOT NULL,
+    user_id    INTEGER,
+    date       TEXT,
+    car_plate  TEXT,
+    plate_key  TEXT,                          -- номер без пробелов, кириллицей в верхнем регистре
+    company    TEXT,
+    person     TEXT,
+    search     TEXT,                          -- компания и сотрудник в нижнем регистре
+    cc         TEXT    NOT NULL DEFAULT '[]',
+    created_at REAL    NOT NULL,
+    PRIMARY KEY (job_id, row)
+);
+CREATE INDEX IF NOT EXISTS passes_plate ON passes(plate_key);
+CREATE INDEX IF NOT EXISTS passes_created ON passes(created_at);
+CREATE INDEX IF NOT EXISTS passes_sha ON passes(sha256);
+"""
+
+# Латиница, которую путают с кириллицей в российских номерах.
+_PLATE_LOOKALIKES = str.maketrans("ABEKMHOPCTYX", "АВЕКМНОРСТУХ")
+
+
+def plate_key(plate: Optional[str]) -> str:
+    return "".join(ch for ch in (plate or "").upper() if ch.isalnum()).translate(_PLATE_LOOKALIKES)
+
+
+class PassArchive:
+    def __init__(self, root: str, retention_days: float = 365, level: int = 6):
+        self.root = root
+        self.retention_days = retention_days
+        self.level = level
+        os.makedirs(root, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(root, "index.sqlite3"), check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def _blob_path(self, sha: str) -> str:
+        return os.path.join(self.root, sha[:2], f"{sha}.pdf.gz")
+
+    # ── запись ──
+    def _write_blob(self, sha: str, data: bytes) -> None:
+        """Под self._lock: prune не удалит файл между проверкой и записью в индекс."""
+        path = self._blob_path(sha)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def put(self, job_id: int, pdf: bytes, filename: str, records: Iterable[Dict],
+            user_id: Optional[int] = None, cc: Iterable[str] = ()) -> str:
+        """Сохраняет PDF и индексирует заявки (записи пакета — по порядку). Повтор безопасен."""
+        sha = hashlib.sha256(pdf).hexdigest()
+        data = gzip.compress(pdf, self.level, mtime=0)
+        now = time.time()
+        rows = []
+        for i, r in enumerate(records):
+            company, person = r.get("company") or "", r.get("person") or ""
+            rows.append((job_id, i, sha, filename, user_id, r.get("date"), r.get("car_plate"),
+                         plate_key(r.get("car_plate")), company, person,
+                         f"{company}\n{person}".lower(), json.dumps(list(cc), ensure_ascii=False), now))
+        with self._lock:
+            self._write_blob(sha, data)
+            self._db.execute("BEGIN")
+            try:
+                self._db.execute("INSERT OR IGNORE INTO blobs(sha256, size, stored_size, created_at) VALUES (?, ?, ?, ?)",
+                                 (sha, len(pdf), len(data), now))
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO passes(job_id, row, sha256, filename, user_id, date, car_plate, "
+                    "plate_key, company, person, search, cc, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows)
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return sha
+
+    # ── поиск ──
+    def find(self, query: str, limit: int = 10) -> List[sqlite3.Row]:
+        """По номеру машины (фрагмент, латиница/кириллица) или по компании/сотруднику; новые первыми."""
+        key = plate_key(query)
+        text = query.strip().lower()
+        with self._lock:
+            rows = []
+            if key:
+                rows = self._db.execute(
+                    "SELECT * FROM passes WHERE plate_key LIKE ? ORDER BY created_at DESC, job_id DESC, row LIMIT ?",
+                    (f"%{key}%", limit)).fetchall()
+            if not rows and text:
+                rows = self._db.execute(
+                    "SELECT * FROM passes WHERE instr(search, ?) > 0 ORDER BY created_at DESC, job_id DESC, row LIMIT ?",
+                    (text, limit)).fetchall()
+        return rows
+
+    def get(self, job_id: int) -> Optional[Tuple[List[sqlite3.Row], bytes]]:
+        """Записи задачи и байты её PDF; None, если задачи нет в архиве."""
+        with self._lock:
+            rows = self._db.execute("SELECT * FROM passes WHERE job_id=? ORDER BY row", (job_id,)).fetchall()
+        if not rows:
+            return None
+        with open(self._blob_path(rows[0]["sha256"]), "rb") as f:
+            return rows, gzip.decompress(f.read())
+
+    # ── обслуживание ──
+    def prune(self) -> Tuple[int, int]:
+        """Удаляет записи старше retention_days и осиротевшие PDF; возвращает (записей, файлов)."""
+        if self.retention_days <= 0:
+            return 0, 0
+        cutoff = time.time() - self.retention_days * 86400
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                passes = self._db.execute("DELETE FROM passes WHERE created_at < ?", (cutoff,)).rowcount
+                orphans = [r[0] for r in self._db.execute(
+                    "SELECT sha256 FROM blobs WHERE sha256 NOT IN (SELECT sha256 FROM passes)")]
+                self._db.executemany("DELETE FROM blobs WHERE sha256=?", [(s,) for s in orphans])
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            for sha in orphans:
+                try:
+                    os.remove(self._blob_path(sha))
+                except FileNotFoundError:
+                    pass
+        return passes, len(orphans)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            passes = self._db.execute("SELECT COUNT(*) FROM passes").fetchone()[0]
+            blobs, size, stored = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(stored_size), 0) FROM blobs").fetchone()
+        return {"passes": passes, "blobs": blobs, "size": size, "stored_size": stored}
@@ -0,0 +1 @@
+"""Бенчмарки горячих путей бота. Запуск из корня репозитория: python -m bench.<модуль>."""
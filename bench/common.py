@@ -0,0 +1,88 @@
+"""Общие вещи для бенчмарков: тестовая заявка, замеры, окружение бота."""
+from __future__ import annotations
+
+import os
+import resource
+import statistics
+from time import perf_counter
+from typing import Awaitable, Callable, Dict, List
+
+SAMPLE_FORM = {
+    "date": "15.08.2025",
+    "time_range": "10:00 - 18:00",
+    "company": 'ООО "Транспортная компания Северо-Запад"',
+    "car_model": "Mercedes-Benz Actros",
+    "car_plate": "А123ВС 178",
+    "cargo": "Оборудование для чистых помещений",
+    "cargo_count": 12,
+    "person": "Иванов Иван Иванович",
+    "use_lift": True,
+    "materials_in": True,
+    "materials_out": False,
+    "unloading_big": "on",
+    "loading_big": "",
+    "unloading_small": "да",
+    "loading_small": None,
+}
+
+# Минимальное окружение, чтобы импортировать config/bot без .env (SMTP — локальная заглушка).
+BENCH_ENV = {
+    "BOT_TOKEN": "123456:bench",
+    "ALLOWED_USER_IDS": "1",
+    "REPORT_CHAT_ID": "-100",
+    "SMTP_HOST": "127.0.0.1",
+    "SMTP_PORT": "2525",
+    "SMTP_SECURITY": "none",
+    "EMAIL_PASSWORD": "",
+    "FROM_EMAIL": "bot@example.com",
+    "TO_EMAIL": "security@example.com",
+    "PDF_ARCHIVE": "0",
+    "PDF_OPTIMIZE": "0",
+    "DEDUP_TTL": "0",          # e2e шлёт одну и ту же заявку — без этого всё, кроме первой, отсекалось бы
+    "RATE_LIMIT_PER_MIN": "0", # и от одного пользователя
+}
+
+def setup_env(**overrides: str) -> None:
+    for k, v in {**BENCH_ENV, **overrides}.items():
+        os.environ.setdefault(k, v)
+
+def percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    idx = min(len(values) - 1, max(0, round(q * (len(values) - 1))))
+    return values[idx]
+
+def peak_rss_kb() -> int:
+    """Пиковый RSS процесса (Linux: ru_maxrss в КБ)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def summarize(name: str, timings_ms: List[float], **extra) -> Dict:
+    return {
+        "name": name,
+        "n": len(timings_ms),
+        "mean_ms": round(statistics.fmean(timings_ms), 3),
+        "p50_ms": round(percentile(timings_ms, 0.50), 3),
+        "p95_ms": round(percentile(timings_ms, 0.95), 3),
+        "max_ms": round(max(timings_ms), 3),
+        "peak_rss_kb": peak_rss_kb(),
+        **extra,
+    }
+
+def measure(name: str, fn: Callable[[], object], n: int, warmup: int = 1, **extra) -> Dict:
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(n):
+        t0 = perf_counter()
+        fn()
+        timings.append((perf_counter() - t0) * 1000)
+    return summarize(name, timings, **extra)
+
+async def measure_async(name: str, fn: Callable[[], Awaitable[object]], n: int, warmup: int = 1, **extra) -> Dict:
+    for _ in range(warmup):
+        await fn()
+    timings = []
+    for _ in range(n):
+        t0 = perf_counter()
+        await fn()
+        timings.append((perf_counter() - t0) * 1000)
+    return summarize(name, timings, **extra)
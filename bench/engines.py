@@ -0,0 +1,45 @@
+"""Сравнение движков fill_pdf: задержка и размер результата на нашем шаблоне.
+
+    python -m bench.engines --template template.pdf -n 50
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+from time import perf_counter
+
+from bench.common import SAMPLE_FORM, percentile
+from fill_pdf import fill_pdf, get_template
+
+def bench_engine(engine: str, template: str, n: int) -> dict:
+    fill_pdf(template, None, SAMPLE_FORM, engine=engine)     # прогрев: импорт, шрифт
+    timings = []
+    size = 0
+    for _ in range(n):
+        t0 = perf_counter()
+        size = len(fill_pdf(template, None, SAMPLE_FORM, engine=engine))
+        timings.append((perf_counter() - t0) * 1000)
+    return {
+        "engine": engine,
+        "n": n,
+        "mean_ms": statistics.fmean(timings),
+        "p50_ms": percentile(timings, 0.50),
+        "p95_ms": percentile(timings, 0.95),
+        "size_bytes": size,
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--template", default="template.pdf")
+    ap.add_argument("-n", type=int, default=50)
+    ap.add_argument("--engines", default="pdfrw,pymupdf,incremental")
+    args = ap.parse_args()
+
+    get_template(args.template)
+    print(f"{'engine':<10} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'size KB':>9}")
+    for engine in args.engines.split(","):
+        r = bench_engine(engine.strip(), args.template, args.n)
+        print(f"{r['engine']:<10} {r['mean_ms']:>9.2f} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['size_bytes'] / 1024:>9.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,376 @@
+"""Нагрузочный тест: настоящий Application бота, поддельный Bot API, SMTP-заглушка.
+
+    python -m bench.load --rate 30,60,120 -n 100 --concurrency 32 --form 0.2 --out load.json
+    python -m bench.load --replay raw_forms.jsonl --rate 60 -n 200
+
+Апдейты (web_app_data и ручная форма целиком, все 17 сообщений) собираются
+как настоящие telegram.Update и кладутся в update_queue — их разбирают те же
+обработчики, ConversationHandler, persistence и outbox, что и в бою. Bot API
+подменён на уровне BaseRequest: бот думает, что говорит с Telegram.
+
+Заявки приходят с постоянным темпом (--rate в минуту); задержка считается от
+запланированного момента прихода, поэтому очередь перед ботом тоже входит
+в неё. На каждый темп — пропускная способность, p50/p95/p99 до ответа
+«принята» и до «отправлена», ошибки и лаг event loop.
+
+--replay — JSON lines: данные WebApp (как в строке «RAW DATA» отладочного
+лога) или Update целиком, из которого берётся message.web_app_data.data.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+from telegram.request import BaseRequest, RequestData
+
+from bench.common import SAMPLE_FORM, peak_rss_kb, percentile, setup_env
+from bench.smtp_stub import SmtpStub
+
+USER_BASE = 1000
+ACK = ("📨",)
+DONE = ("✅", "❌")
+REJECTED = ("⛔", "⚠", "⏳", "♻")
+
+
+# ────────────────────────── ПОДДЕЛЬНЫЙ BOT API ──────────────────────────
+class FakeBotApi(BaseRequest):
+    """Отвечает на вызовы Bot API как Telegram; сообщения в чаты будят ожидающих."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay                 # задержка ответа «Telegram», сек
+        self.calls: Counter = Counter()
+        self._ids = itertools.count(1)
+        self._waiters: Dict[int, List[Tuple[Callable[[str], bool], asyncio.Future]]] = {}
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def expect(self, chat_id: int, match: Callable[[str], bool] = lambda text: True) -> asyncio.Future:
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(chat_id, []).append((match, fut))
+        return fut
+
+    def _deliver(self, chat_id: int, text: str) -> None:
+        waiters = self._waiters.get(chat_id)
+        if not waiters:
+            return
+        keep = []
+        for match, fut in waiters:
+            if fut.done():
+                continue
+            if match(text):
+                fut.set_result(text)
+            else:
+                keep.append((match, fut))
+        if keep:
+            self._waiters[chat_id] = keep
+        else:
+            del self._waiters[chat_id]
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         read_timeout=None, write_timeout=None, connect_timeout=None, pool_timeout=None):
+        api = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data is not None else {}
+        self.calls[api] += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+
+        if api == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Load", "username": "load_bot"}
+        elif api in ("sendMessage", "sendDocument", "editMessageText"):
+            chat_id = int(params.get("chat_id", 0))
+            text = params.get("text") or params.get("caption") or ""
+            result = {"message_id": next(self._ids), "date": int(time.time()),
+                      "chat": {"id": chat_id, "type": "private"}, "text": text}
+            self._deliver(chat_id, text)
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+# ────────────────────────── СЦЕНАРИИ ──────────────────────────
+FORM_ANSWERS = [
+    "15.08.2025", "10:00 - 18:00", SAMPLE_FORM["company"], SAMPLE_FORM["car_model"], SAMPLE_FORM["car_plate"],
+    SAMPLE_FORM["cargo"], str(SAMPLE_FORM["cargo_count"]), SAMPLE_FORM["person"], "abc",
+    "Да", "Да", "Нет", "Да", "Нет", "Да", "Нет",
+]
+
+def load_replay(path: str) -> List[str]:
+    raws = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            obj = json.loads(line)
+            web = (obj.get("message") or {}).get("web_app_data") if isinstance(obj, dict) else None
+            raws.append(web["data"] if web else line)
+    if not raws:
+        raise SystemExit(f"{path}: нет записей")
+    return raws
+
+
+class Driver:
+    def __init__(self, app, api: FakeBotApi, timeout: float, think: float):
+        self.app = app
+        self.api = api
+        self.timeout = timeout
+        self.think = think
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+
+    def _message(self, user_id: int, **fields) -> dict:
+        return {
+            "update_id": next(self._update_ids),
+            "message": {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": user_id, "is_bot": False, "first_name": "Load"},
+                **fields,
+            },
+        }
+
+    async def _put(self, data: dict) -> None:
+        from telegram import Update
+        await self.app.update_queue.put(Update.de_json(data, self.app.bot))
+
+    async def _send_text(self, user_id: int, text: str) -> str:
+        fields = {"text": text}
+        if text.startswith("/"):
+            fields["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        reply = self.api.expect(user_id)
+        await self._put(self._message(user_id, **fields))
+        return await asyncio.wait_for(reply, self.timeout)
+
+    async def web(self, user_id: int, raw: str, result: Dict) -> None:
+        t0 = result["scheduled"]
+        ack = self.api.expect(user_id, lambda t: t.startswith(ACK + REJECTED))
+        done = self.api.expect(user_id, lambda t: t.startswith(DONE))
+        await self._put(self._message(user_id, web_app_data={"data": raw, "button_text": "📝"}))
+        await self._finish(ack, done, t0, result)
+
+    async def form(self, user_id: int, result: Dict) -> None:
+        t0 = result["scheduled"]
+        steps = result["steps"] = []
+        t = perf_counter()
+        await self._send_text(user_id, "/manual_form")
+        steps.append(perf_counter() - t)
+        for answer in FORM_ANSWERS[:-1]:
+            if self.think:
+                await asyncio.sleep(self.think)
+            t = perf_counter()
+            await self._send_text(user_id, answer)
+            steps.append(perf_counter() - t)
+        # Последний ответ — заявка уходит в outbox.
+        ack = self.api.expect(user_id, lambda t: t.startswith(ACK + REJECTED))
+        done = self.api.expect(user_id, lambda t: t.startswith(DONE))
+        t = perf_counter()
+        await self._put(self._message(user_id, text=FORM_ANSWERS[-1]))
+        await self._finish(ack, done, t0, result, step_started=t)
+
+    async def _finish(self, ack, done, t0: float, result: Dict, step_started: Optional[float] = None) -> None:
+        text = await asyncio.wait_for(ack, self.timeout)
+        result["ack"] = perf_counter() - t0
+        if step_started is not None:
+            result["steps"].append(perf_counter() - step_started)
+        if not text.startswith(ACK):
+            done.cancel()
+            result["error"] = f"rejected: {text[:60]}"
+            return
+        text = await asyncio.wait_for(done, self.timeout)
+        result["done"] = perf_counter() - t0
+        if not text.startswith("✅"):
+            result["error"] = f"failed: {text[:60]}"
+
+
+class ErrorCounter(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.count = 0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.count += 1
+
+
+# ────────────────────────── ПРОГОН ──────────────────────────
+def _ms(values: List[float], q: float) -> float:
+    return round(percentile(values, q) * 1000, 1) if values else 0.0
+
+async def run_rate(driver: Driver, rate: float, n: int, concurrency: int, form_share: float,
+                   raws: List[str], errors: ErrorCounter, rng: random.Random) -> Dict:
+    import bot
+
+    users: asyncio.Queue = asyncio.Queue()
+    for i in range(concurrency):
+        users.put_nowait(USER_BASE + i)
+    results: List[Dict] = []
+    interval = 60.0 / rate
+    errors_before = errors.count
+    raw_iter = itertools.cycle(raws)
+
+    async def one(kind: str, scheduled: float) -> None:
+        user_id = await users.get()            # один пользователь — один диалог за раз
+        result = {"kind": kind, "scheduled": scheduled}
+        results.append(result)
+        try:
+            if kind == "form":
+                await driver.form(user_id, result)
+            else:
+                await driver.web(user_id, next(raw_iter), result)
+        except asyncio.TimeoutError:
+            result["error"] = "timeout"
+        except Exception as e:
+            result["error"] = repr(e)
+        finally:
+            users.put_nowait(user_id)
+
+    started = perf_counter()
+    tasks = []
+    for i in range(n):
+        scheduled = started + i * interval
+        delay = scheduled - perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        kind = "form" if rng.random() < form_share else "web"
+        tasks.append(asyncio.create_task(one(kind, scheduled)))
+    await asyncio.gather(*tasks)
+    elapsed = perf_counter() - started
+
+    ok = [r for r in results if "error" not in r]
+    acks = [r["ack"] for r in results if "ack" in r]
+    done = [r["done"] for r in ok]
+    steps = [s for r in results for s in r.get("steps", ())]
+    loop = bot.LOOP_MONITOR.summary(elapsed) if bot.LOOP_MONITOR is not None else {}
+    return {
+        "rate_per_min": rate,
+        "n": n,
+        "forms": sum(1 for r in results if r["kind"] == "form"),
+        "completed": len(ok),
+        "errors": dict(Counter(r["error"].split(":")[0] for r in results if "error" in r)),
+        "log_errors": errors.count - errors_before,
+        "elapsed_s": round(elapsed, 2),
+        "throughput_per_min": round(len(ok) * 60.0 / elapsed, 1),
+        "ack_p50_ms": _ms(acks, 0.50), "ack_p95_ms": _ms(acks, 0.95), "ack_p99_ms": _ms(acks, 0.99),
+        "done_p50_ms": _ms(done, 0.50), "done_p95_ms": _ms(done, 0.95), "done_p99_ms": _ms(done, 0.99),
+        "form_step_p50_ms": _ms(steps, 0.50), "form_step_p95_ms": _ms(steps, 0.95),
+        "loop_lag_p50_ms": round(loop.get("lag_p50_ms", 0.0), 1),
+        "loop_lag_p99_ms": round(loop.get("lag_p99_ms", 0.0), 1),
+        "loop_lag_max_ms": round(loop.get("lag_max_ms", 0.0), 1),
+        "loop_stalls": loop.get("stalls", 0),
+        "peak_rss_kb": peak_rss_kb(),
+    }
+
+async def run_all(args) -> Dict:
+    import bot
+    from telegram.ext import Application
+
+    raws = load_replay(args.replay) if args.replay else [
+        json.dumps({**SAMPLE_FORM, "date": "2025-08-15", "mail3": "abc"}, ensure_ascii=False)]
+    api = FakeBotApi(args.tg_delay)
+    concurrent = args.concurrent_updates
+    if concurrent is None:
+        concurrent = bot.WEBHOOK_MAX_INFLIGHT if bot.BOT_MODE == "webhook" else False
+    builder = (
+        Application.builder()
+        .token(bot.BOT_TOKEN)
+        .request(api)
+        .get_updates_request(FakeBotApi())
+        .updater(None)
+        .concurrent_updates(concurrent)
+    )
+    app = bot.build_app(builder)
+    errors = ErrorCounter()
+    logging.getLogger().addHandler(errors)
+    driver = Driver(app, api, args.timeout, args.think)
+    rng = random.Random(args.seed)
+
+    results = []
+    async with SmtpStub(port=args.smtp_port, delay=args.smtp_delay) as stub:
+        # Как run_polling: initialize → post_init → start … stop → shutdown → post_shutdown.
+        await app.initialize()
+        await app.post_init(app)
+        await app.start()
+        try:
+            if bot.WARMUP is not None:
+                await bot.WARMUP                   # пул рендера поднят — меряем работу, а не прогрев
+            for rate in args.rate:
+                r = await run_rate(driver, rate, args.n, args.concurrency, args.form, raws, errors, rng)
+                results.append(r)
+                print(f"{rate:>7.0f}/мин → {r['throughput_per_min']:>7.1f}/мин, ok {r['completed']}/{r['n']}, "
+                      f"ack p95 {r['ack_p95_ms']:.0f} ms, done p95 {r['done_p95_ms']:.0f} ms, "
+                      f"lag p99 {r['loop_lag_p99_ms']:.0f} ms, ошибки {r['errors'] or 0}", file=sys.stderr)
+        finally:
+            await app.stop()
+            await app.shutdown()
+            await app.post_shutdown(app)
+        smtp = {"messages": stub.messages, "bytes": stub.bytes}
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "concurrent_updates": concurrent,
+        "tg_delay_s": args.tg_delay,
+        "smtp_delay_s": args.smtp_delay,
+        "smtp_stub": smtp,
+        "bot_api_calls": dict(api.calls),
+        "results": results,
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--rate", default="60", help="заявок в минуту; через запятую — несколько прогонов подряд")
+    ap.add_argument("-n", type=int, default=100, help="заявок на каждый темп")
+    ap.add_argument("--concurrency", type=int, default=32, help="пользователей одновременно (один диалог на каждого)")
+    ap.add_argument("--form", type=float, default=0.0, help="доля заявок через ручную форму, 0…1")
+    ap.add_argument("--think", type=float, default=0.0, help="пауза пользователя между ответами формы, сек")
+    ap.add_argument("--replay", help="JSON lines с данными WebApp или Update целиком")
+    ap.add_argument("--concurrent-updates", type=int, default=None,
+                    help="как в Application; по умолчанию — как в BOT_MODE")
+    ap.add_argument("--timeout", type=float, default=120.0, help="сколько ждать ответа бота, сек")
+    ap.add_argument("--tg-delay", type=float, default=0.0, help="задержка ответа Bot API, сек")
+    ap.add_argument("--template", default="template.pdf")
+    ap.add_argument("--smtp-port", type=int, default=2525)
+    ap.add_argument("--smtp-delay", type=float, default=0.0)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--out", default="-", help="файл для JSON ('-' — stdout)")
+    args = ap.parse_args()
+    args.rate = [float(r) for r in args.rate.split(",") if r.strip()]
+
+    workdir = tempfile.mkdtemp(prefix="akm-load-")
+    users = ",".join(str(USER_BASE + i) for i in range(args.concurrency))
+    setup_env(SMTP_PORT=str(args.smtp_port), TEMPLATE_PATH=os.path.abspath(args.template),
+              ALLOWED_USER_IDS=f"1,{users}",
+              OUTBOX_PATH=os.path.join(workdir, "outbox.sqlite3"),
+              PERSISTENCE_PATH=os.path.join(workdir, "state.sqlite3"),
+              METRICS_PORT="0", LOG_LEVEL="WARNING")
+
+    report = asyncio.run(run_all(args))
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out == "-":
+        print(text)
+    else:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""Набор бенчмарков горячих путей: рендер PDF и доставка.
+
+    python -m bench.run --template template.pdf -n 50 --out bench_results.json
+
+Результат — JSON со списком замеров (p50/p95/max, пиковый RSS), чтобы
+сравнивать релизы между собой. SMTP поднимается локальной заглушкой,
+Telegram заменён FakeBot — сеть не нужна.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Dict, List
+
+from bench.common import SAMPLE_FORM, measure, measure_async, setup_env
+from bench.smtp_stub import SmtpStub
+
+SHORT_TEXT = "А123ВС 178"
+LONG_TEXT = ("Оборудование для чистых помещений, стеллажи, паллеты с комплектующими "
+             "и расходные материалы для участка сборки")
+
+
+# ────────────────────────── FAKE TELEGRAM ──────────────────────────
+class FakeBot:
+    """Вместо Telegram API: складывает вызовы и будит ожидающих ответа в чат."""
+
+    def __init__(self):
+        self.sent: List[Dict] = []
+        self._waiters: Dict[int, asyncio.Future] = {}
+
+    def wait_done(self, chat_id: int) -> asyncio.Future:
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters[chat_id] = fut
+        return fut
+
+    async def send_message(self, chat_id=None, text="", **kwargs):
+        self.sent.append({"chat_id": chat_id, "text": text})
+        fut = self._waiters.get(chat_id)
+        if fut is not None and not fut.done() and text.startswith(("✅", "❌")):
+            fut.set_result(text)
+        return SimpleNamespace(message_id=len(self.sent))
+
+    async def send_document(self, chat_id=None, document=None, **kwargs):
+        self.sent.append({"chat_id": chat_id, "document": len(document or b"")})
+        return SimpleNamespace(message_id=len(self.sent))
+
+    async def get_me(self):
+        return SimpleNamespace(id=0, username="bench_bot")
+
+
+def fake_update(bot: FakeBot, user_id: int, chat_id: int, raw: str) -> SimpleNamespace:
+    async def send_message(text, **kwargs):
+        return await bot.send_message(chat_id=chat_id, text=text, **kwargs)
+
+    return SimpleNamespace(
+        message=SimpleNamespace(web_app_data=SimpleNamespace(data=raw)),
+        effective_user=SimpleNamespace(id=user_id),
+        effective_chat=SimpleNamespace(id=chat_id, send_message=send_message),
+    )
+
+
+# ────────────────────────── PDF ──────────────────────────
+def bench_pdf(template: str, n: int) -> List[Dict]:
+    import fill_pdf as fp
+
+    results = []
+
+    def cold():
+        fp._TEMPLATES.clear()
+        fp._layout_text.cache_clear()
+        fp.fill_pdf(template, None, SAMPLE_FORM)
+
+    results.append(measure("fill_pdf.cold", cold, n, warmup=0))
+    results.append(measure("fill_pdf.warm", lambda: fp.fill_pdf(template, None, SAMPLE_FORM), n))
+
+    field = fp.TemplateField("company", 0, "text", 0.0, 0.0, 300.0, 18.0, 296.0, 16.0)
+    for label, text in (("short", SHORT_TEXT), ("long", LONG_TEXT)):
+        def uncached(text=text):
+            fp._layout_text.cache_clear()
+            fp._fit_layout(text, field)
+        results.append(measure(f"fit_text.{label}.uncached", uncached, n * 10))
+        results.append(measure(f"fit_text.{label}.cached", lambda text=text: fp._fit_layout(text, field), n * 10))
+
+    tpl = fp.get_template(template)
+    overlay_pages, overlay = fp._build_overlay(tpl, SAMPLE_FORM)
+    merged = fp._merge_overlay(tpl, overlay_pages, overlay)
+    results.append(measure("pdfrw.overlay", lambda: fp._build_overlay(tpl, SAMPLE_FORM), n))
+    results.append(measure("pdfrw.merge", lambda: fp._merge_overlay(tpl, overlay_pages, overlay), n))
+    results.append(measure("pdfrw.write", lambda: fp._write_pdf(merged), n,
+                           size_bytes=len(fp._write_pdf(merged))))
+    return results
+
+
+# ────────────────────────── ДОСТАВКА ──────────────────────────
+async def bench_email(pdf: bytes, n: int) -> List[Dict]:
+    import email_sender
+
+    results = []
+    send = lambda: email_sender.send_email_async("bench", "bench", pdf, filename="bench.pdf")
+    results.append(await measure_async("send_email.no_pool", send, n))
+
+    await email_sender.start_mail_pool()
+    try:
+        results.append(await measure_async("send_email.pool", send, n))
+    finally:
+        await email_sender.stop_mail_pool()
+    return results
+
+async def bench_end_to_end(n: int, concurrency: int) -> List[Dict]:
+    import bot
+    import email_sender
+    import pdf_pool
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    fake = FakeBot()
+    context = SimpleNamespace(bot=fake)
+    chat_ids = itertools.count(1000)
+    raw = json.dumps({**SAMPLE_FORM, "date": "2025-08-15", "mail3": "abc"}, ensure_ascii=False)
+    user_id = bot.ALLOWED_USER_IDS[0]
+
+    await pdf_pool.start_pool(bot.PDF_WORKERS, [bot.TEMPLATE_PATH], bot.PDF_ENGINE)
+    await email_sender.start_mail_pool()
+    bot.OUTBOX = bot.build_outbox(SimpleNamespace(bot=fake))
+    await bot.OUTBOX.start()
+
+    async def one():
+        chat_id = next(chat_ids)
+        done = fake.wait_done(chat_id)
+        await bot.handle_web_app_data(fake_update(fake, user_id, chat_id, raw), context)
+        result = await done
+        if not result.startswith("✅"):
+            raise RuntimeError(result)
+
+    async def burst():
+        await asyncio.gather(*(one() for _ in range(concurrency)))
+
+    try:
+        return [
+            await measure_async("handle_web_app_data.e2e", one, n),
+            await measure_async(f"handle_web_app_data.e2e.burst{concurrency}", burst, max(1, n // concurrency)),
+        ]
+    finally:
+        await bot.MAILER.close()
+        await bot.OUTBOX.stop()
+        bot.OUTBOX.outbox.close()
+        await email_sender.stop_mail_pool()
+        pdf_pool.shutdown_pool()
+
+
+async def run_all(args) -> Dict:
+    results = bench_pdf(args.template, args.n)
+
+    import fill_pdf
+    pdf = fill_pdf.fill_pdf(args.template, None, SAMPLE_FORM)
+
+    async with SmtpStub(port=args.smtp_port, delay=args.smtp_delay) as stub:
+        results += await bench_email(pdf, args.n)
+        if not args.skip_e2e:
+            results += await bench_end_to_end(args.n, args.concurrency)
+        smtp = {"messages": stub.messages, "bytes": stub.bytes}
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "template": args.template,
+        "smtp_stub": smtp,
+        "results": results,
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--template", default="template.pdf")
+    ap.add_argument("-n", type=int, default=30)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--smtp-port", type=int, default=2525)
+    ap.add_argument("--smtp-delay", type=float, default=0.0)
+    ap.add_argument("--skip-e2e", action="store_true")
+    ap.add_argument("--out", default="-", help="файл для JSON ('-' — stdout)")
+    args = ap.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="akm-bench-")
+    setup_env(SMTP_PORT=str(args.smtp_port), TEMPLATE_PATH=os.path.abspath(args.template),
+              OUTBOX_PATH=os.path.join(workdir, "outbox.sqlite3"))
+
+    report = asyncio.run(run_all(args))
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out == "-":
+        print(text)
+    else:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+        for r in report["results"]:
+            print(f"{r['name']:<36} p50 {r['p50_ms']:>9.3f}  p95 {r['p95_ms']:>9.3f}  max {r['max_ms']:>9.3f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Локальная SMTP-заглушка: принимает письма без TLS и AUTH, считает их.
+
+    python -m bench.smtp_stub --port 2525
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+from typing import Optional
+
+
+class SmtpStub:
+    def __init__(self, host: str = "127.0.0.1", port: int = 2525, delay: float = 0.0):
+        self.host = host
+        self.port = port
+        self.delay = delay             # искусственная задержка ответа на DATA, сек
+        self.messages = 0
+        self.bytes = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        writer.write(b"220 stub ESMTP\r\n")
+        in_data = False
+        size = 0
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if in_data:
+                    if line == b".\r\n":
+                        in_data = False
+                        if self.delay:
+                            await asyncio.sleep(self.delay)
+                        self.messages += 1
+                        self.bytes += size
+                        writer.write(b"250 2.0.0 queued\r\n")
+                    else:
+                        size += len(line)
+                        continue
+                else:
+                    cmd = line[:4].upper()
+                    if cmd in (b"EHLO", b"HELO"):
+                        writer.write(b"250-stub\r\n250-SIZE 52428800\r\n250 8BITMIME\r\n")
+                    elif cmd == b"DATA":
+                        in_data, size = True, 0
+                        writer.write(b"354 end with .\r\n")
+                    elif cmd == b"QUIT":
+                        writer.write(b"221 bye\r\n")
+                        await writer.drain()
+                        break
+                    else:
+                        writer.write(b"250 ok\r\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def start(self) -> "SmtpStub":
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        return self
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self) -> "SmtpStub":
+        return await self.start()
+
+    async def __aexit__(self, *exc) -> None:
+        await self.stop()
+
+
+async def _serve(host: str, port: int, delay: float) -> None:
+    stub = await SmtpStub(host, port, delay).start()
+    print(f"SMTP stub on {host}:{port}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await stub.stop()
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=2525)
+    ap.add_argument("--delay", type=float, default=0.0)
+    args = ap.parse_args()
+    try:
+        asyncio.run(_serve(args.host, args.port, args.delay))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
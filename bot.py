@@ -4,19 +4,55 @@
 """
 from __future__ import annotations
 
-import os, json, asyncio, logging, re
+import startup
+startup.mark("старт bot.py")
+
+import os, json, asyncio, logging, math, re, tempfile
+from contextlib import asynccontextmanager, nullcontext
 from datetime import datetime, timezone, time
 from time import perf_counter
-from logging.handlers import RotatingFileHandler
 
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, MenuButtonWebApp, ReplyKeyboardMarkup, WebAppInfo, KeyboardButton, ReplyKeyboardRemove
-from telegram.ext import (
-    Application, CommandHandler, MessageHandler, ContextTypes, filters, ConversationHandler
-)
+with startup.phase("import telegram"):
+    from telegram.request import HTTPXRequest
+    from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, MenuButtonWebApp, ReplyKeyboardMarkup, WebAppInfo, KeyboardButton, ReplyKeyboardRemove
+    from telegram.ext import (
+        Application, ApplicationBuilder, CommandHandler, MessageHandler, ContextTypes, filters, ConversationHandler, TypeHandler
+    )
 
-from config import BOT_TOKEN, WEBAPP_URL, ALLOWED_USER_IDS, REPORT_CHAT_ID, REPORT_TOPIC_ID, STATUS_CHAT_ID, STATUS_TOPIC_ID, EMAIL_DOMAIN
-from fill_pdf import fill_pdf
-from email_sender import send_email
+with startup.phase("import config"):
+    from config import (
+        BOT_TOKEN, WEBAPP_URL, ALLOWED_USER_IDS, REPORT_CHAT_ID, REPORT_TOPIC_ID, STATUS_CHAT_ID, STATUS_TOPIC_ID, EMAIL_DOMAIN,
+        PDF_WORKERS, TEMPLATE_PATH, PDF_ARCHIVE, PDF_ENGINE, ARCHIVE_DIR, ARCHIVE_RETENTION_DAYS,
+        PDF_OPTIMIZE, PDF_OPTIMIZE_SLOTS, PDF_OPTIMIZE_TIMEOUT,
+        OUTBOX_PATH, OUTBOX_WORKERS, OUTBOX_MAX_ATTEMPTS, PERSISTENCE_PATH, PERSISTENCE_INTERVAL,
+        RATE_LIMIT_PER_MIN, RATE_LIMIT_BURST, RENDER_SLOTS, MAIL_SLOTS, QUEUE_NOTICE_INTERVAL,
+        SINK_ATTEMPTS, SINK_EMAIL_TIMEOUT, SINK_REPORT_TIMEOUT, SINK_ARCHIVE_TIMEOUT,
+        MAIL_BATCH_WINDOW, MAIL_BATCH_MAX, MAIL_BATCH_MODE, DEDUP_TTL, DEDUP_MAX,
+        BULK_MAX_ROWS, BULK_MAX_BYTES, BULK_MODE,
+        METRICS_HOST, METRICS_PORT,
+        BOT_MODE, WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_MAX_INFLIGHT,
+        TG_LOG_WINDOW, TG_LOG_QUEUE, LOG_LEVEL, LOG_JSON, LOG_QUEUE, LOOP_LAG_INTERVAL, LOOP_STALL_THRESHOLD,
+    )
+
+# fill_pdf (reportlab, pdfrw, разбор TTF) здесь не импортируется: рендер идёт в
+# пуле процессов, а в этом процессе модуль прогревается в фоне после post_init.
+with startup.phase("import modules"):
+    from pdf_pool import start_pool, shutdown_pool, render_pdf, new_output_name
+    from archive import PassArchive
+    from pdf_optimize import PdfOptimizer
+    from email_sender import start_mail_pool, stop_mail_pool, send_email_async
+    from bulk import BulkError, load_rows
+    from outbox import Outbox, OutboxWorker, Job
+    from mail_batch import MailBatcher
+    from dedup import SubmissionCache, Submission, submission_key
+    from persistence import SqlitePersistence
+    from admission import TokenBuckets, FairLimiter
+    from delivery import Sink, DeliveryError, fan_out
+    from loopmon import LoopMonitor
+    from error_reports import TelegramErrorHandler
+    import metrics
+    import logs
+    from logs import LOG_FORMAT
 
 # ────────────────────────── КОНСТАНТЫ ────────────────────────────
 START_BTN = "🚀 Начать"
@@ -28,56 +64,40 @@ ADMIN_ID = ALLOWED_USER_IDS[0]
 
 START_TIME = datetime.now(timezone.utc)
 
-PDF_PATH     = "output/form_latest.pdf"           
-PDF_TMP_PATH = "output/.form_latest.tmp.pdf"      
-PDF_LOCK     = asyncio.Lock() 
+MAIL_SUBJECT = 'Заявка на пропуск от ООО "АК Микротех"'
+MAIL_BODY    = "Здравствуйте!\nК данному письму прилагается заявка на пропуск для транспортного средства."
+
+HEARTBEAT_INTERVAL = 1200
+
+OUTBOX: OutboxWorker | None = None
+METRICS_SERVER = None
+WARMUP: asyncio.Task | None = None
+STARTUP_MESSAGE = None
+MAILER = MailBatcher(MAIL_SUBJECT, MAIL_BODY, window=MAIL_BATCH_WINDOW, max_size=MAIL_BATCH_MAX, mode=MAIL_BATCH_MODE)
+SUBMISSIONS = SubmissionCache(DEDUP_TTL, DEDUP_MAX)
+RATE_LIMITS = TokenBuckets(RATE_LIMIT_PER_MIN / 60.0, RATE_LIMIT_BURST)
+RENDER_LIMIT = FairLimiter("рендер", RENDER_SLOTS)
+MAIL_LIMIT = FairLimiter("отправку", MAIL_SLOTS)
+SINKS: list = []          # заполняется в build_outbox
+LOOP_MONITOR: LoopMonitor | None = None
+ARCHIVE: PassArchive | None = None
+OPTIMIZER = PdfOptimizer(PDF_OPTIMIZE_SLOTS, PDF_OPTIMIZE_TIMEOUT) if PDF_OPTIMIZE else None
 
 # ────────────────────────── ЛОГИ ────────────────────────────
-LOG_FORMAT = "%(asctime)s | %(levelname)-8s | %(name)s | %(message)s"
 LOG_FILE   = "bot.log"
 root = logging.getLogger()
-root.setLevel(logging.INFO)
-file_h = RotatingFileHandler(LOG_FILE, maxBytes=1_000_000, backupCount=10, encoding="utf-8")
-file_h.setFormatter(logging.Formatter(LOG_FORMAT))
-file_h.setLevel(logging.DEBUG)
-root.addHandler(file_h)
-console_h = logging.StreamHandler()
-console_h.setFormatter(logging.Formatter(LOG_FORMAT))
-console_h.setLevel(logging.INFO)
-root.addHandler(console_h)
+logs.setup_logging(LOG_FILE, level=getattr(logging, LOG_LEVEL, logging.INFO), json_lines=LOG_JSON,
+                   max_queue=LOG_QUEUE)
 logging.getLogger("httpx").setLevel(logging.WARNING)
 logging.getLogger("telegram.ext").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
 # ────────────────────────── ЛОГИ В ТГ ──────────────────────────
-class TelegramErrorHandler(logging.Handler):
-    def __init__(self, app, chat_id: int, thread_id: int | None = None):
-        super().__init__(logging.ERROR)
-        self.app = app
-        self.chat_id = chat_id
-        self.thread_id = thread_id
-
-    def emit(self, record: logging.LogRecord):
-        if not getattr(self.app, "running", False):
-            return
-
-        msg = self.format(record)
-
-        async def _send():
-            try:
-                await self.app.bot.send_message(
-                    chat_id=self.chat_id,
-                    message_thread_id=self.thread_id,
-                    text=f"❌ *ERROR*\n```{msg}```",
-                    parse_mode="Markdown",
-                )
-            except Exception:
-                pass
-
-        try:
-            self.app.create_task(_send())
-        except Exception:
-            pass
+def report_stall(lag: float, stack: str) -> None:
+    """Зависание loop'а — в лог уровня ERROR, оттуда сразу в статус-топик (с схлопыванием повторов)."""
+    stack = stack[-3000:] if stack else "(стек не снят)"
+    logger.error("Event loop завис на %.0f мс, задач: %d. Что его держало:\n%s",
+                 lag * 1000, len(asyncio.all_tasks()), stack)
 
 # ────────────────────────── ФУНКЦИИ ────────────────────────────
 def build_menu_kb(user_id: int) -> ReplyKeyboardMarkup:
@@ -86,17 +106,117 @@ def build_menu_kb(user_id: int) -> ReplyKeyboardMarkup:
         buttons.append([STOP_BTN])                   
     return ReplyKeyboardMarkup(buttons, resize_keyboard=True)
 
+async def warm_up():
+    """Тяжёлая инициализация после post_init: polling не ждёт пулов и импорта fill_pdf."""
+    async def pdf():
+        with startup.phase("прогрев PDF pool"):
+            try:
+                await start_pool(PDF_WORKERS, [TEMPLATE_PATH], PDF_ENGINE)
+            except Exception as e:
+                logger.error("Не удалось запустить пул PDF: %s", e)
+        with startup.phase("прогрев fill_pdf"):
+            await asyncio.to_thread(__import__, "fill_pdf")
+
+    async def smtp():
+        with startup.phase("прогрев SMTP"):
+            try:
+                await start_mail_pool()
+            except Exception as e:
+                logger.error("Не удалось подключиться к SMTP: %s", e)
+
+    await asyncio.gather(pdf(), smtp())
+    startup.mark("прогрев завершён")
+    logger.info("Профиль старта: %s", startup.as_text())
+
+def startup_text() -> str:
+    return f"✅ Бот *запущен*\n\n*Старт:*\n{startup.report()}"
+
+async def report_ready(bot):
+    """Первый getUpdates ушёл — дописываем время в стартовое сообщение."""
+    logger.info("Профиль старта: %s", startup.as_text())
+    if STARTUP_MESSAGE is None:
+        return
+    try:
+        await bot.edit_message_text(
+            chat_id=STARTUP_MESSAGE.chat_id, message_id=STARTUP_MESSAGE.message_id,
+            text=startup_text(), parse_mode="Markdown",
+        )
+    except Exception as e:
+        logger.warning("Не удалось обновить стартовое сообщение: %s", e)
+
+class StartupTimingRequest(HTTPXRequest):
+    """Запросы getUpdates: отмечает в профиле старта момент первого из них."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.bot = None
+        self._report: asyncio.Task | None = None
+
+    async def do_request(self, url, method, *args, **kwargs):
+        if not startup.marked("первый getUpdates"):
+            startup.mark("первый getUpdates")
+            if self.bot is not None:
+                self._report = asyncio.create_task(report_ready(self.bot))
+        return await super().do_request(url, method, *args, **kwargs)
+
 async def on_startup(app: Application):
+    for h in root.handlers:
+        if isinstance(h, TelegramErrorHandler):
+            h.start()
+
+    global OUTBOX, METRICS_SERVER, WARMUP, STARTUP_MESSAGE, LOOP_MONITOR, ARCHIVE
+    with startup.phase("post_init"):
+        if PDF_ARCHIVE:
+            ARCHIVE = PassArchive(ARCHIVE_DIR, ARCHIVE_RETENTION_DAYS)
+        if LOOP_LAG_INTERVAL > 0:
+            LOOP_MONITOR = LoopMonitor(LOOP_LAG_INTERVAL, LOOP_STALL_THRESHOLD, on_stall=report_stall)
+            LOOP_MONITOR.start()
+
+        OUTBOX = build_outbox(app)
+        await OUTBOX.start()
+
+        if METRICS_PORT:
+            try:
+                METRICS_SERVER = metrics.build_metrics_server(METRICS_HOST, METRICS_PORT)
+                await METRICS_SERVER.start()
+            except Exception as e:
+                METRICS_SERVER = None
+                logger.error("Не удалось запустить /metrics: %s", e)
+
+        WARMUP = asyncio.create_task(warm_up(), name="warm-up")
+    startup.mark("post_init")
+    logger.info("Профиль старта: %s", startup.as_text())
+
     try:
-        await app.bot.send_message(
+        STARTUP_MESSAGE = await app.bot.send_message(
             chat_id=STATUS_CHAT_ID,
             message_thread_id=STATUS_TOPIC_ID,
-            text="✅ Бот *запущен*",
+            text=startup_text(),
             parse_mode="Markdown",
         )
     except Exception as e:
         logger.error("Не удалось отправить стартовое сообщение: %s", e)
 
+async def on_shutdown(app: Application):
+    if WARMUP is not None and not WARMUP.done():
+        WARMUP.cancel()
+        await asyncio.gather(WARMUP, return_exceptions=True)
+    if METRICS_SERVER is not None:
+        await METRICS_SERVER.stop()
+    if OUTBOX is not None:                  # сначала outbox: его задачи ещё могут ждать MAILER
+        await OUTBOX.stop()
+        OUTBOX.outbox.close()
+    await MAILER.close()
+    if ARCHIVE is not None:
+        ARCHIVE.close()
+    await stop_mail_pool()
+    shutdown_pool()
+    if LOOP_MONITOR is not None:
+        await LOOP_MONITOR.stop()
+    for h in root.handlers:
+        if isinstance(h, TelegramErrorHandler):
+            await h.stop()
+
 def yn_to_bool(text: str) -> bool:
     return text.strip().lower() in ("да", "yes", "y", "д", "угу")
 
@@ -142,10 +262,12 @@ async def handle_web_app_data(update: Update, context: ContextTypes.DEFAULT_TYPE
         return
     
     raw = update.message.web_app_data.data
-    logger.debug("RAW DATA: %s", raw)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("RAW DATA: %s", raw[:2000])
 
     try:
-        data = json.loads(raw)
+        with metrics.timer("decode"):
+            data = json.loads(raw)
     except json.JSONDecodeError as exc:
         logger.error("Неверный JSON: %s", exc)
         await update.effective_chat.send_message("⚠️ Не удалось прочитать данные формы.")
@@ -168,49 +290,365 @@ async def handle_web_app_data(update: Update, context: ContextTypes.DEFAULT_TYPE
         else:
             logger.warning("Игнорирую некорректное mail3=%r", mail3)
 
+    urgent = str(data.get("urgent", "")).strip().lower() in ("1", "true", "on", "yes", "да")
+    payload = {"data": data, "cc": cc_list, "report": True, "urgent": urgent, "cid": logs.correlation_id.get()}
+    job_id = await submit_once(update, "web", payload)
+    if job_id is None:
+        return
+    await update.effective_chat.send_message(f"📨 Заявка №{job_id} принята, отправляю…")
+    logger.info("Заявка %s поставлена в очередь. CC=%s", job_id, cc_list)
+
+# ────────────────────────── ПАКЕТНАЯ ЗАЯВКА ──────────────────────────
+BULK_HELP = (
+    "Файл .csv или .json (массив объектов), одна строка — одна машина.\n"
+    "Поля: date, time_range, company, car_model, car_plate, cargo, cargo_count, person, mail3, "
+    "use_lift, materials_in, materials_out, unloading_big, loading_big, unloading_small, loading_small."
+)
+
+async def handle_bulk_upload(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    if user_id not in ALLOWED_USER_IDS:
+        logger.warning("[ACCESS DENIED] %s", user_id)
+        return
+
+    doc = update.message.document
+    if doc.file_size and doc.file_size > BULK_MAX_BYTES:
+        await update.message.reply_text(f"⚠️ Файл больше {BULK_MAX_BYTES // 1024} КБ.")
+        return
+
+    # На диск, а не в память: разбор потоковый, в памяти только проверенные строки.
+    fd, path = tempfile.mkstemp(suffix=os.path.splitext(doc.file_name or "")[1])
+    os.close(fd)
     try:
-        os.makedirs("output", exist_ok=True)
+        tg_file = await doc.get_file()
+        await tg_file.download_to_drive(path)
+        with metrics.timer("bulk_parse"):
+            rows, errors = await asyncio.to_thread(load_rows, path, doc.file_name or path, BULK_MAX_ROWS)
+    except BulkError as e:
+        await update.message.reply_text(f"⚠️ {e}\n\n{BULK_HELP}")
+        return
+    finally:
+        os.unlink(path)
+
+    if errors:
+        await update.message.reply_text("⚠️ Файл не принят, исправьте ошибки:\n" + "\n".join(errors))
+        return
 
-        async with PDF_LOCK:
-            fill_pdf("template.pdf", PDF_TMP_PATH, data)
-            os.replace(PDF_TMP_PATH, PDF_PATH)
+    cc_list = sorted({f"{r['mail3']}@{EMAIL_DOMAIN}" for r in rows if r["mail3"]})
+    payload = {"rows": rows, "cc": cc_list, "report": True, "cid": logs.correlation_id.get()}
+    job_id = await submit_once(update, "bulk", payload)
+    if job_id is None:
+        return
+    await update.message.reply_text(f"📨 Пакет №{job_id} из {len(rows)} заявок принят, отправляю…")
+    logger.info("Пакет %s (%d заявок) поставлен в очередь. CC=%s", job_id, len(rows), cc_list)
+
+async def render_bulk(rows: list, slot=lambda i: nullcontext()) -> bytes:
+    """
+    Строки рендерятся параллельно в пуле процессов и склеиваются в один PDF.
+    Каждая строка рендерится в своём слоте slot(i) (слот RENDER_LIMIT), так
+    что пакет занимает пул наравне с одиночными заявками, а не целиком.
+    Всем строкам передаётся общий набор символов: подмножество шрифта у них
+    одинаковое, и в склеенном PDF шрифт один.
+    """
+    from fill_pdf import CHARSET_KEY, charset_for, merge_pdfs
+    charset = await asyncio.to_thread(charset_for, TEMPLATE_PATH, rows)
+
+    async def render_row(i: int, row: dict) -> bytes:
+        async with slot(i):
+            return await render_pdf(TEMPLATE_PATH, {**row, CHARSET_KEY: charset}, PDF_ENGINE)
+
+    documents = await asyncio.gather(*(render_row(i, row) for i, row in enumerate(rows)))
+    return await asyncio.to_thread(merge_pdfs, list(documents))
+
+def bulk_caption(rows: list) -> str:
+    head = f"📝 *Пакет заявок* ({len(rows)} шт.)\n• Компания: {rows[0].get('company')}\n"
+    lines = [f"• {r.get('date')} {r.get('time_range')} — {r.get('car_model')} / {r.get('car_plate')}" for r in rows]
+    text = head + "\n".join(lines)
+    return text if len(text) <= 1000 else text[:1000].rsplit("\n", 1)[0] + "\n…"
+
+# ────────────────────────── OUTBOX ──────────────────────────
+async def submit_once(update: Update, kind: str, payload: dict, **reply_kwargs) -> int | None:
+    """
+    Ставит заявку в outbox, если такая же не отправлялась за DEDUP_TTL и у
+    пользователя не исчерпан лимит. На повтор и превышение лимита отвечает
+    сам и возвращает None.
+    """
+    user_id = update.effective_user.id
+    chat_id = update.effective_chat.id
+    entry = key = None
+    if SUBMISSIONS.enabled:
+        key = submission_key(user_id, payload["data"] if "data" in payload else {"rows": payload.get("rows", [])},
+                             payload["cc"])
+        entry, fresh = SUBMISSIONS.reserve(key)
+        if not fresh:
+            logger.info("Повтор заявки №%s от %s, не отправляю", entry.job_id, user_id)
+            await reply_duplicate(update, entry, **reply_kwargs)
+            return None
+        payload["dedup"] = key
+
+    wait = RATE_LIMITS.take(user_id)
+    if wait:
+        SUBMISSIONS.discard(key)
+        logger.info("Лимит заявок: %s, повтор через %.0f с", user_id, wait)
+        await update.effective_chat.send_message(
+            f"⏳ Слишком много заявок подряд. Повторите через {math.ceil(wait)} с.", **reply_kwargs)
+        return None
 
-        subject = 'Заявка на пропуск от ООО "АК Микротех"'
-        body    = "Здравствуйте!\nК данному письму прилагается заявка на пропуск для транспортного средства."
+    try:
+        with metrics.timer("enqueue"):
+            job_id = await OUTBOX.submit(kind, payload, user_id, chat_id)
+    except BaseException:
+        SUBMISSIONS.discard(key)
+        raise
+    if entry is not None:
+        entry.job_id = job_id
+    return job_id
+
+async def reply_duplicate(update: Update, entry: Submission, **reply_kwargs):
+    number = f" №{entry.job_id}" if entry.job_id is not None else ""
+    if entry.pdf is not None:
+        await update.effective_chat.send_document(
+            document=entry.pdf,
+            filename=entry.pdf_name,
+            caption=f"♻️ Эта заявка{number} уже отправлена, повторно не отправляю.",
+            **reply_kwargs,
+        )
+    else:
+        await update.effective_chat.send_message(
+            f"♻️ Эта заявка{number} уже принята и отправляется, повторно не отправляю.", **reply_kwargs)
+
+def report_caption(data: dict) -> str:
+    return (
+        "📝 *Новая заявка*\n"
+        f"• Дата: {data.get('date')}\n"
+        f"• Время: {data.get('time_range')}\n"
+        f"• Компания: {data.get('company')}\n"
+        f"• Транспорт: {data.get('car_model')} / {data.get('car_plate')}\n"
+        f"• Груз: {data.get('cargo')} × {data.get('cargo_count')}\n"
+        f"• Сотрудник: {data.get('person')}\n"
+    )
 
-        await asyncio.to_thread(send_email, subject, body, PDF_PATH, cc=cc_list)
+class QueueNotice:
+    """
+    «Заявка №N в очереди: K-я». Сообщение появляется, только если ожидание
+    длится дольше секунды, обновляется не чаще раза в QUEUE_NOTICE_INTERVAL
+    и удаляется, когда очередь дошла.
+    """
 
-        await update.effective_chat.send_message("✅ Заявка успешно отправлена!")
-        logger.info("Заявка сохранена в %s и отправлена. CC=%s", PDF_PATH, cc_list)
+    FIRST_DELAY = 1.0
 
-    except Exception as exc:
-        logger.exception("Ошибка обработки заявки: %s", exc)
-        await update.effective_chat.send_message("❌ Не удалось отправить заявку.")
+    def __init__(self, bot, chat_id: int, job_id: int, what: str):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.job_id = job_id
+        self.what = what
+        self.position: int | None = None
+        self.message = None
+        self._task: asyncio.Task | None = None
+
+    def update(self, position: int) -> None:
+        self.position = position
+        if self._task is None:
+            self._task = asyncio.create_task(self._sync())
+
+    async def _sync(self) -> None:
+        await asyncio.sleep(self.FIRST_DELAY)
+        shown = None
+        while self.position != shown:
+            shown = self.position
+            text = f"⏳ Заявка №{self.job_id} в очереди на {self.what}: {shown}-я"
+            try:
+                if self.message is None:
+                    self.message = await self.bot.send_message(chat_id=self.chat_id, text=text)
+                else:
+                    await self.bot.edit_message_text(text=text, chat_id=self.chat_id,
+                                                     message_id=self.message.message_id)
+            except Exception as e:
+                logger.debug("Не удалось показать позицию в очереди: %s", e)
+            await asyncio.sleep(QUEUE_NOTICE_INTERVAL)
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.message is not None:
+            try:
+                await self.bot.delete_message(chat_id=self.chat_id, message_id=self.message.message_id)
+            except Exception:
+                pass
+            self.message = None
 
+@asynccontextmanager
+async def admitted(limiter: FairLimiter, job: Job, bot):
+    """Слот limiter'а для задачи; пока ждёт — пользователь видит свою позицию."""
+    notice = QueueNotice(bot, job.chat_id, job.id, limiter.name) if job.chat_id is not None else None
     try:
-        text = (
-            "📝 *Новая заявка*\n"
-            f"• Дата: {data.get('date')}\n"
-            f"• Время: {data.get('time_range')}\n"
-            f"• Компания: {data.get('company')}\n"
-            f"• Транспорт: {data.get('car_model')} / {data.get('car_plate')}\n"
-            f"• Груз: {data.get('cargo')} × {data.get('cargo_count')}\n"
-            f"• Сотрудник: {data.get('person')}\n"
+        async with limiter.slot(job.user_id, notice.update if notice else None):
+            if notice is not None:
+                await notice.close()
+            yield
+    finally:
+        if notice is not None:
+            await notice.close()
+
+def delivery_summary(job: Job) -> str:
+    """Строки «канал — результат» для ответа пользователю."""
+    lines = []
+    for sink in SINKS:
+        if sink.label is None or (sink.applies is not None and not sink.applies(job)):
+            continue
+        if sink.name in job.done_stages:
+            lines.append(f"{sink.label} — доставлено")
+        elif f"{sink.name}!" in job.done_stages:
+            lines.append(f"{sink.label} — не доставлено")
+        else:
+            lines.append(f"{sink.label} — не отправлено")
+    return "\n".join(lines)
+
+def build_outbox(app: Application) -> OutboxWorker:
+    """
+    Этапы обработки заявки: рендер → доставка → ответ пользователю.
+    Доставка — параллельные sink'и (письмо, отчёт в чат, архив), каждый со
+    своими таймаутом и повторами; успех каждого фиксируется в outbox отдельно.
+    """
+    global SINKS
+    bot = app.bot
+    outbox = Outbox(OUTBOX_PATH)
+
+    async def render(job: Job):
+        rows = job.payload.get("rows")
+        job.pdf_name = job.pdf_name or new_output_name("bulk" if rows else "form")
+        if rows:
+            # Слот на строку, а не на пакет: иначе 200 строк под одним слотом
+            # заняли бы все процессы пула. Позицию в очереди показывает первая.
+            job.pdf = await render_bulk(rows, lambda i: admitted(RENDER_LIMIT, job, bot) if i == 0
+                                        else RENDER_LIMIT.slot(job.user_id))
+        else:
+            async with admitted(RENDER_LIMIT, job, bot):
+                job.pdf = await render_pdf(TEMPLATE_PATH, job.payload["data"], PDF_ENGINE)
+        SUBMISSIONS.attach_pdf(job.payload.get("dedup"), job.pdf, job.pdf_name)
+
+    async def optimize(job: Job):
+        # Не бросает: при любой неудаче gs остаётся несжатый PDF.
+        job.pdf = await OPTIMIZER.optimize(job.pdf, job.pdf_name)
+        SUBMISSIONS.attach_pdf(job.payload.get("dedup"), job.pdf, job.pdf_name)
+
+    # ── sink'и ──
+    async def email(job: Job):
+        rows = job.payload.get("rows")
+        if rows:
+            await email_bulk(job, rows)
+            return
+        await MAILER.submit(job.pdf, job.pdf_name, job.payload["cc"], urgent=job.payload.get("urgent", False))
+        logger.info("Заявка %s (%s) отправлена. CC=%s", job.id, job.pdf_name, job.payload["cc"])
+
+    def email_gate(job: Job):
+        # В пакетном режиме слот не берём: заявка ждёт окна, а письмо на пакет одно.
+        if MAILER.enabled and not job.payload.get("rows") and not job.payload.get("urgent"):
+            return nullcontext()
+        return admitted(MAIL_LIMIT, job, bot)
+
+    async def email_bulk(job: Job, rows: list):
+        n = len(rows)
+        if BULK_MODE == "separate":
+            from fill_pdf import split_pdf
+            parts = await asyncio.to_thread(split_pdf, job.pdf, n)
+            stem = job.pdf_name.removesuffix(".pdf")
+            attachments = [(f"{stem}_{i:03d}.pdf", part) for i, part in enumerate(parts, start=1)]
+        else:
+            attachments = [(job.pdf_name, job.pdf)]
+        body = ("Здравствуйте!\nК данному письму прилагаются заявки на пропуск "
+                f"для транспортных средств ({n} шт.).")
+        await send_email_async(f"{MAIL_SUBJECT} ({n} шт.)", body, attachments, cc=job.payload["cc"])
+        logger.info("Пакет %s (%d заявок, %s) отправлен. CC=%s", job.id, n, job.pdf_name, job.payload["cc"])
+
+    async def report(job: Job):
+        await bot.send_document(
+            chat_id=REPORT_CHAT_ID,
+            message_thread_id=REPORT_TOPIC_ID,
+            document=job.pdf,
+            filename=job.pdf_name,
+            caption=bulk_caption(job.payload["rows"]) if "rows" in job.payload else report_caption(job.payload["data"]),
+            parse_mode="Markdown",
         )
-        with open(PDF_PATH, "rb") as f:
-            await context.bot.send_document(
-                chat_id=REPORT_CHAT_ID,
-                message_thread_id=REPORT_TOPIC_ID,
-                document=f,
-                filename=os.path.basename(PDF_PATH),
-                caption=text,
-                parse_mode="Markdown",
-            )
-    except Exception as exc:
-        logger.error("Не удалось отправить отчёт в чат: %s", exc)
+
+    async def archive(job: Job):
+        records = job.payload.get("rows") or [job.payload["data"]]
+        await asyncio.to_thread(ARCHIVE.put, job.id, job.pdf, job.pdf_name, records,
+                                job.user_id, job.payload.get("cc", ()))
+
+    SINKS = [
+        Sink("email", email, label="✉️ Письмо охране", required=True, gate=email_gate,
+             timeout=SINK_EMAIL_TIMEOUT + (MAIL_BATCH_WINDOW if MAILER.enabled else 0),
+             attempts=SINK_ATTEMPTS),
+        Sink("report", report, label="💬 Отчёт в чат", applies=lambda job: bool(job.payload.get("report")),
+             timeout=SINK_REPORT_TIMEOUT, attempts=SINK_ATTEMPTS),
+        Sink("archive", archive, applies=lambda job: ARCHIVE is not None, timeout=SINK_ARCHIVE_TIMEOUT, attempts=2),
+    ]
+
+    async def deliver(job: Job):
+        # Отработавшие (или окончательно не доставленные «name!») sink'и не повторяются.
+        skip = {name.rstrip("!") for name in job.done_stages}
+        results = await fan_out(SINKS, job, skip)
+        failed_required = {}
+        for sink in SINKS:
+            result = results.get(sink.name)
+            if result is None:
+                continue
+            if result.ok:
+                await asyncio.to_thread(outbox.complete_stage, job, sink.name)
+            elif sink.required:
+                failed_required[sink.name] = result
+            else:
+                await asyncio.to_thread(outbox.complete_stage, job, f"{sink.name}!")
+        if failed_required:
+            raise DeliveryError(failed_required)
+
+    async def notify(job: Job):
+        if job.chat_id is not None:
+            await bot.send_message(chat_id=job.chat_id,
+                                   text=f"✅ Заявка №{job.id} отправлена!\n{delivery_summary(job)}")
+
+    async def give_up(job: Job, exc: BaseException):
+        SUBMISSIONS.discard(job.payload.get("dedup"))
+        if job.chat_id is not None:
+            await bot.send_message(chat_id=job.chat_id,
+                                   text=f"❌ Не удалось отправить заявку №{job.id}.\n{delivery_summary(job)}")
+
+    # В пакетном режиме письмо ждёт закрытия окна, поэтому воркеров
+    # должно хватать на целый пакет, иначе он никогда не наберётся.
+    workers = max(OUTBOX_WORKERS, MAIL_BATCH_MAX) if MAILER.enabled else OUTBOX_WORKERS
+
+    def timed(name, stage):
+        async def run(job: Job):
+            with metrics.timer(name):
+                await stage(job)
+        return name, run
+
+    stages = [timed("render", render)]
+    if OPTIMIZER is not None and OPTIMIZER.enabled:
+        stages.append(("optimize", optimize))
+    elif OPTIMIZER is not None:
+        logger.warning("PDF_OPTIMIZE=1, но Ghostscript (gs) не найден — PDF отправляются без сжатия")
+    stages += [("deliver", deliver), timed("notify", notify)]
+
+    return OutboxWorker(
+        outbox,
+        stages,
+        workers=workers,
+        max_attempts=OUTBOX_MAX_ATTEMPTS,
+        on_give_up=give_up,
+    )
 
 async def dump(update: Update, _: ContextTypes.DEFAULT_TYPE):
-    logger.debug("UPDATE: %s", update)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("UPDATE: %s", update)
+
+async def tag_update(update: object, _: ContextTypes.DEFAULT_TYPE):
+    """Группа -1: correlation id на всё время обработки апдейта."""
+    update_id = getattr(update, "update_id", None)
+    logs.set_correlation_id(f"u{update_id}" if update_id is not None else logs.new_correlation_id("u"))
 
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
     logger.exception("Exception while handling update %s", update, exc_info=context.error)
@@ -249,6 +687,64 @@ async def handle_stop(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     context.application.stop_running()
 
+# ────────────────────────── АРХИВ ──────────────────────────
+def archive_line(row) -> str:
+    number = f"№{row['job_id']}" + (f".{row['row'] + 1}" if row["row"] else "")
+    return f"{number} · {row['date']} · {row['car_plate']} · {row['company']} · {row['person']}"
+
+async def cmd_find(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/find <номер машины | компания | сотрудник> — последние заявки из архива."""
+    if update.effective_user.id != ADMIN_ID:
+        return
+    if ARCHIVE is None:
+        await update.message.reply_text("Архив выключен (PDF_ARCHIVE=0).")
+        return
+    query = " ".join(context.args)
+    if not query:
+        await update.message.reply_text("Использование: /find <номер машины, компания или сотрудник>")
+        return
+    rows = await asyncio.to_thread(ARCHIVE.find, query)
+    if not rows:
+        await update.message.reply_text(f"По запросу «{query}» в архиве ничего нет.")
+        return
+    lines = [archive_line(r) for r in rows]
+    await update.message.reply_text("\n".join(lines) + "\n\nПереслать PDF: /resend <номер>, охране — /resend <номер> mail")
+
+async def cmd_resend(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/resend <номер> [mail] — PDF из архива в этот чат или повторным письмом охране."""
+    if update.effective_user.id != ADMIN_ID:
+        return
+    if ARCHIVE is None:
+        await update.message.reply_text("Архив выключен (PDF_ARCHIVE=0).")
+        return
+    args = context.args
+    if not args or not args[0].lstrip("№").isdigit():
+        await update.message.reply_text("Использование: /resend <номер заявки> [mail]")
+        return
+    job_id = int(args[0].lstrip("№"))
+    try:
+        found = await asyncio.to_thread(ARCHIVE.get, job_id)
+    except OSError as e:
+        logger.error("Архив: PDF заявки %s не читается: %s", job_id, e)
+        found = None
+    if found is None:
+        await update.message.reply_text(f"Заявки №{job_id} в архиве нет.")
+        return
+    rows, pdf = found
+    head = rows[0]
+    if len(args) > 1 and args[1].lower() in ("mail", "почта"):
+        await MAILER.submit(pdf, head["filename"], json.loads(head["cc"]), urgent=True)
+        logger.info("Заявка %s повторно отправлена охране по команде админа", job_id)
+        await update.message.reply_text(f"✉️ Заявка №{job_id} повторно отправлена охране.")
+        return
+    await update.message.reply_document(document=pdf, filename=head["filename"],
+                                        caption="\n".join(archive_line(r) for r in rows)[:1000])
+
+async def prune_archive(_: ContextTypes.DEFAULT_TYPE):
+    passes, files = await asyncio.to_thread(ARCHIVE.prune)
+    if passes or files:
+        logger.info("Архив: удалено записей %d, файлов %d (старше %.0f дн.)", passes, files, ARCHIVE_RETENTION_DAYS)
+
 (
     DATE, TIME, COMPANY, CAR_MODEL, CAR_PLATE, CARGO, CARGO_COUNT, PERSON, MAIL3,
     USE_LIFT, MATERIALS_IN, MATERIALS_OUT, UNLOADING_BIG, LOADING_BIG, UNLOADING_SMALL, LOADING_SMALL
@@ -372,16 +868,10 @@ async def process_form(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if m3:
         cc_list.append(f"{m3}@{EMAIL_DOMAIN}")
 
-    os.makedirs("output", exist_ok=True)
-    output_path = "output/form_latest.pdf"
-
-    fill_pdf("template.pdf", output_path, data)
-
-    subject = 'Заявка на пропуск от ООО "АК Микротех"'
-    body = "Здравствуйте!\nК данному письму прилагается заявка на пропуск для транспортного средства."
-    await asyncio.to_thread(send_email, subject, body, output_path, cc=cc_list)
-
-    await update.message.reply_text("✅ Заявка успешно отправлена!", reply_markup=ReplyKeyboardRemove())
+    payload = {"data": data, "cc": cc_list, "report": False, "cid": logs.correlation_id.get()}
+    job_id = await submit_once(update, "manual", payload, reply_markup=ReplyKeyboardRemove())
+    if job_id is not None:
+        await update.message.reply_text(f"📨 Заявка №{job_id} принята, отправляю…", reply_markup=ReplyKeyboardRemove())
     context.user_data.clear()
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -406,14 +896,50 @@ async def heartbeat(context: ContextTypes.DEFAULT_TYPE):
         f"Uptime: `{str(uptime).split('.')[0]}`\n"
         f"Ping: `{ping_ms} ms`"
     )
+    for limiter in (RENDER_LIMIT, MAIL_LIMIT):
+        st = limiter.stats()
+        if st["waiting"]:
+            msg += f"\nОчередь на {limiter.name}: `{st['active']}/{st['capacity']}` + `{st['waiting']}` ждут"
+    if LOOP_MONITOR is not None:
+        msg += "\n" + LOOP_MONITOR.format_summary(HEARTBEAT_INTERVAL)
+    if OPTIMIZER is not None and OPTIMIZER.documents:
+        st = OPTIMIZER.stats()
+        saved = st["bytes_in"] - st["bytes_out"]
+        msg += (f"\nСжатие PDF: `{st['documents']}` док., −`{saved // 1024} KB` "
+                f"(`{100.0 * saved / max(1, st['bytes_in']):.0f}%`), без сжатия `{st['fallbacks']}`")
+    if logs.dropped():
+        msg += f"\nЛоги: пропущено записей `{logs.dropped()}`"
+    stages = metrics.format_summary(HEARTBEAT_INTERVAL)
+    if stages:
+        msg += f"\n\n*Этапы за {HEARTBEAT_INTERVAL // 60} мин:*\n{stages}"
     await bot.send_message(chat_id=STATUS_CHAT_ID, message_thread_id=STATUS_TOPIC_ID, text=msg, parse_mode='Markdown')
 
 # ────────────────────────── main ───────────────────────────
-def main():
-    app = Application.builder().token(BOT_TOKEN).post_init(on_startup).build()
-
-    tg_handler = TelegramErrorHandler(app, STATUS_CHAT_ID, STATUS_TOPIC_ID)
+def build_app(builder: ApplicationBuilder | None = None) -> Application:
+    """
+    Application со всеми обработчиками и задачами. bench.load передаёт свой
+    builder (поддельный Bot API, без updater'а) — обработчики те же, что в бою.
+    """
+    updates_request = None
+    if builder is None:
+        builder = Application.builder().token(BOT_TOKEN)
+        if BOT_MODE == "webhook":
+            from webhook import BoundedUpdateProcessor
+            builder = builder.updater(None).concurrent_updates(BoundedUpdateProcessor(WEBHOOK_MAX_INFLIGHT))
+        else:
+            updates_request = StartupTimingRequest(connection_pool_size=1)
+            builder = builder.get_updates_request(updates_request)
+    builder = builder.post_init(on_startup).post_shutdown(on_shutdown)
+    if PERSISTENCE_PATH:
+        builder = builder.persistence(SqlitePersistence(PERSISTENCE_PATH, update_interval=PERSISTENCE_INTERVAL))
+    app = builder.build()
+    if updates_request is not None:
+        updates_request.bot = app.bot
+
+    tg_handler = TelegramErrorHandler(app, STATUS_CHAT_ID, STATUS_TOPIC_ID,
+                                      window=TG_LOG_WINDOW, max_queue=TG_LOG_QUEUE)
     tg_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    tg_handler.addFilter(logs.CorrelationFilter())
     root.addHandler(tg_handler)
 
     conv = ConversationHandler(
@@ -440,17 +966,37 @@ def main():
             LOADING_SMALL: [MessageHandler(filters.TEXT & ~filters.COMMAND, get_loading_small)],
         },
         fallbacks=[CommandHandler("cancel", cancel)],
+        name="manual_form",
+        persistent=bool(PERSISTENCE_PATH),
     )
+    app.add_handler(TypeHandler(Update, tag_update), group=-1)
     app.add_handler(conv, group=0)
 
     app.add_handler(CommandHandler("start", cmd_start), group=1)
+    app.add_handler(CommandHandler("find", cmd_find), group=1)
+    app.add_handler(CommandHandler("resend", cmd_resend), group=1)
     app.add_handler(MessageHandler(filters.TEXT & filters.Regex(f"^{START_BTN}$"), handle_start_button), group=1)
     app.add_handler(MessageHandler(filters.TEXT & filters.Regex(f"^{STOP_BTN}$"), handle_stop), group=1)
     app.add_handler(MessageHandler(filters.StatusUpdate.WEB_APP_DATA, handle_web_app_data), group=1)
+    app.add_handler(MessageHandler(filters.Document.FileExtension("csv") | filters.Document.FileExtension("json"),
+                                   handle_bulk_upload), group=1)
     app.add_error_handler(error_handler)
 
-    app.job_queue.run_repeating(heartbeat, interval=1200, first=0, data={"start": START_TIME})
-    app.run_polling()
+    app.job_queue.run_repeating(heartbeat, interval=HEARTBEAT_INTERVAL, first=0, data={"start": START_TIME})
+    if PDF_ARCHIVE and ARCHIVE_RETENTION_DAYS > 0:
+        app.job_queue.run_repeating(prune_archive, interval=86400, first=300)
+    return app
+
+def main():
+    app = build_app()
+    if BOT_MODE == "webhook":
+        from webhook import run_webhook
+        run_webhook(
+            app, listen=WEBHOOK_LISTEN, port=WEBHOOK_PORT, path=WEBHOOK_PATH,
+            url=WEBHOOK_URL, secret=WEBHOOK_SECRET,
+        )
+    else:
+        app.run_polling()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,183 @@
+"""Пакетная заявка: много машин из одного CSV / JSON файла.
+
+Файл читается потоково — CSV построчно, JSON-массив по одному объекту
+(json.JSONDecoder.raw_decode по буферу), так что память не растёт с
+размером файла. Каждая строка приводится к полям шаблона (те же имена, что
+у Web App: date, time_range, company, …, mail3) и проверяется; ошибки
+собираются по всем строкам, чтобы пользователь исправил файл за один раз.
+"""
+from __future__ import annotations
+
+import codecs
+import csv
+import io
+import json
+import os
+import re
+from datetime import datetime
+from typing import Dict, Iterator, List, Tuple
+
+TEXT_FIELDS = ("date", "time_range", "company", "car_model", "car_plate", "cargo", "cargo_count", "person")
+CHECK_FIELDS = ("use_lift", "materials_in", "materials_out",
+                "unloading_big", "loading_big", "unloading_small", "loading_small")
+EXTRA_FIELDS = ("mail3",)
+REQUIRED = ("date", "time_range", "company", "car_model", "car_plate")
+KNOWN = frozenset(TEXT_FIELDS + CHECK_FIELDS + EXTRA_FIELDS)
+
+MAX_ERRORS = 20
+CHUNK = 64 * 1024
+
+
+class BulkError(ValueError):
+    """Файл нельзя разобрать целиком (формат, кодировка, лимит строк)."""
+
+
+class _ExcelSemicolon(csv.excel):
+    delimiter = ";"
+
+# Если Sniffer не справился (строки разной длины — обычное дело в выгрузках
+# Excel), разделитель — самый частый из этих символов в строке заголовка.
+_FALLBACK_DIALECTS = {",": csv.excel, ";": _ExcelSemicolon, "\t": csv.excel_tab}
+
+
+# ────────────────────────── ЧТЕНИЕ ──────────────────────────
+def _open_text(path: str) -> io.TextIOBase:
+    """UTF-8 (с BOM или без), иначе cp1251 — так сохраняет CSV русский Excel."""
+    with open(path, "rb") as f:
+        head = f.read(CHUNK)
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+        encoding = "utf-8-sig"
+    except UnicodeDecodeError:
+        encoding = "cp1251"
+    return open(path, encoding=encoding, newline="")
+
+def _sniff(sample: str):
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        header = sample.split("\n", 1)[0]
+        return _FALLBACK_DIALECTS[max(_FALLBACK_DIALECTS, key=header.count)]
+
+def _iter_csv(f: io.TextIOBase) -> Iterator[Tuple[int, Dict]]:
+    sample = f.read(4096)
+    f.seek(0)
+    reader = csv.DictReader(f, dialect=_sniff(sample))
+    for n, row in enumerate(reader, start=1):
+        if not any((v or "").strip() for v in row.values() if isinstance(v, str)):
+            continue
+        yield n, row
+
+def _iter_json_array(f: io.TextIOBase) -> Iterator[Tuple[int, Dict]]:
+    decoder = json.JSONDecoder()
+    buf, i, eof = "", 0, False
+    state = "start"                      # start → value|end → sep → value …
+    n = 0
+    while True:
+        if i > CHUNK:
+            buf, i = buf[i:], 0
+        while i < len(buf) and buf[i] in " \t\r\n":
+            i += 1
+        if i >= len(buf):
+            if eof:
+                raise BulkError("JSON: файл оборвался, массив не закрыт")
+            chunk = f.read(CHUNK)
+            eof = not chunk
+            buf += chunk
+            continue
+
+        ch = buf[i]
+        if state == "start":
+            if ch != "[":
+                raise BulkError("JSON: ожидается массив объектов [ {...}, {...} ]")
+            i += 1
+            state = "first"
+            continue
+        if state in ("first", "sep") and ch == "]":
+            return
+        if state == "sep":
+            if ch != ",":
+                raise BulkError(f"JSON: после элемента {n} ожидается ',' или ']'")
+            i += 1
+            state = "value"
+            continue
+
+        try:
+            obj, end = decoder.raw_decode(buf, i)
+        except json.JSONDecodeError:
+            obj, end = None, None
+        if end is None or (end == len(buf) and not eof):
+            # Элемент не поместился в буфер — дочитываем.
+            if eof:
+                raise BulkError(f"JSON: ошибка в элементе {n + 1}")
+            chunk = f.read(CHUNK)
+            eof = not chunk
+            buf += chunk
+            continue
+        i = end
+        n += 1
+        state = "sep"
+        yield n, obj
+
+def iter_records(path: str, filename: str) -> Iterator[Tuple[int, Dict]]:
+    ext = os.path.splitext(filename or path)[1].lower()
+    if ext not in (".csv", ".json"):
+        raise BulkError("Поддерживаются только файлы .csv и .json")
+    with _open_text(path) as f:
+        try:
+            yield from (_iter_json_array(f) if ext == ".json" else _iter_csv(f))
+        except UnicodeDecodeError:
+            # Кодировка угадывается по первым CHUNK байтам; дальше может встретиться другая.
+            raise BulkError(f"Файл не читается как {f.encoding}: сохраните его в UTF-8") from None
+
+
+# ────────────────────────── ПРОВЕРКА ──────────────────────────
+def normalize_row(raw) -> Dict:
+    """Строка файла → данные для fill_pdf; ValueError с понятным текстом, если строка негодна."""
+    if not isinstance(raw, dict):
+        raise ValueError("ожидается объект с полями заявки")
+    row = {}
+    for key, value in raw.items():
+        key = str(key or "").strip().lower()
+        if key in KNOWN and value is not None:
+            row[key] = value.strip() if isinstance(value, str) else value
+
+    missing = [f for f in REQUIRED if not str(row.get(f, "")).strip()]
+    if missing:
+        raise ValueError("не заполнено: " + ", ".join(missing))
+
+    date = str(row["date"])
+    for fmt in ("%d.%m.%Y", "%Y-%m-%d"):
+        try:
+            row["date"] = datetime.strptime(date, fmt).strftime("%d.%m.%Y")
+            break
+        except ValueError:
+            pass
+    else:
+        raise ValueError(f"дата {date!r} не в формате ДД.ММ.ГГГГ")
+
+    mail3 = str(row.get("mail3", "")).strip().lower()
+    if mail3 and not re.fullmatch(r"[a-z]{3}", mail3):
+        raise ValueError(f"mail3 {mail3!r} — нужны три латинские буквы")
+    row["mail3"] = mail3
+    return row
+
+def load_rows(path: str, filename: str, max_rows: int) -> Tuple[List[Dict], List[str]]:
+    """Все строки файла и список ошибок вида «строка 3: …» (не больше MAX_ERRORS)."""
+    rows: List[Dict] = []
+    errors: List[str] = []
+    bad = 0
+    for n, raw in iter_records(path, filename):
+        if len(rows) + bad >= max_rows:
+            raise BulkError(f"В файле больше {max_rows} заявок")
+        try:
+            rows.append(normalize_row(raw))
+        except ValueError as e:
+            bad += 1
+            if len(errors) < MAX_ERRORS:
+                errors.append(f"строка {n}: {e}")
+    if bad > len(errors):
+        errors.append(f"… и ещё {bad - len(errors)}")
+    if not rows and not errors:
+        raise BulkError("В файле нет ни одной заявки")
+    return rows, errors
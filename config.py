@@ -4,9 +4,12 @@ from dotenv import load_dotenv
 load_dotenv()
 
 SMTP_HOST = os.getenv("SMTP_HOST")
-SMTP_PORT = int(os.getenv("SMTP_PORT"))
+SMTP_SECURITY = os.getenv("SMTP_SECURITY", "ssl")          # ssl | starttls | none
+SMTP_PORT = int(os.getenv("SMTP_PORT") or {"ssl": 465, "starttls": 587}.get(SMTP_SECURITY, 25))
 FROM_EMAIL = os.getenv("FROM_EMAIL")
 EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "2"))
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "30"))
 TO_EMAIL = os.getenv("TO_EMAIL")
 WEBAPP_URL = os.getenv("WEBAPP_URL")
 BOT_TOKEN = os.getenv("BOT_TOKEN")
@@ -15,4 +18,51 @@ REPORT_CHAT_ID = os.getenv("REPORT_CHAT_ID")
 REPORT_TOPIC_ID = os.getenv("REPORT_TOPIC_ID")
 STATUS_CHAT_ID = REPORT_CHAT_ID
 STATUS_TOPIC_ID = os.getenv("STATUS_TOPIC_ID")
-EMAIL_DOMAIN = os.getenv("EMAIL_DOMAIN", "akmicrotech.ru")
\ No newline at end of file
+TG_LOG_WINDOW = float(os.getenv("TG_LOG_WINDOW", "60"))      # окно схлопывания одинаковых ошибок, с
+TG_LOG_QUEUE = int(os.getenv("TG_LOG_QUEUE", "200"))
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_JSON = os.getenv("LOG_JSON", "0") == "1"                # bot.log в формате JSON lines
+LOG_QUEUE = int(os.getenv("LOG_QUEUE", "10000"))
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.25"))      # период сэмплера лага loop'а, с; 0 — выкл.
+LOOP_STALL_THRESHOLD = float(os.getenv("LOOP_STALL_THRESHOLD", "0.5"))  # лаг, после которого снимается стек, с
+EMAIL_DOMAIN = os.getenv("EMAIL_DOMAIN", "akmicrotech.ru")
+TEMPLATE_PATH = os.getenv("TEMPLATE_PATH", "template.pdf")
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "2"))
+PDF_ARCHIVE = os.getenv("PDF_ARCHIVE", "1") == "1"
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "output/archive")
+ARCHIVE_RETENTION_DAYS = float(os.getenv("ARCHIVE_RETENTION_DAYS", "365"))   # 0 — хранить всё
+PDF_ENGINE = os.getenv("PDF_ENGINE", "pdfrw")                      # pdfrw | pymupdf | incremental
+PDF_OPTIMIZE = os.getenv("PDF_OPTIMIZE", "0") == "1"                 # сжатие Ghostscript'ом, если gs установлен; наложения и так сжаты
+PDF_OPTIMIZE_SLOTS = int(os.getenv("PDF_OPTIMIZE_SLOTS", "2"))
+PDF_OPTIMIZE_TIMEOUT = float(os.getenv("PDF_OPTIMIZE_TIMEOUT", "20"))
+OUTBOX_PATH = os.getenv("OUTBOX_PATH", "output/outbox.sqlite3")
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "16"))      # заявок в работе; ресурсы ограничивают *_SLOTS
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+RATE_LIMIT_PER_MIN = float(os.getenv("RATE_LIMIT_PER_MIN", "6"))          # заявок в минуту на пользователя; 0 — без лимита
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "3"))
+RENDER_SLOTS = int(os.getenv("RENDER_SLOTS") or max(1, PDF_WORKERS))       # одновременных рендеров
+MAIL_SLOTS = int(os.getenv("MAIL_SLOTS") or SMTP_POOL_SIZE)                 # одновременных отправок
+QUEUE_NOTICE_INTERVAL = float(os.getenv("QUEUE_NOTICE_INTERVAL", "5"))
+SINK_ATTEMPTS = int(os.getenv("SINK_ATTEMPTS", "3"))                        # попыток на канал доставки за прогон задачи
+SINK_EMAIL_TIMEOUT = float(os.getenv("SINK_EMAIL_TIMEOUT", "60"))
+SINK_REPORT_TIMEOUT = float(os.getenv("SINK_REPORT_TIMEOUT", "30"))
+SINK_ARCHIVE_TIMEOUT = float(os.getenv("SINK_ARCHIVE_TIMEOUT", "10"))
+PERSISTENCE_PATH = os.getenv("PERSISTENCE_PATH", "output/state.sqlite3")   # пусто — диалоги только в памяти
+PERSISTENCE_INTERVAL = float(os.getenv("PERSISTENCE_INTERVAL", "5"))      # секунды между сбросами на диск
+MAIL_BATCH_WINDOW = float(os.getenv("MAIL_BATCH_WINDOW", "0"))        # секунды; 0 — без пакетов
+MAIL_BATCH_MAX = int(os.getenv("MAIL_BATCH_MAX", "10"))
+MAIL_BATCH_MODE = os.getenv("MAIL_BATCH_MODE", "attachments")          # attachments | merged
+DEDUP_TTL = float(os.getenv("DEDUP_TTL", "600"))            # секунды; 0 — без защиты от повторов
+DEDUP_MAX = int(os.getenv("DEDUP_MAX", "256"))
+BULK_MAX_ROWS = int(os.getenv("BULK_MAX_ROWS", "200"))
+BULK_MAX_BYTES = int(os.getenv("BULK_MAX_BYTES", str(5 * 1024 * 1024)))
+BULK_MODE = os.getenv("BULK_MODE", "merged")                  # merged | separate — один PDF или по файлу на машину
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))       # 0 — без /metrics
+BOT_MODE = os.getenv("BOT_MODE", "polling")                      # polling | webhook
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")                            # публичный https-адрес; пусто — без set_webhook
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")                      # обязателен при BOT_MODE=webhook
+WEBHOOK_MAX_INFLIGHT = int(os.getenv("WEBHOOK_MAX_INFLIGHT", "64"))   # принято и не обработано; сверх — 503
@@ -0,0 +1,85 @@
+"""Защита от повторной отправки одной и той же заявки.
+
+Двойное нажатие «Отправить» в Web App или повторная отправка той же формы
+не должны порождать второе письмо охране. Заявка нормализуется (пробелы,
+регистр, порядок полей) и хешируется вместе с user_id и CC; в течение ttl
+секунд повтор с тем же хешем получает ответ «уже отправлена» и, если PDF
+уже готов, сам PDF. Кэш ограничен max_size записями (LRU).
+
+Все методы вызываются из event loop, блокировки не нужны.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Iterable, Mapping, Optional, Tuple
+
+# Поля, которые не меняют суть заявки.
+IGNORED_FIELDS = frozenset({"urgent"})
+
+
+def _normalize(value) -> str:
+    if value is None:
+        return ""
+    return " ".join(str(value).split()).casefold()
+
+def submission_key(user_id: int, data: Mapping, cc: Iterable[str] = ()) -> str:
+    norm = {k: _normalize(v) for k, v in data.items() if k not in IGNORED_FIELDS and _normalize(v)}
+    blob = json.dumps([user_id, sorted(norm.items()), sorted(_normalize(c) for c in cc)], ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class Submission:
+    __slots__ = ("job_id", "ts", "pdf", "pdf_name")
+
+    def __init__(self, ts: float):
+        self.job_id: Optional[int] = None          # None — заявка ещё ставится в очередь
+        self.ts = ts
+        self.pdf: Optional[bytes] = None
+        self.pdf_name: Optional[str] = None
+
+
+class SubmissionCache:
+    def __init__(self, ttl: float = 600.0, max_size: int = 256):
+        self.ttl = ttl
+        self.max_size = max(1, max_size)
+        self._items: "OrderedDict[str, Submission]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def get(self, key: str) -> Optional[Submission]:
+        entry = self._items.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.ts > self.ttl:
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return entry
+
+    def reserve(self, key: str) -> Tuple[Submission, bool]:
+        """(запись, True) для новой заявки; (существующая запись, False) для повтора."""
+        entry = self.get(key)
+        if entry is not None:
+            return entry, False
+        entry = self._items[key] = Submission(time.monotonic())
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+        return entry, True
+
+    def attach_pdf(self, key: Optional[str], pdf: bytes, pdf_name: str) -> None:
+        entry = self._items.get(key) if key else None
+        if entry is not None:
+            entry.pdf, entry.pdf_name = pdf, pdf_name
+
+    def discard(self, key: Optional[str]) -> None:
+        """Заявку не удалось отправить — повтор должен пройти заново."""
+        if key:
+            self._items.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._items)
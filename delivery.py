@@ -0,0 +1,101 @@
+"""Параллельная доставка готового PDF по нескольким каналам (sink'ам).
+
+Письмо охране, отчёт в чат и архив не зависят друг от друга: медленный
+SMTP не должен задерживать отчёт. У каждого sink'а свой таймаут, число
+попыток и пауза между ними; RetryAfter от Telegram выдерживается ровно
+столько, сколько просит сервер.
+
+Обязательный sink (письмо), не справившийся за свои попытки, роняет этап
+целиком — outbox повторит задачу позже, уже без успешно отработавших
+sink'ов. Необязательный (отчёт, архив) после неудачи просто отмечается как
+недоставленный.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from contextlib import nullcontext
+from typing import Any, AsyncContextManager, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from telegram.error import RetryAfter
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+RETRY_AFTER_MAX = 120.0
+
+
+class Sink:
+    __slots__ = ("name", "label", "send", "timeout", "attempts", "backoff", "required", "applies", "gate")
+
+    def __init__(self, name: str, send: Callable[[Any], Awaitable[None]], *, label: Optional[str] = None,
+                 timeout: float = 30.0, attempts: int = 3, backoff: float = 2.0, required: bool = False,
+                 applies: Optional[Callable[[Any], bool]] = None,
+                 gate: Optional[Callable[[Any], AsyncContextManager]] = None):
+        self.name = name
+        self.label = label                  # для ответа пользователю; None — не показывать
+        self.send = send
+        self.timeout = timeout
+        self.attempts = max(1, attempts)
+        self.backoff = backoff
+        self.required = required
+        self.applies = applies
+        self.gate = gate                    # например, слот FairLimiter; ожидание не входит в timeout
+
+
+class SinkResult:
+    __slots__ = ("name", "ok", "error", "attempts", "seconds")
+
+    def __init__(self, name: str, ok: bool, error: Optional[BaseException] = None, attempts: int = 0,
+                 seconds: float = 0.0):
+        self.name = name
+        self.ok = ok
+        self.error = error
+        self.attempts = attempts
+        self.seconds = seconds
+
+
+class DeliveryError(Exception):
+    def __init__(self, results: Dict[str, SinkResult]):
+        self.results = results
+        failed = ", ".join(f"{r.name}: {r.error!r}" for r in results.values() if not r.ok)
+        super().__init__(f"не доставлено — {failed}")
+
+
+def _retry_after_seconds(exc: RetryAfter) -> float:
+    ra = exc.retry_after
+    return float(ra.total_seconds() if hasattr(ra, "total_seconds") else ra)
+
+async def run_sink(sink: Sink, job) -> SinkResult:
+    t0 = time.perf_counter()
+    error: Optional[BaseException] = None
+    for attempt in range(1, sink.attempts + 1):
+        try:
+            async with (sink.gate(job) if sink.gate else nullcontext()):
+                with metrics.timer(sink.name):
+                    await asyncio.wait_for(sink.send(job), sink.timeout)
+            return SinkResult(sink.name, True, None, attempt, time.perf_counter() - t0)
+        except asyncio.CancelledError:
+            raise
+        except RetryAfter as e:
+            error = e
+            delay = min(RETRY_AFTER_MAX, _retry_after_seconds(e))
+        except Exception as e:
+            error = e
+            delay = sink.backoff * (2 ** (attempt - 1))
+        if attempt < sink.attempts:
+            logger.warning("Доставка %s для задачи %s: попытка %d не удалась (%r), повтор через %.0f с",
+                           sink.name, getattr(job, "id", "?"), attempt, error, delay)
+            await asyncio.sleep(delay)
+    logger.error("Доставка %s для задачи %s не удалась после %d попыток: %r",
+                 sink.name, getattr(job, "id", "?"), sink.attempts, error)
+    return SinkResult(sink.name, False, error, sink.attempts, time.perf_counter() - t0)
+
+async def fan_out(sinks: Iterable[Sink], job, skip: Iterable[str] = ()) -> Dict[str, SinkResult]:
+    """Запускает применимые sink'и параллельно (кроме skip) и возвращает результат каждого."""
+    skip = set(skip)
+    todo: List[Sink] = [s for s in sinks if s.name not in skip and (s.applies is None or s.applies(job))]
+    results = await asyncio.gather(*(run_sink(s, job) for s in todo))
+    return {r.name: r for r in results}
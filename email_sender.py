@@ -1,8 +1,26 @@
+import asyncio
+import logging
+import os
 import smtplib
 from email.message import EmailMessage
-from config import SMTP_HOST, SMTP_PORT, FROM_EMAIL, EMAIL_PASSWORD, TO_EMAIL
+from time import monotonic
+from typing import List, Optional
 
-def send_email(subject, body, attachment_path, cc=None):
+import aiosmtplib
+
+from config import (
+    SMTP_HOST, SMTP_PORT, FROM_EMAIL, EMAIL_PASSWORD, TO_EMAIL,
+    SMTP_SECURITY, SMTP_POOL_SIZE, SMTP_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+def build_message(subject, body, attachment, cc=None, filename=None) -> EmailMessage:
+    """
+    attachment — путь к файлу или сами данные PDF (bytes / file-like);
+    для данных из памяти имя вложения берётся из filename.
+    Для нескольких вложений — список пар (имя, данные).
+    """
     msg = EmailMessage()
     msg['Subject'] = subject
     msg['From'] = FROM_EMAIL
@@ -15,11 +33,163 @@ def send_email(subject, body, attachment_path, cc=None):
 
     msg.set_content(body)
 
-    with open(attachment_path, 'rb') as f:
-        file_data = f.read()
-        file_name = attachment_path.split('/')[-1]
-        msg.add_attachment(file_data, maintype='application', subtype='pdf', filename=file_name)
+    if isinstance(attachment, list):
+        for file_name, file_data in attachment:
+            msg.add_attachment(bytes(file_data), maintype='application', subtype='pdf', filename=file_name)
+        return msg
 
-    with smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT) as server:
-        server.login(FROM_EMAIL, EMAIL_PASSWORD)
+    if isinstance(attachment, (bytes, bytearray, memoryview)):
+        file_data = bytes(attachment)
+        file_name = filename or "form.pdf"
+    elif hasattr(attachment, 'read'):
+        file_data = attachment.read()
+        file_name = filename or "form.pdf"
+    else:
+        with open(attachment, 'rb') as f:
+            file_data = f.read()
+        file_name = filename or os.path.basename(attachment)
+    msg.add_attachment(file_data, maintype='application', subtype='pdf', filename=file_name)
+    return msg
+
+def send_email(subject, body, attachment, cc=None, filename=None):
+    """Синхронная отправка одним соединением (для скриптов; бот использует send_email_async)."""
+    msg = build_message(subject, body, attachment, cc=cc, filename=filename)
+
+    # Как SmtpPool._connect: ssl — TLS сразу, starttls — апгрейд после EHLO, none — без TLS.
+    smtp_cls = smtplib.SMTP_SSL if SMTP_SECURITY == "ssl" else smtplib.SMTP
+    with smtp_cls(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT) as server:
+        if SMTP_SECURITY == "starttls":
+            server.starttls()
+        if EMAIL_PASSWORD:
+            server.login(FROM_EMAIL, EMAIL_PASSWORD)
         server.send_message(msg)
+
+# ────────────────────────── ПУЛ SMTP ──────────────────────────
+class SmtpPool:
+    """
+    Небольшой пул авторизованных SMTP-соединений.
+
+    - не больше size одновременных отправок (семафор);
+    - соединение, простоявшее дольше noop_after секунд, проверяется NOOP,
+      дольше max_idle — закрывается и открывается заново;
+    - если соединение упало во время отправки, письмо уходит повторно
+      через новое соединение (один раз).
+    """
+
+    def __init__(self, size: int = SMTP_POOL_SIZE, *, host: str = SMTP_HOST, port: int = SMTP_PORT,
+                 username: Optional[str] = FROM_EMAIL, password: Optional[str] = EMAIL_PASSWORD,
+                 security: str = SMTP_SECURITY, timeout: float = SMTP_TIMEOUT,
+                 noop_after: float = 30.0, max_idle: float = 240.0):
+        self.size = max(1, size)
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.security = security
+        self.timeout = timeout
+        self.noop_after = noop_after
+        self.max_idle = max_idle
+
+        self._sem = asyncio.Semaphore(self.size)
+        self._idle: List[tuple] = []          # (SMTP, время возврата в пул)
+        self._closed = False
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        conn = aiosmtplib.SMTP(
+            hostname=self.host,
+            port=self.port,
+            username=self.username if self.password else None,
+            password=self.password or None,
+            use_tls=self.security == "ssl",
+            start_tls=True if self.security == "starttls" else False,
+            timeout=self.timeout,
+        )
+        await conn.connect()
+        return conn
+
+    @staticmethod
+    async def _discard(conn: aiosmtplib.SMTP) -> None:
+        try:
+            await conn.quit()
+        except Exception:
+            conn.close()
+
+    async def _acquire(self) -> aiosmtplib.SMTP:
+        while self._idle:
+            conn, since = self._idle.pop()
+            idle = monotonic() - since
+            if not conn.is_connected or idle > self.max_idle:
+                await self._discard(conn)
+                continue
+            if idle > self.noop_after:
+                try:
+                    await conn.noop()
+                except Exception:
+                    conn.close()
+                    continue
+            return conn
+        return await self._connect()
+
+    def _release(self, conn: aiosmtplib.SMTP) -> None:
+        if self._closed or not conn.is_connected:
+            conn.close()
+            return
+        self._idle.append((conn, monotonic()))
+
+    async def start(self) -> None:
+        """Открывает одно соединение заранее: ошибки конфигурации видны при старте."""
+        async with self._sem:
+            self._release(await self._connect())
+
+    async def send(self, msg: EmailMessage) -> None:
+        if self._closed:
+            raise RuntimeError("SMTP pool is closed")
+        async with self._sem:
+            conn = await self._acquire()
+            try:
+                try:
+                    await conn.send_message(msg)
+                except (aiosmtplib.SMTPServerDisconnected, ConnectionError) as e:
+                    logger.warning("SMTP соединение потеряно (%s), переподключаюсь", e)
+                    conn.close()
+                    conn = await self._connect()
+                    await conn.send_message(msg)
+            except BaseException:
+                conn.close()
+                raise
+            self._release(conn)
+
+    async def close(self) -> None:
+        self._closed = True
+        idle, self._idle = self._idle, []
+        await asyncio.gather(*(self._discard(conn) for conn, _ in idle), return_exceptions=True)
+
+
+_pool: Optional[SmtpPool] = None
+
+async def start_mail_pool(size: int = SMTP_POOL_SIZE) -> SmtpPool:
+    global _pool
+    if _pool is None:
+        _pool = SmtpPool(size)
+        await _pool.start()
+        logger.info("SMTP pool: %s:%s, до %d соединений", _pool.host, _pool.port, _pool.size)
+    return _pool
+
+async def stop_mail_pool() -> None:
+    global _pool
+    if _pool is not None:
+        pool, _pool = _pool, None
+        await pool.close()
+
+async def send_email_async(subject, body, attachment, cc=None, filename=None):
+    """Отправка через пул; если пул не запущен — одно временное соединение."""
+    msg = build_message(subject, body, attachment, cc=cc, filename=filename)
+    if _pool is not None:
+        await _pool.send(msg)
+        return
+
+    pool = SmtpPool(1)
+    try:
+        await pool.send(msg)
+    finally:
+        await pool.close()
@@ -0,0 +1,157 @@
+"""Пересылка ERROR-записей лога в статусный топик Telegram."""
+from __future__ import annotations
+
+import asyncio
+import logging
+import re
+
+from telegram.error import RetryAfter
+
+
+class TelegramErrorHandler(logging.Handler):
+    """
+    Пересылает ERROR-записи в статусный топик.
+
+    emit() передаёт запись в поток loop'а (из любого потока); отправкой
+    занимается одна фоновая задача. Одинаковые ошибки (с точностью до чисел)
+    в пределах window секунд схлопываются ещё до очереди: первая встаёт в
+    очередь, остальные только увеличивают счётчик группы и места не занимают,
+    а по истечении окна уходит одно сообщение «×N за window с». Поэтому шторм
+    одинаковых ошибок не вытесняет другую. При переполнении очереди сообщения
+    отбрасываются и учитываются в счётчике dropped.
+    """
+
+    def __init__(self, app, chat_id: int, thread_id: int | None = None,
+                 window: float = 60.0, max_queue: int = 200):
+        super().__init__(logging.ERROR)
+        self.app = app
+        self.chat_id = chat_id
+        self.thread_id = thread_id
+        self.window = window
+        self.dropped = 0
+
+        self._queue: asyncio.Queue | None = None
+        self._max_queue = max_queue
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._task: asyncio.Task | None = None
+        self._groups: dict = {}          # ключ → [начало окна, подавлено, текст]; только в потоке loop'а
+        self._reported_dropped = 0
+
+    # ── жизненный цикл ──
+    def start(self) -> None:
+        """Вызывается из event loop (post_init)."""
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(self._max_queue)
+        self._task = asyncio.create_task(self._sender(), name="tg-error-log")
+
+    async def stop(self) -> None:
+        """Вызывается из post_shutdown: останавливает отправителя, пока loop ещё жив."""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def close(self) -> None:
+        if self._task is not None and self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._task.cancel)
+        self._task = None
+        super().close()
+
+    # ── приём записей ──
+    def emit(self, record: logging.LogRecord):
+        if self._loop is None or self._task is None or not getattr(self.app, "running", False):
+            return
+        try:
+            item = (self._group_key(record), self.format(record))
+            self._loop.call_soon_threadsafe(self._enqueue, item)
+        except Exception:
+            self.dropped += 1
+
+    def _enqueue(self, item) -> None:
+        """В потоке loop'а: повтор в окне группы только увеличивает её счётчик."""
+        key, msg = item
+        now = self._loop.time()
+        group = self._groups.get(key)
+        if group is not None:
+            if now - group[0] < self.window:
+                group[1] += 1
+                return
+            del self._groups[key]
+            summary = self._summary(group)
+            if summary:
+                self._put(summary)
+        if self._put(f"❌ *ERROR*\n```{msg}```"):
+            self._groups[key] = [now, 0, msg]
+
+    def _put(self, text: str) -> bool:
+        try:
+            self._queue.put_nowait(text)
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+
+    @staticmethod
+    def _group_key(record: logging.LogRecord) -> tuple:
+        try:
+            text = record.getMessage()
+        except Exception:
+            text = str(record.msg)
+        return record.name, record.levelno, re.sub(r"\d+", "#", text)[:300]
+
+    # ── отправка ──
+    async def _send(self, text: str) -> None:
+        for _ in range(3):
+            try:
+                await self.app.bot.send_message(
+                    chat_id=self.chat_id,
+                    message_thread_id=self.thread_id,
+                    text=text,
+                    parse_mode="Markdown",
+                )
+                return
+            except RetryAfter as e:
+                ra = e.retry_after
+                await asyncio.sleep(ra.total_seconds() if hasattr(ra, "total_seconds") else float(ra))
+            except Exception:
+                return
+
+    def _dropped_note(self) -> str:
+        new = self.dropped - self._reported_dropped
+        if new <= 0:
+            return ""
+        self._reported_dropped = self.dropped
+        return f"\n_(очередь переполнена, пропущено записей: {new})_"
+
+    def _summary(self, group: list) -> str:
+        _, suppressed, msg = group
+        if not suppressed:
+            return ""
+        return f"❌ *ERROR* ×{suppressed + 1} за последние {self.window:.0f} с\n```{msg}```"
+
+    def _pop_expired(self, now: float) -> list:
+        """Закрывает истёкшие окна; возвращает сводки групп, где были повторы."""
+        summaries = []
+        for key, group in list(self._groups.items()):
+            if now - group[0] >= self.window:
+                del self._groups[key]
+                summaries.append(self._summary(group))
+        return [s for s in summaries if s]
+
+    async def _sender(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            timeout = None
+            if self._groups:
+                oldest = min(since for since, _, _ in self._groups.values())
+                timeout = max(0.0, oldest + self.window - loop.time())
+            try:
+                text = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                for summary in self._pop_expired(loop.time()):
+                    await self._send(summary + self._dropped_note())
+                continue
+            await self._send(text + self._dropped_note())
@@ -1,15 +1,24 @@
 from __future__ import annotations
-from typing import Dict, List, Tuple
+from typing import BinaryIO, Callable, Dict, List, NamedTuple, Optional, Tuple, Union
 
 from pdfrw import PdfReader, PdfWriter, PdfDict, PdfName, PdfString, PageMerge
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
 
+from pdf_fonts import SubsetTTFont
+
+import hashlib
+import importlib
+import itertools
 import io
 import math
+import os
+import threading
+from functools import lru_cache
+
 
+FONT_PATH = "fonts/timesnewromanpsmt.ttf"
 
 DEFAULT_FONT = "TimesNewRoman"  
 CHECK_FONT = "TimesNewRoman"  
@@ -18,42 +27,251 @@ TEXT_SIZE = 12
 CHECK_SIZE = 10 
 
 try:
-    pdfmetrics.registerFont(TTFont("TimesNewRoman", "fonts/timesnewromanpsmt.ttf"))
+    pdfmetrics.registerFont(SubsetTTFont("TimesNewRoman", FONT_PATH))
 except Exception as e:
     DEFAULT_FONT = "Helvetica"
     CHECK_FONT   = "ZapfDingbats"
 
+TEXT_PAD_X = 2
+TEXT_PAD_Y = 1
+
+MIN_TEXT_SIZE = 6
+MAX_TEXT_LINES = 3
+LINE_LEADING = 1.15
+FIT_CACHE_SIZE = 4096
+
+_TRUTHY = {"true", "on", "1", "yes", "да", "y", "ok"}
+
+# Служебный ключ данных: символы, которые надо включить в подмножество шрифта
+# сверх своих (пакет — один и тот же шрифт во всех строках, см. charset_for).
+CHARSET_KEY = "_charset"
+
 def _rect_to_xy(rect) -> Tuple[float, float, float, float]:
     llx, lly, urx, ury = [float(x) for x in rect]
     return llx, lly, urx, ury
 
-def _fit_text(canvas_obj, text: str, x: float, y: float, w: float, h: float):
+# ────────────────────────── СКОМПИЛИРОВАННЫЙ ШАБЛОН ──────────────────────────
+class TemplateField(NamedTuple):
+    """Геометрия одного поля шаблона с заранее посчитанными размерами области."""
+    name: str
+    page: int
+    kind: str           # "text" | "check"
+    x: float
+    y: float
+    w: float
+    h: float
+    max_w: float        # ширина области отрисовки (за вычетом отступов)
+    max_h: float        # высота области отрисовки (за вычетом отступов)
+
+
+class CompiledTemplate:
+    """
+    Шаблон, разобранный один раз:
+      - fields / by_page — поля с геометрией;
+      - page_sizes — размеры страниц для холстов оверлея;
+      - base_pdf — PDF шаблона уже без виджетов и AcroForm.
+    """
+    __slots__ = ("path", "stamp", "digest", "fields", "by_page", "page_sizes", "base_pdf")
+
+    def __init__(self, path: str, stamp: Tuple[int, int], digest: str,
+                 fields: List[TemplateField], page_sizes: List[Tuple[float, float]], base_pdf: bytes):
+        self.path = path
+        self.stamp = stamp
+        self.digest = digest
+        self.fields = fields
+        self.page_sizes = page_sizes
+        self.base_pdf = base_pdf
+        self.by_page: Dict[int, List[TemplateField]] = {}
+        for f in fields:
+            self.by_page.setdefault(f.page, []).append(f)
+
+
+_TEMPLATES: Dict[str, CompiledTemplate] = {}
+_TEMPLATE_NAMES: Dict[str, str] = {}
+_TEMPLATES_LOCK = threading.Lock()
+
+def register_template(name: str, path: str) -> None:
+    """Регистрирует именованный шаблон: fill_pdf(name, ...) возьмёт файл path."""
+    with _TEMPLATES_LOCK:
+        _TEMPLATE_NAMES[name] = path
+
+def _compile_template(path: str, raw: bytes, stamp: Tuple[int, int], digest: str) -> CompiledTemplate:
+    pdf = PdfReader(fdata=raw)
+    fields: List[TemplateField] = []
+    page_sizes: List[Tuple[float, float]] = []
+
+    for p_idx, page in enumerate(pdf.pages):
+        mediabox = page.MediaBox
+        page_sizes.append((float(mediabox[2]) - float(mediabox[0]),
+                           float(mediabox[3]) - float(mediabox[1])))
+
+        annots = page.Annots
+        if not annots:
+            continue
+        for annot in annots:
+            try:
+                if annot.Subtype != PdfName('Widget') or not annot.T or not annot.Rect:
+                    continue
+
+                key = annot.T.to_unicode().strip('()')
+                llx, lly, urx, ury = _rect_to_xy(annot.Rect)
+                w = max(1.0, urx - llx)
+                h = max(1.0, ury - lly)
+
+                ft = annot.FT
+                if ft == PdfName('Tx'):
+                    fields.append(TemplateField(key, p_idx, "text", llx, lly, w, h,
+                                                max(1.0, w - 2 * TEXT_PAD_X),
+                                                max(1.0, h - 2 * TEXT_PAD_Y)))
+                elif ft == PdfName('Btn'):
+                    pad = max(0.0, min(w, h) * 0.08)
+                    fields.append(TemplateField(key, p_idx, "check", llx, lly, w, h,
+                                                max(1.0, w - 2 * pad),
+                                                max(1.0, h - 2 * pad)))
+            except Exception:
+                continue
+        page.Annots = [a for a in annots if getattr(a, "Subtype", None) != PdfName("Widget")]
+
+    if getattr(pdf.Root, "AcroForm", None):
+        try:
+            del pdf.Root.AcroForm
+        except Exception:
+            pdf.Root.AcroForm = PdfDict()
+
+    buf = io.BytesIO()
+    PdfWriter(buf, trailer=pdf).write()
+    return CompiledTemplate(path, stamp, digest, fields, page_sizes, buf.getvalue())
+
+def get_template(template: str) -> CompiledTemplate:
+    """
+    Возвращает скомпилированный шаблон по имени или пути.
+    Кэш сбрасывается, если у файла поменялись mtime/размер и вместе с ними sha256.
+    """
+    with _TEMPLATES_LOCK:
+        path = os.path.abspath(_TEMPLATE_NAMES.get(template, template))
+        cached = _TEMPLATES.get(path)
+
+    st = os.stat(path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    if cached is not None and cached.stamp == stamp:
+        return cached
+
+    with open(path, "rb") as f:
+        raw = f.read()
+    digest = hashlib.sha256(raw).hexdigest()
+
+    if cached is not None and cached.digest == digest:
+        cached.stamp = stamp
+        return cached
+
+    compiled = _compile_template(path, raw, stamp, digest)
+    with _TEMPLATES_LOCK:
+        _TEMPLATES[path] = compiled
+    return compiled
+
+# ────────────────────────── ПОДБОР РАЗМЕРА ТЕКСТА ──────────────
+# Ширины глифов DEFAULT_FONT в 1/1000 em: ширина строки линейна по размеру шрифта,
+# поэтому размер считается за один проход, без перебора setFont/stringWidth.
+_GLYPH_WIDTHS: Dict[str, float] = {}
+
+def _load_glyph_widths() -> None:
+    face = getattr(pdfmetrics.getFont(DEFAULT_FONT), "face", None)
+    if face is not None and hasattr(face, "charWidths"):
+        _GLYPH_WIDTHS.update((chr(cp), w) for cp, w in face.charWidths.items())
+
+_load_glyph_widths()
+
+def _text_units(text: str) -> float:
+    """Ширина строки в 1/1000 em; глифы вне таблицы (стандартный шрифт) досчитываются лениво."""
+    total = 0.0
+    for ch in text:
+        w = _GLYPH_WIDTHS.get(ch)
+        if w is None:
+            w = _GLYPH_WIDTHS[ch] = pdfmetrics.stringWidth(ch, DEFAULT_FONT, 1000)
+        total += w
+    return total
+
+def _size_for(units: float, max_w: float, max_h: float) -> int:
+    """Наибольший целый размер в [MIN_TEXT_SIZE, TEXT_SIZE], при котором строка влезает."""
+    fs = min(TEXT_SIZE, math.floor(max_h + 1e-9))
+    if units > 0:
+        fs = min(fs, math.floor(max_w * 1000.0 / units + 1e-9))
+    return max(MIN_TEXT_SIZE, fs)
+
+def _wrap_words(words: List[str], limit_units: float) -> Optional[Tuple[str, ...]]:
+    """Жадный перенос по словам; None — одно из слов длиннее строки."""
+    space = _text_units(" ")
+    lines: List[str] = []
+    line: List[str] = []
+    line_units = 0.0
+    for word in words:
+        wu = _text_units(word)
+        if wu > limit_units:
+            return None
+        if line and line_units + space + wu > limit_units:
+            lines.append(" ".join(line))
+            line, line_units = [], 0.0
+        line_units = line_units + space + wu if line else wu
+        line.append(word)
+    if line:
+        lines.append(" ".join(line))
+    return tuple(lines)
+
+
+class TextLayout(NamedTuple):
+    size: int
+    lines: Tuple[str, ...]
+
+
+@lru_cache(maxsize=FIT_CACHE_SIZE)
+def _layout_text(text: str, max_w: float, max_h: float) -> TextLayout:
+    """
+    Раскладка текста в области max_w × max_h (кэш по тексту и размеру поля).
+    Сначала — одна строка; если она сжимается ниже TEXT_SIZE, пробуем перенос
+    на 2..MAX_TEXT_LINES строк и берём вариант с наибольшим шрифтом.
+    """
+    best = TextLayout(_size_for(_text_units(text), max_w, max_h), (text,))
+    words = text.split()
+    if best.size >= TEXT_SIZE or len(words) < 2:
+        return best
+
+    for n in range(2, MAX_TEXT_LINES + 1):
+        top = min(TEXT_SIZE, math.floor(max_h / (1 + (n - 1) * LINE_LEADING) + 1e-9))
+        for size in range(top, best.size, -1):
+            lines = _wrap_words(words, max_w * 1000.0 / size)
+            if lines is not None and len(lines) <= n:
+                best = TextLayout(size, lines)
+                break
+    return best
+
+def _fit_layout(text: str, field: TemplateField) -> TextLayout:
+    return _layout_text(text, field.max_w, field.max_h)
+
+def _text_origins(layout: TextLayout, field: TemplateField) -> List[Tuple[float, float, str]]:
+    """Базовые линии строк (координаты PDF), блок центрируется по высоте поля."""
+    fs = layout.size
+    step = fs * LINE_LEADING
+    block_h = fs + step * (len(layout.lines) - 1)
+    x = field.x + TEXT_PAD_X
+    y = field.y + (field.h + block_h) / 2.0 - fs
+    return [(x, y - i * step, line) for i, line in enumerate(layout.lines)]
+
+# ────────────────────────── ОТРИСОВКА ──────────────────────────
+def _fit_text(canvas_obj, text: str, field: TemplateField):
     """Пишем текст внутри прямоугольника поля, пытаемся подстроить размер."""
     if not text:
         return
-    pad_x = 2
-    pad_y = 1
-    max_w = max(1.0, w - 2 * pad_x)
-    max_h = max(1.0, h - 2 * pad_y)
-
-    fs = TEXT_SIZE
-    while fs > 6:
-        canvas_obj.setFont(DEFAULT_FONT, fs)
-        tw = canvas_obj.stringWidth(text, DEFAULT_FONT, fs)
-        if tw <= max_w and fs <= max_h: 
-            break
-        fs -= 1
-
-    canvas_obj.drawString(x + pad_x, y + (h - fs) / 2.0, text)
-
-def _draw_check(c, x, y, w, h, checked: bool):
+    layout = _fit_layout(text, field)
+    canvas_obj.setFont(DEFAULT_FONT, layout.size)
+    for x, y, line in _text_origins(layout, field):
+        canvas_obj.drawString(x, y, line)
+
+def _draw_check(c, field: TemplateField, checked: bool):
     if not checked:
         return
-    pad = max(0.0, min(w, h) * 0.08)
-    box_w = max(1.0, w - 2*pad)
-    box_h = max(1.0, h - 2*pad)
+    x, y, w, h = field.x, field.y, field.w, field.h
 
-    fs = min(box_w, box_h) * 0.95
+    fs = min(field.max_w, field.max_h) * 0.95
 
     if CHECK_FONT == "DejaVuSans":
         text = "✓"
@@ -67,89 +285,158 @@ def _draw_check(c, x, y, w, h, checked: bool):
     tw = c.stringWidth(text, "ZapfDingbats", fs)
     c.drawString(x + (w - tw)/2, y + (h - fs)/2 - fs*0.08, text)
 
-def fill_pdf(template_path: str, output_path: str, data: Dict) -> None:
-    """
-    1) Читает шаблон с AcroForm.
-    2) Для каждого поля берёт значение из data (по имени/ключу).
-       - Текстовые: печатаем текст.
-       - Чекбоксы: рисуем галочку, если truthy ('on', True, 'yes', '1').
-    3) Полностью удаляем все поля и AcroForm.
-    4) Сохраняем плоский PDF.
-    """
-    pdf = PdfReader(template_path)
-    pages = pdf.pages
+def _is_checked(val) -> bool:
+    sval = str(val).strip().lower() if val is not None else ""
+    return sval in _TRUTHY
 
-    draw_plan: Dict[int, List[Tuple[str, float, float, float, float, object]]] = {}
+def _text_chars(tpl: CompiledTemplate, data: Dict) -> str:
+    return "".join(str(data[f.name]) for f in tpl.fields if f.kind == "text" and data.get(f.name) is not None)
 
-    for p_idx, page in enumerate(pages):
-        annots = page.Annots
-        if not annots:
-            continue
-        to_keep = []
-        for annot in annots:
-            try:
-                if annot.Subtype != PdfName('Widget') or not annot.T:
-                    to_keep.append(annot)
-                    continue
+def charset_for(template: str, rows: List[Dict]) -> str:
+    """Общий набор символов текстовых полей нескольких заявок — для CHARSET_KEY."""
+    tpl = get_template(template)
+    return "".join(sorted(set(itertools.chain.from_iterable(_text_chars(tpl, row) for row in rows))))
 
-                key = annot.T.to_unicode().strip('()')
-                rect = annot.Rect
-                if not rect:
-                    to_keep.append(annot)
-                    continue
-                llx, lly, urx, ury = _rect_to_xy(rect)
-                w = max(1.0, urx - llx)
-                h = max(1.0, ury - lly)
+# ────────────────────────── ДВИЖКИ ──────────────────────────
+Engine = Callable[[CompiledTemplate, Dict], bytes]
 
-                ft = annot.FT
-                val = data.get(key)
+DEFAULT_ENGINE = "pdfrw"
 
-                if ft == PdfName('Tx'):
-                    text_val = "" if val is None else str(val)
-                    draw_plan.setdefault(p_idx, []).append(("text", llx, lly, w, h, text_val))
-                elif ft == PdfName('Btn'):
-                    sval = str(val).strip().lower() if val is not None else ""
-                    checked = sval in {"true", "on", "1", "yes", "да", "y", "ok"}
-                    draw_plan.setdefault(p_idx, []).append(("check", llx, lly, w, h, checked))
-                else:
-                    pass
-            except Exception:
-                to_keep.append(annot)
-        page.Annots = [a for a in (page.Annots or []) if getattr(a, "Subtype", None) != PdfName("Widget")]
+_ENGINES: Dict[str, Engine] = {}
+_LAZY_ENGINES = {"pymupdf": "fill_pdf_mupdf", "incremental": "fill_pdf_incremental"}
 
-    overlays: List[io.BytesIO] = []
-    for p_idx, page in enumerate(pages):
+def register_engine(name: str, engine: Engine) -> None:
+    """Движок — функция (шаблон, данные) -> байты готового плоского PDF."""
+    _ENGINES[name] = engine
 
-        mediabox = page.MediaBox
-        pw = float(mediabox[2]) - float(mediabox[0])
-        ph = float(mediabox[3]) - float(mediabox[1])
+def get_engine(name: Optional[str] = None) -> Engine:
+    name = name or DEFAULT_ENGINE
+    if name not in _ENGINES and name in _LAZY_ENGINES:
+        importlib.import_module(_LAZY_ENGINES[name])
+    try:
+        return _ENGINES[name]
+    except KeyError:
+        raise ValueError(f"Неизвестный движок PDF: {name!r}") from None
 
-        buf = io.BytesIO()
-        c = canvas.Canvas(buf, pagesize=(pw, ph))
+def _build_overlay(tpl: CompiledTemplate, data: Dict) -> Tuple[List[int], Optional[bytes]]:
+    """Один многостраничный оверлей reportlab на заявку: (индексы страниц шаблона, байты PDF)."""
+    overlay_pages = [p_idx for p_idx in range(len(tpl.page_sizes)) if tpl.by_page.get(p_idx)]
+    if not overlay_pages:
+        return overlay_pages, None
+
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf)
+    font = pdfmetrics.getFont(DEFAULT_FONT)
+    if isinstance(font, SubsetTTFont):
+        font.reserve(c._doc, _text_chars(tpl, data) + str(data.get(CHARSET_KEY) or ""))
+    for p_idx in overlay_pages:
+        c.setPageSize(tpl.page_sizes[p_idx])
         c.setFont(DEFAULT_FONT, TEXT_SIZE)
+        for field in tpl.by_page[p_idx]:
+            val = data.get(field.name)
+            if field.kind == "text":
+                _fit_text(c, "" if val is None else str(val), field)
+            elif field.kind == "check":
+                _draw_check(c, field, _is_checked(val))
+        c.showPage()
+    c.save()
+    return overlay_pages, buf.getvalue()
 
-        for item in draw_plan.get(p_idx, []):
-            kind, x, y, w, h, val = item
-            if kind == "text":
-                _fit_text(c, val, x, y, w, h)
-            elif kind == "check":
-                _draw_check(c, x, y, w, h, bool(val))
+def _merge_overlay(tpl: CompiledTemplate, overlay_pages: List[int], overlay: Optional[bytes]) -> PdfReader:
+    pdf = PdfReader(fdata=tpl.base_pdf)
+    if overlay is not None:
+        pages = pdf.pages
+        for p_idx, overlay_page in zip(overlay_pages, PdfReader(fdata=overlay).pages):
+            PageMerge(pages[p_idx]).add(overlay_page, prepend=False).render()
+    return pdf
 
-        c.showPage()
-        c.save()
-        buf.seek(0)
-        overlays.append(buf)
+def _write_pdf(pdf: PdfReader) -> bytes:
+    out = io.BytesIO()
+    PdfWriter(out, trailer=pdf).write()
+    return out.getvalue()
 
-    if getattr(pdf.Root, "AcroForm", None):
-        try:
-            del pdf.Root.AcroForm
-        except Exception:
-            pdf.Root.AcroForm = PdfDict() 
+def _render_pdfrw(tpl: CompiledTemplate, data: Dict) -> bytes:
+    """pdfrw + reportlab: оверлей рисуется холстом reportlab и накладывается через PageMerge."""
+    overlay_pages, overlay = _build_overlay(tpl, data)
+    return _write_pdf(_merge_overlay(tpl, overlay_pages, overlay))
+
+register_engine("pdfrw", _render_pdfrw)
 
-    for p_idx, page in enumerate(pages):
-        if p_idx < len(overlays):
-            overlay_reader = PdfReader(overlays[p_idx])
-            overlay_page = overlay_reader.pages[0]
-            PageMerge(page).add(overlay_page, prepend=False).render()
+def fill_pdf(template_path: str, output_path: Union[str, BinaryIO, None], data: Dict,
+             engine: Optional[str] = None) -> Optional[bytes]:
+    """
+    1) Берёт скомпилированный шаблон из кэша (разбор полей — один раз на файл).
+    2) Для каждого поля берёт значение из data (по имени/ключу).
+       - Текстовые: печатаем текст.
+       - Чекбоксы: рисуем галочку, если truthy ('on', True, 'yes', '1').
+    3) Рисует значения выбранным движком (engine: "pdfrw" | "pymupdf" | "incremental")
+       поверх «чистого» шаблона (поля и AcroForm удалены при компиляции).
+    4) Сохраняем плоский PDF: в файл/поток output_path или, если он None,
+       возвращаем байты без обращения к диску.
+    """
+    tpl = get_template(template_path)
+    pdf_bytes = get_engine(engine)(tpl, data)
+
+    if output_path is None:
+        return pdf_bytes
+    if hasattr(output_path, "write"):
+        output_path.write(pdf_bytes)
+    else:
+        with open(output_path, "wb") as f:
+            f.write(pdf_bytes)
+    return None
+
+def _object_key(obj) -> tuple:
+    """Структурный ключ объекта pdfrw: одинаковые по содержимому объекты дают один ключ."""
+    if isinstance(obj, PdfDict):
+        return ("d", obj.stream, tuple(sorted((k, _object_key(v)) for k, v in obj.iteritems())))
+    if isinstance(obj, list):
+        return ("a",) + tuple(_object_key(v) for v in obj)
+    return ("v", str(obj))
 
-    PdfWriter(output_path, trailer=pdf).write()
+def _share_fonts(resources, fonts: Dict[tuple, PdfDict], seen: set) -> None:
+    """Одинаковые шрифты разных документов (и их форм-XObject) заменяет одним объектом."""
+    if resources is None or id(resources) in seen:
+        return
+    seen.add(id(resources))
+    font_dict = resources.Font
+    if font_dict is not None:
+        for name, font in list(font_dict.iteritems()):
+            font_dict[name] = fonts.setdefault(_object_key(font), font)
+    xobjects = resources.XObject
+    if xobjects is not None:
+        for xobj in xobjects.itervalues():
+            if xobj is not None and xobj.Subtype == PdfName("Form"):
+                _share_fonts(xobj.Resources, fonts, seen)
+
+def merge_pdfs(documents: List[bytes]) -> bytes:
+    """
+    Склеивает несколько готовых PDF в один многостраничный.
+    Шрифты с одинаковым содержимым (пакет с общим CHARSET_KEY) пишутся один раз.
+    """
+    writer = PdfWriter()
+    fonts: Dict[tuple, PdfDict] = {}
+    seen: set = set()
+    for doc in documents:
+        pages = PdfReader(fdata=doc).pages
+        for page in pages:
+            _share_fonts(page.inheritable.Resources, fonts, seen)
+        writer.addpages(pages)
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+def split_pdf(document: bytes, parts: int) -> List[bytes]:
+    """Обратное к merge_pdfs для документов одинаковой длины: делит PDF на parts частей."""
+    pages = PdfReader(fdata=document).pages
+    if parts <= 1 or len(pages) % parts:
+        return [document]
+    step = len(pages) // parts
+    out = []
+    for i in range(0, len(pages), step):
+        writer = PdfWriter()
+        writer.addpages(pages[i:i + step])
+        buf = io.BytesIO()
+        writer.write(buf)
+        out.append(buf.getvalue())
+    return out
@@ -0,0 +1,247 @@
+"""Движок заполнения «инкрементальным обновлением».
+
+Движок pdfrw на каждую заявку заново разбирает шаблон, сливает страницы
+через PageMerge и сериализует документ целиком. Здесь байты шаблона
+(tpl.base_pdf — уже без виджетов и AcroForm) остаются как есть, а в конец
+дописывается incremental update (PDF 1.7, 7.5.6):
+
+* оверлей reportlab каждой страницы — Form XObject со своими ресурсами
+  (шрифты оверлея общие для всех страниц документа);
+* два общих маленьких потока «q» и «Q q /AkmFill Do Q» вокруг исходного
+  контента, чтобы состояние графики шаблона не влияло на оверлей;
+* новые версии словарей заполненных страниц (Contents, Resources);
+* xref только на эти объекты и trailer с /Prev на xref шаблона.
+
+Разбор шаблона для update (номера объектов, готовые куски словарей страниц)
+делается один раз на шаблон и кэшируется.
+"""
+from __future__ import annotations
+
+import re
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from pdfrw import PdfArray, PdfDict, PdfReader
+
+from fill_pdf import CompiledTemplate, _build_overlay, register_engine
+
+XOBJECT_NAME = "/AkmFill"
+OPEN_STREAM = b"q\n"
+CLOSE_STREAM = f"\nQ\nq {XOBJECT_NAME} Do Q\n".encode("latin-1")
+
+RefFn = Callable[[object], Optional[int]]
+
+
+# ────────────────────────── СЕРИАЛИЗАЦИЯ ──────────────────────────
+def _fmt(obj, ref: RefFn) -> str:
+    """Значение внутри словаря/массива: косвенный объект — ссылкой."""
+    num = ref(obj)
+    if num is not None:
+        return f"{num} 0 R"
+    return _fmt_direct(obj, ref)
+
+def _fmt_direct(obj, ref: RefFn) -> str:
+    if isinstance(obj, PdfDict):
+        return "<<" + " ".join(f"{k} {_fmt(v, ref)}" for k, v in obj.iteritems()) + ">>"
+    if isinstance(obj, (PdfArray, list, tuple)):
+        return "[" + " ".join(_fmt(v, ref) for v in obj) + "]"
+    if obj is None:
+        return "null"
+    if obj is True or obj is False:
+        return "true" if obj else "false"
+    return str(obj)                                 # PdfName, PdfString, PdfObject (числа) — уже в синтаксисе PDF
+
+def _stream(dict_body: str, data: bytes) -> bytes:
+    return f"<<{dict_body} /Length {len(data)}>>\nstream\n".encode("latin-1") + data + b"\nendstream"
+
+def _stream_bytes(obj: PdfDict) -> bytes:
+    return (obj.stream or "").encode("latin-1")
+
+def _base_ref(obj) -> Optional[int]:
+    key = getattr(obj, "indirect", None)
+    return key[0] if isinstance(key, tuple) else None
+
+
+# ────────────────────────── ПОДГОТОВКА ШАБЛОНА ──────────────────────────
+class _PageInfo:
+    __slots__ = ("num", "entries", "contents", "resources", "xobjects", "bbox")
+
+    def __init__(self, num: int, entries: str, contents: str, resources: str, xobjects: str, bbox: str):
+        self.num = num
+        self.entries = entries          # словарь страницы без /Contents и /Resources
+        self.contents = contents        # ссылки на исходный контент через пробел
+        self.resources = resources      # ресурсы страницы без /XObject
+        self.xobjects = xobjects        # исходные XObject'ы страницы
+        self.bbox = bbox                # MediaBox — BBox формы оверлея
+
+
+class _Prepared:
+    __slots__ = ("digest", "size", "prev", "trailer", "pages")
+
+    def __init__(self, digest: str, size: int, prev: int, trailer: str, pages: Dict[int, _PageInfo]):
+        self.digest = digest
+        self.size = size                # первый свободный номер объекта
+        self.prev = prev                # смещение xref шаблона
+        self.trailer = trailer          # /Root, /Info, /ID для нового trailer
+        self.pages = pages
+
+
+_PREPARED: Dict[str, _Prepared] = {}
+_PREPARED_LOCK = threading.Lock()
+
+def _prepare(tpl: CompiledTemplate) -> _Prepared:
+    with _PREPARED_LOCK:
+        cached = _PREPARED.get(tpl.path)
+    if cached is not None and cached.digest == tpl.digest:
+        return cached
+
+    m = re.search(rb"startxref\s+(\d+)\s+%%EOF\s*$", tpl.base_pdf[-1024:])
+    if m is None:
+        raise ValueError("Шаблон без startxref в конце файла")
+    reader = PdfReader(fdata=tpl.base_pdf)
+    reader.read_all()
+
+    trailer = " ".join(f"{k} {_fmt(reader[k], _base_ref)}" for k in ("/Root", "/Info", "/ID") if reader[k] is not None)
+    pages: Dict[int, _PageInfo] = {}
+    for p_idx in tpl.by_page:
+        page = reader.pages[p_idx]
+        num = _base_ref(page)
+        if num is None:
+            raise ValueError(f"Страница {p_idx} шаблона не косвенный объект")
+        contents = page.Contents
+        if contents is None:
+            contents = []
+        elif not isinstance(contents, PdfArray):
+            contents = [contents]
+        resources = page.inheritable.Resources or PdfDict()
+        xobjects = resources.XObject or PdfDict()
+        pages[p_idx] = _PageInfo(
+            num=num,
+            entries=" ".join(f"{k} {_fmt(v, _base_ref)}" for k, v in page.iteritems()
+                             if k not in ("/Contents", "/Resources")),
+            contents=" ".join(_fmt(c, _base_ref) for c in contents),
+            resources=" ".join(f"{k} {_fmt(v, _base_ref)}" for k, v in resources.iteritems() if k != "/XObject"),
+            xobjects=" ".join(f"{k} {_fmt(v, _base_ref)}" for k, v in xobjects.iteritems()),
+            bbox=_fmt_direct(page.inheritable.MediaBox, _base_ref),
+        )
+
+    prepared = _Prepared(tpl.digest, int(reader.Size), int(m.group(1)), trailer, pages)
+    with _PREPARED_LOCK:
+        _PREPARED[tpl.path] = prepared
+    return prepared
+
+
+# ────────────────────────── UPDATE ──────────────────────────
+class _Update:
+    """Новые объекты update: номера выдаются подряд, начиная с /Size шаблона."""
+
+    def __init__(self, first: int):
+        self.next = first
+        self.objects: List[Tuple[int, bytes]] = []
+        self._numbers: Dict[tuple, int] = {}        # ключ объекта оверлея → номер в update
+
+    def add(self, body: bytes, num: Optional[int] = None) -> int:
+        if num is None:
+            num, self.next = self.next, self.next + 1
+        self.objects.append((num, body))
+        return num
+
+    def ref(self, obj) -> Optional[int]:
+        key = getattr(obj, "indirect", None)
+        return self._numbers.get(key) if isinstance(key, tuple) else None
+
+    def copy_graph(self, root) -> None:
+        """Переносит косвенные объекты оверлея, достижимые из root (шрифты, ToUnicode, FontFile)."""
+        pending = [root]
+        while pending:
+            obj = pending.pop()
+            key = getattr(obj, "indirect", None)
+            if isinstance(key, tuple):
+                if key in self._numbers:
+                    continue
+                self._numbers[key] = self.next
+                self.next += 1
+                pending.append(_Deferred(obj))
+            if isinstance(obj, PdfDict):
+                pending.extend(obj.itervalues())
+            elif isinstance(obj, PdfArray):
+                pending.extend(obj)
+            elif isinstance(obj, _Deferred):
+                self._emit(obj.obj)
+
+    def _emit(self, obj) -> None:
+        num = self._numbers[obj.indirect]
+        if isinstance(obj, PdfDict) and obj.stream is not None:
+            body_dict = " ".join(f"{k} {_fmt(v, self.ref)}" for k, v in obj.iteritems() if k != "/Length")
+            self.objects.append((num, _stream(body_dict, _stream_bytes(obj))))
+        else:
+            self.objects.append((num, _fmt_direct(obj, self.ref).encode("latin-1")))
+
+
+class _Deferred:
+    """Маркер «записать объект»: содержимое пишется после нумерации его детей."""
+    __slots__ = ("obj",)
+
+    def __init__(self, obj):
+        self.obj = obj
+
+
+def _serialize(base: bytes, prepared: _Prepared, update: _Update) -> bytes:
+    out = bytearray(base)
+    if not out.endswith(b"\n"):
+        out += b"\n"
+    offsets: Dict[int, int] = {}
+    for num, body in update.objects:
+        offsets[num] = len(out)
+        out += f"{num} 0 obj\n".encode("latin-1") + body + b"\nendobj\n"
+
+    xref_at = len(out)
+    out += b"xref\n"
+    numbers = sorted(offsets)
+    i = 0
+    while i < len(numbers):
+        j = i
+        while j + 1 < len(numbers) and numbers[j + 1] == numbers[j] + 1:
+            j += 1
+        out += f"{numbers[i]} {j - i + 1}\n".encode("latin-1")
+        for num in numbers[i:j + 1]:
+            out += f"{offsets[num]:010d} 00000 n \n".encode("latin-1")
+        i = j + 1
+    size = max(prepared.size, update.next)
+    out += (f"trailer\n<</Size {size} {prepared.trailer} /Prev {prepared.prev}>>\n"
+            f"startxref\n{xref_at}\n%%EOF\n").encode("latin-1")
+    return bytes(out)
+
+def render_incremental(tpl: CompiledTemplate, data: Dict) -> bytes:
+    overlay_pages, overlay = _build_overlay(tpl, data)
+    if overlay is None:
+        return tpl.base_pdf
+    prepared = _prepare(tpl)
+    update = _Update(prepared.size)
+    open_num = update.add(_stream("", OPEN_STREAM))
+    close_num = update.add(_stream("", CLOSE_STREAM))
+
+    for p_idx, opage in zip(overlay_pages, PdfReader(fdata=overlay).pages):
+        info = prepared.pages[p_idx]
+        content = opage.Contents
+        if isinstance(content, PdfArray):
+            if len(content) != 1:
+                raise ValueError("Оверлей reportlab с несколькими потоками контента")
+            content = content[0]
+        resources = opage.inheritable.Resources or PdfDict()
+        update.copy_graph(resources)
+
+        filters = " ".join(f"{k} {_fmt(content[k], update.ref)}" for k in ("/Filter", "/DecodeParms")
+                           if content[k] is not None)
+        form_num = update.add(_stream(
+            f"/Type /XObject /Subtype /Form /BBox {info.bbox} "
+            f"/Resources {_fmt(resources, update.ref)} {filters}",
+            _stream_bytes(content)))
+
+        page_dict = (f"<<{info.entries} /Contents [{open_num} 0 R {info.contents} {close_num} 0 R] "
+                     f"/Resources <<{info.resources} /XObject <<{info.xobjects} {XOBJECT_NAME} {form_num} 0 R>>>>>>")
+        update.add(page_dict.encode("latin-1"), num=info.num)
+
+    return _serialize(tpl.base_pdf, prepared, update)
+
+register_engine("incremental", render_incremental)
@@ -0,0 +1,132 @@
+"""Движок заполнения на PyMuPDF.
+
+Рисует значения прямо в контент страниц шаблона (без промежуточного холста
+reportlab и PageMerge) и сохраняет плоский PDF. Подбор размера текста и
+геометрия галочки совпадают с движком pdfrw (_fit_layout / _draw_check).
+
+Шрифт встраивается только на страницы, где есть текст, и урезается до
+нарисованных глифов без хинтинга. ToUnicode, который строит MuPDF, для
+глифов с несколькими кодами (пробел/U+00A0, дефис/U+00AD) выбирает не тот
+символ — он переписывается по тексту, который действительно нарисован.
+"""
+from __future__ import annotations
+
+import os
+from typing import Dict, Optional, Set
+
+import fitz  # PyMuPDF
+from reportlab.pdfbase import pdfmetrics
+
+from fill_pdf import (
+    CompiledTemplate, TemplateField, DEFAULT_FONT, FONT_PATH,
+    _fit_layout, _text_origins, _is_checked, register_engine,
+)
+from pdf_fonts import strip_hinting
+
+TEXT_FONT_NAME = "TNR"
+CHECK_FONT_NAME = "zadb"      # встроенный ZapfDingbats
+CHECK_CHAR = "\x33"           # галочка в кодировке ZapfDingbats, как в _draw_check
+
+_font_buffer: Optional[bytes] = None
+_font: Optional[fitz.Font] = None
+
+def _text_font() -> Optional[bytes]:
+    """TTF читается один раз на процесс; None — шрифт недоступен, берём Helvetica."""
+    global _font_buffer
+    if _font_buffer is None and DEFAULT_FONT != "Helvetica" and os.path.exists(FONT_PATH):
+        with open(FONT_PATH, "rb") as f:
+            _font_buffer = f.read()
+    return _font_buffer
+
+def _glyph_font() -> fitz.Font:
+    global _font
+    if _font is None:
+        _font = fitz.Font(fontbuffer=_text_font())
+    return _font
+
+def _fit_text(page: fitz.Page, text: str, field: TemplateField, fontname: str) -> None:
+    if not text:
+        return
+    layout = _fit_layout(text, field)
+    for x, y, line in _text_origins(layout, field):
+        page.insert_text(fitz.Point(x, y) * page.transformation_matrix, line,
+                         fontname=fontname, fontsize=layout.size)
+
+def _draw_check(page: fitz.Page, field: TemplateField, checked: bool) -> None:
+    if not checked:
+        return
+    fs = min(field.max_w, field.max_h) * 0.95
+    tw = pdfmetrics.stringWidth(CHECK_CHAR, "ZapfDingbats", fs)
+    x = field.x + (field.w - tw) / 2
+    y = field.y + (field.h - fs) / 2 - fs * 0.08
+    page.insert_text(fitz.Point(x, y) * page.transformation_matrix, CHECK_CHAR,
+                     fontname=CHECK_FONT_NAME, fontsize=fs)
+
+# ────────────────────────── ШРИФТ ──────────────────────────
+def _to_unicode(chars: Set[str]) -> bytes:
+    """CMap ToUnicode для Identity-H: глиф → символ, которым его рисовали (меньший код при совпадении)."""
+    font = _glyph_font()
+    mapping: Dict[int, str] = {}
+    for ch in sorted(chars):
+        gid = font.has_glyph(ord(ch))
+        if gid:
+            mapping.setdefault(gid, ch)
+    entries = [f"<{gid:04x}> <{ch.encode('utf-16-be').hex()}>" for gid, ch in sorted(mapping.items())]
+    blocks = "".join(f"{len(chunk)} beginbfchar\n" + "\n".join(chunk) + "\nendbfchar\n"
+                     for chunk in (entries[i:i + 100] for i in range(0, len(entries), 100)))
+    return ("/CIDInit /ProcSet findresource begin\n12 dict begin\nbegincmap\n"
+            "/CIDSystemInfo <</Registry(Adobe)/Ordering(UCS)/Supplement 0>> def\n"
+            "/CMapName /Adobe-Identity-UCS def\n/CMapType 2 def\n"
+            "1 begincodespacerange\n<0000> <FFFF>\nendcodespacerange\n"
+            f"{blocks}endcmap\nCMapName currentdict /CMap defineresource pop\nend\nend\n").encode("latin-1")
+
+def _ref(doc: fitz.Document, xref: int, key: str) -> int:
+    kind, value = doc.xref_get_key(xref, key)
+    return int(value.strip("[]").split()[0]) if kind in ("xref", "array") else 0
+
+def _finish_text_font(doc: fitz.Document, chars: Set[str]) -> None:
+    """После subset_fonts: ToUnicode по нарисованному тексту, программа шрифта без хинтинга."""
+    fonts = {f[0] for page in doc for f in page.get_fonts() if f[4] == TEXT_FONT_NAME}
+    for xref in fonts:
+        to_unicode = _ref(doc, xref, "ToUnicode")
+        if to_unicode:
+            doc.update_stream(to_unicode, _to_unicode(chars))
+        descendant = _ref(doc, xref, "DescendantFonts")
+        font_file = _ref(doc, _ref(doc, descendant, "FontDescriptor"), "FontFile2") if descendant else 0
+        if font_file:
+            program = strip_hinting(doc.xref_stream(font_file))
+            doc.update_stream(font_file, program)
+            doc.xref_set_key(font_file, "Length1", str(len(program)))
+
+# ────────────────────────── РЕНДЕР ──────────────────────────
+def render_pymupdf(tpl: CompiledTemplate, data: Dict) -> bytes:
+    doc = fitz.open("pdf", tpl.base_pdf)
+    try:
+        font = _text_font()
+        drawn: Set[str] = set()
+        for p_idx, fields in tpl.by_page.items():
+            page = doc[p_idx]
+            fontname = None                         # шрифт встраивается при первой строке на странице
+            for field in fields:
+                val = data.get(field.name)
+                if field.kind == "text":
+                    text = "" if val is None else str(val)
+                    if not text:
+                        continue
+                    if fontname is None:
+                        fontname = TEXT_FONT_NAME if font is not None else "helv"
+                        if font is not None:
+                            page.insert_font(fontname=fontname, fontbuffer=font)
+                    _fit_text(page, text, field, fontname)
+                    drawn.update(text)
+                elif field.kind == "check":
+                    _draw_check(page, field, _is_checked(val))
+
+        if font is not None and drawn:
+            doc.subset_fonts()
+            _finish_text_font(doc, drawn)
+        return doc.tobytes(garbage=3, deflate=True)
+    finally:
+        doc.close()
+
+register_engine("pymupdf", render_pymupdf)
@@ -0,0 +1,105 @@
+"""Минимальный HTTP/1.1 сервер на asyncio для служебных эндпоинтов.
+
+Без сторонних зависимостей: разбирает строку запроса, заголовки и тело по
+Content-Length, вызывает обработчик маршрута и закрывает соединение.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY = 1_000_000
+READ_TIMEOUT = 10.0
+
+REASONS = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 403: "Forbidden", 404: "Not Found",
+           405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error",
+           503: "Service Unavailable"}
+
+
+class Request:
+    __slots__ = ("method", "path", "headers", "body")
+
+    def __init__(self, method: str, path: str, headers: Dict[str, str], body: bytes):
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.body = body
+
+
+Response = Tuple[int, str, bytes]                     # (status, content-type, body)
+Handler = Callable[[Request], Awaitable[Response]]
+
+
+class HttpServer:
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._routes: Dict[Tuple[str, str], Handler] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    def route(self, method: str, path: str, handler: Handler) -> None:
+        self._routes[(method.upper(), path)] = handler
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info("HTTP: слушаю %s:%s (%s)", self.host, self.port,
+                    ", ".join(f"{m} {p}" for m, p in self._routes))
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Request]:
+        line = await reader.readline()
+        if not line:
+            return None
+        method, path, _ = line.decode("latin-1").split(" ", 2)
+        headers: Dict[str, str] = {}
+        while True:
+            h = await reader.readline()
+            if h in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = h.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length", "0") or 0)
+        if length > MAX_BODY:
+            raise ValueError("body too large")
+        body = await reader.readexactly(length) if length else b""
+        return Request(method.upper(), path.split("?", 1)[0], headers, body)
+
+    async def _dispatch(self, req: Request) -> Response:
+        handler = self._routes.get((req.method, req.path))
+        if handler is None:
+            if any(p == req.path for _, p in self._routes):
+                return 405, "text/plain", b"method not allowed"
+            return 404, "text/plain", b"not found"
+        try:
+            return await handler(req)
+        except Exception:
+            logger.exception("HTTP: ошибка обработчика %s %s", req.method, req.path)
+            return 500, "text/plain", b"internal error"
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            try:
+                req = await asyncio.wait_for(self._read_request(reader), READ_TIMEOUT)
+            except (ValueError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+                status, ctype, body = 400, "text/plain", b"bad request"
+            else:
+                if req is None:
+                    return
+                status, ctype, body = await self._dispatch(req)
+
+            head = (f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                    f"Content-Type: {ctype}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n")
+            writer.write(head.encode("latin-1") + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,138 @@
+"""Настройка логирования без блокировок event loop.
+
+Корневой логгер пишет только в очередь (QueueHandler); файл с ротацией и
+консоль обслуживает отдельный поток QueueListener, так что запись на диск и
+ротация не происходят внутри async-хендлеров. Если очередь переполнена,
+записи уровня ниже WARNING отбрасываются сразу, WARNING и выше ждут место
+не дольше put_timeout секунд, потом тоже отбрасываются; все потери
+учитываются в dropped.
+
+Каждая запись получает correlation id (cid) текущего запроса: он хранится
+в ContextVar и наследуется задачами asyncio. При LOG_JSON=1 файл пишется
+в формате JSON lines.
+"""
+from __future__ import annotations
+
+import atexit
+import copy
+import json
+import logging
+import queue
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Optional
+
+LOG_FORMAT = "%(asctime)s | %(levelname)-8s | %(name)s | %(cid)s | %(message)s"
+
+_exc_formatter = logging.Formatter()
+
+correlation_id: ContextVar[str] = ContextVar("correlation_id", default="-")
+
+
+def new_correlation_id(prefix: str = "") -> str:
+    return f"{prefix}{uuid.uuid4().hex[:8]}"
+
+def set_correlation_id(cid: str):
+    """Возвращает token для correlation_id.reset()."""
+    return correlation_id.set(cid)
+
+
+class CorrelationFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "cid"):
+            record.cid = correlation_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "cid": getattr(record, "cid", "-"),
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """put_nowait вместо ожидания: при переполнении теряем DEBUG/INFO, а не время loop'а.
+
+    WARNING и выше ждут места не дольше put_timeout: зависший слушатель
+    замедляет loop на эти доли секунды, но не останавливает его.
+    """
+
+    def __init__(self, q: queue.Queue, put_timeout: float = 0.05):
+        super().__init__(q)
+        self.put_timeout = put_timeout
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Только подстановка аргументов; форматирование строки — в потоке слушателя.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _exc_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if record.levelno < logging.WARNING:
+                self.dropped += 1
+                return
+            try:
+                self.queue.put(record, timeout=self.put_timeout)
+            except queue.Full:
+                self.dropped += 1
+
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[DroppingQueueHandler] = None
+
+def setup_logging(log_file: str, *, level: int = logging.INFO, file_level: int = logging.DEBUG,
+                  json_lines: bool = False, max_queue: int = 10000) -> DroppingQueueHandler:
+    global _listener, _queue_handler
+    if _queue_handler is not None:
+        return _queue_handler
+
+    file_h = RotatingFileHandler(log_file, maxBytes=1_000_000, backupCount=10, encoding="utf-8")
+    file_h.setFormatter(JsonFormatter() if json_lines else logging.Formatter(LOG_FORMAT))
+    file_h.setLevel(file_level)
+    console_h = logging.StreamHandler()
+    console_h.setFormatter(logging.Formatter(LOG_FORMAT))
+    console_h.setLevel(logging.INFO)
+
+    q: queue.Queue = queue.Queue(max_queue)
+    _queue_handler = DroppingQueueHandler(q)
+    _queue_handler.addFilter(CorrelationFilter())
+    _listener = QueueListener(q, file_h, console_h, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(_queue_handler)
+    return _queue_handler
+
+def stop_logging() -> None:
+    """Дописывает очередь и закрывает файл; повторный вызов безопасен."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for h in _listener.handlers:
+            h.close()
+        _listener = None
+
+def dropped() -> int:
+    return _queue_handler.dropped if _queue_handler is not None else 0
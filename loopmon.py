@@ -0,0 +1,132 @@
+"""Здоровье event loop: задержка планирования, зависания, задачи, RSS/CPU.
+
+Сэмплер — корутина, которая каждые interval секунд засыпает и меряет,
+насколько позже обещанного проснулась: это и есть лаг loop'а. Отдельный
+поток-сторож следит за последним «тиком» сэмплера; если loop молчит дольше
+threshold, сторож снимает стек потока loop'а — видно, какой синхронный код
+его держит. Когда loop отвис, вызывается on_stall(длительность, стек).
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from time import perf_counter
+from typing import Callable, Deque, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SAMPLES = 8192
+STACK_LIMIT = 12
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def _quantile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, round(q * (len(values) - 1))))]
+
+
+class LoopMonitor:
+    def __init__(self, interval: float = 0.25, threshold: float = 0.5,
+                 on_stall: Optional[Callable[[float, str], None]] = None):
+        self.interval = interval
+        self.threshold = threshold
+        self.on_stall = on_stall
+
+        self.samples: Deque[Tuple[float, float]] = deque(maxlen=SAMPLES)     # (ts, лаг в секундах)
+        self.stalls: Deque[Tuple[float, float]] = deque(maxlen=256)          # (ts, длительность)
+        self._last_tick = perf_counter()
+        self._stack: Optional[str] = None
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._cpu_mark = (time.process_time(), perf_counter())
+
+    # ── жизненный цикл ──
+    def start(self) -> None:
+        self._loop_thread = threading.get_ident()
+        self._last_tick = perf_counter()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._sample(), name="loop-monitor")
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    # ── сэмплер (в loop'е) ──
+    async def _sample(self) -> None:
+        while True:
+            t0 = perf_counter()
+            await asyncio.sleep(self.interval)
+            now = perf_counter()
+            self._last_tick = now
+            lag = max(0.0, now - t0 - self.interval)
+            self.samples.append((time.time(), lag))
+            if lag >= self.threshold:
+                stack, self._stack = self._stack, None
+                self.stalls.append((time.time(), lag))
+                if self.on_stall is not None:
+                    try:
+                        self.on_stall(lag, stack or "")
+                    except Exception as e:
+                        logger.debug("on_stall упал: %s", e)
+
+    # ── сторож (в своём потоке) ──
+    def _watch(self) -> None:
+        step = max(0.01, self.threshold / 4)
+        while not self._stop.wait(step):
+            if self._stack is not None or perf_counter() - self._last_tick < self.threshold + self.interval:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is not None:
+                self._stack = "".join(traceback.format_stack(frame)[-STACK_LIMIT:])
+
+    # ── сводка ──
+    def summary(self, window: Optional[float] = None) -> Dict[str, float]:
+        since = time.time() - window if window else 0.0
+        lags = sorted(lag for ts, lag in self.samples if ts >= since)
+        cpu_now, wall_now = time.process_time(), perf_counter()
+        cpu0, wall0 = self._cpu_mark
+        self._cpu_mark = (cpu_now, wall_now)
+        try:
+            tasks = len(asyncio.all_tasks())
+        except RuntimeError:
+            tasks = 0
+        return {
+            "lag_p50_ms": _quantile(lags, 0.50) * 1000,
+            "lag_p95_ms": _quantile(lags, 0.95) * 1000,
+            "lag_p99_ms": _quantile(lags, 0.99) * 1000,
+            "lag_max_ms": (lags[-1] if lags else 0.0) * 1000,
+            "stalls": sum(1 for ts, _ in self.stalls if ts >= since),
+            "tasks": tasks,
+            "rss_mb": rss_bytes() / 1048576,
+            "cpu_pct": 100.0 * (cpu_now - cpu0) / max(1e-6, wall_now - wall0),
+        }
+
+    def format_summary(self, window: Optional[float] = None) -> str:
+        """Для heartbeat (Markdown). CPU — среднее с прошлого вызова."""
+        s = self.summary(window)
+        return (
+            f"Loop lag: p50 `{s['lag_p50_ms']:.0f}` / p95 `{s['lag_p95_ms']:.0f}` / "
+            f"p99 `{s['lag_p99_ms']:.0f}` / max `{s['lag_max_ms']:.0f}` ms, зависаний `{s['stalls']}`\n"
+            f"Задач: `{s['tasks']}` · RSS `{s['rss_mb']:.0f} MB` · CPU `{s['cpu_pct']:.0f}%`"
+        )
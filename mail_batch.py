@@ -0,0 +1,133 @@
+"""Пакетная (digest) отправка писем.
+
+Заявки, пришедшие в течение окна window секунд, уходят одним письмом
+через одно SMTP-соединение: либо несколькими вложениями ("attachments"),
+либо одним склеенным многостраничным PDF ("merged"). Пакет отправляется
+раньше, если набралось max_size заявок. Срочные заявки и режим с window=0
+идут отдельным письмом сразу.
+
+Заявки с разными CC в один пакет не попадают: копию получает только тот,
+кто её запросил.
+
+Если ожидающий submit() отменён (таймаут приёмника доставки), заявка
+убирается из пакета: иначе её отправил бы и пакет, и повтор приёмника.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from email_sender import send_email_async
+
+logger = logging.getLogger(__name__)
+
+BatchKey = Tuple[str, ...]
+
+
+class _Batch:
+    __slots__ = ("items", "timer")
+
+    def __init__(self):
+        self.items: List[Tuple[str, bytes, asyncio.Future]] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class MailBatcher:
+    def __init__(self, subject: str, body: str, *, window: float = 0.0, max_size: int = 10,
+                 mode: str = "attachments"):
+        self.subject = subject
+        self.body = body
+        self.window = window
+        self.max_size = max(1, max_size)
+        self.mode = mode
+
+        self._batches: Dict[BatchKey, _Batch] = {}
+        self._inflight: set = set()
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0 and self.max_size > 1
+
+    async def submit(self, pdf: bytes, filename: str, cc: Sequence[str] = (), urgent: bool = False) -> None:
+        """Возвращается, когда письмо с этой заявкой отправлено; ошибка отправки пробрасывается."""
+        if urgent or not self.enabled:
+            await send_email_async(self.subject, self.body, pdf, cc=list(cc), filename=filename)
+            return
+
+        key: BatchKey = tuple(sorted(cc))
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+
+        batch = self._batches.get(key)
+        if batch is None:
+            batch = self._batches[key] = _Batch()
+            batch.timer = loop.call_later(self.window, self._flush, key)
+        item = (filename, pdf, fut)
+        batch.items.append(item)
+
+        if len(batch.items) >= self.max_size:
+            self._flush(key)
+        try:
+            await fut
+        except asyncio.CancelledError:
+            self._withdraw(key, batch, item)
+            raise
+
+    def _withdraw(self, key: BatchKey, batch: _Batch, item) -> None:
+        """Убирает отменённую заявку из ещё не отправленного пакета."""
+        if self._batches.get(key) is not batch:
+            return                                  # пакет уже ушёл в _deliver: там отменённые пропускаются
+        batch.items.remove(item)
+        if not batch.items:
+            del self._batches[key]
+            if batch.timer is not None:
+                batch.timer.cancel()
+
+    def _flush(self, key: BatchKey) -> None:
+        batch = self._batches.pop(key, None)
+        if batch is None:
+            return
+        if batch.timer is not None:
+            batch.timer.cancel()
+        task = asyncio.get_running_loop().create_task(self._deliver(key, batch.items))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _deliver(self, key: BatchKey, items: List[Tuple[str, bytes, asyncio.Future]]) -> None:
+        items = [item for item in items if not item[2].cancelled()]
+        if not items:
+            return
+        try:
+            if len(items) == 1:
+                filename, pdf, _ = items[0]
+                await send_email_async(self.subject, self.body, pdf, cc=list(key), filename=filename)
+            else:
+                await send_email_async(*(await self._digest(items)), cc=list(key))
+                logger.info("Пакет из %d заявок отправлен одним письмом (CC=%s)", len(items), list(key))
+        except Exception as exc:
+            for *_, fut in items:
+                if not fut.done():
+                    fut.set_exception(exc)
+            return
+        for *_, fut in items:
+            if not fut.done():
+                fut.set_result(None)
+
+    async def _digest(self, items) -> tuple:
+        n = len(items)
+        subject = f"{self.subject} ({n} шт.)"
+        body = ("Здравствуйте!\nК данному письму прилагаются заявки на пропуск "
+                f"для транспортных средств ({n} шт.).")
+        if self.mode == "merged":
+            from fill_pdf import merge_pdfs
+            merged = await asyncio.to_thread(merge_pdfs, [pdf for _, pdf, _ in items])
+            return subject, body, [(f"passes_{n}.pdf", merged)]
+        return subject, body, [(filename, pdf) for filename, pdf, _ in items]
+
+    async def close(self) -> None:
+        """Отправляет всё, что ещё ждёт окна, и дожидается отправки."""
+        for key in list(self._batches):
+            self._flush(key)
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
@@ -0,0 +1,134 @@
+"""Метрики по этапам обработки заявки.
+
+Для каждого этапа (decode, render, archive, email, report, notify, …) в
+процессе хранятся гистограмма длительностей (бакеты в стиле Prometheus),
+счётчики успехов/ошибок и последние замеры для перцентилей. Данные отдаются
+на /metrics и сводкой попадают в heartbeat.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, List, Optional, Tuple
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+RECENT_SAMPLES = 4096
+
+
+class StageStats:
+    __slots__ = ("bucket_counts", "sum", "count", "ok", "failed", "recent")
+
+    def __init__(self):
+        self.bucket_counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+        self.ok = 0
+        self.failed = 0
+        self.recent: Deque[Tuple[float, float, bool]] = deque(maxlen=RECENT_SAMPLES)   # (ts, сек, ok)
+
+    def observe(self, seconds: float, ok: bool) -> None:
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.bucket_counts[i] += 1
+                break
+        self.sum += seconds
+        self.count += 1
+        if ok:
+            self.ok += 1
+        else:
+            self.failed += 1
+        self.recent.append((time.time(), seconds, ok))
+
+
+_stages: Dict[str, StageStats] = {}
+_lock = threading.Lock()
+
+def observe(stage: str, seconds: float, ok: bool = True) -> None:
+    with _lock:
+        stats = _stages.get(stage)
+        if stats is None:
+            stats = _stages[stage] = StageStats()
+        stats.observe(seconds, ok)
+
+@contextmanager
+def timer(stage: str):
+    """with metrics.timer("render"): ... — ошибка внутри блока считается неуспехом этапа."""
+    t0 = time.perf_counter()
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        observe(stage, time.perf_counter() - t0, ok)
+
+def _quantile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+def summary(window: Optional[float] = None) -> Dict[str, Dict[str, float]]:
+    """p50/p95 (мс), число вызовов, доля ошибок и пропускная способность (в минуту) за окно."""
+    since = time.time() - window if window else 0.0
+    out: Dict[str, Dict[str, float]] = {}
+    with _lock:
+        items = [(name, list(stats.recent)) for name, stats in _stages.items()]
+    for name, samples in items:
+        samples = [s for s in samples if s[0] >= since]
+        if not samples:
+            continue
+        durations = sorted(s[1] for s in samples)
+        failed = sum(1 for s in samples if not s[2])
+        span = window or max(1.0, time.time() - samples[0][0])
+        out[name] = {
+            "count": len(samples),
+            "p50_ms": _quantile(durations, 0.50) * 1000,
+            "p95_ms": _quantile(durations, 0.95) * 1000,
+            "error_rate": failed / len(samples),
+            "per_min": len(samples) * 60.0 / span,
+        }
+    return out
+
+def render_prometheus() -> str:
+    lines = [
+        "# HELP akm_stage_duration_seconds Длительность этапов обработки заявки.",
+        "# TYPE akm_stage_duration_seconds histogram",
+    ]
+    with _lock:
+        snapshot = [(name, list(s.bucket_counts), s.sum, s.count, s.ok, s.failed) for name, s in sorted(_stages.items())]
+    for name, buckets, total, count, _, _ in snapshot:
+        cumulative = 0
+        for bound, c in zip(BUCKETS, buckets):
+            cumulative += c
+            lines.append(f'akm_stage_duration_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+        lines.append(f'akm_stage_duration_seconds_bucket{{stage="{name}",le="+Inf"}} {count}')
+        lines.append(f'akm_stage_duration_seconds_sum{{stage="{name}"}} {total:.6f}')
+        lines.append(f'akm_stage_duration_seconds_count{{stage="{name}"}} {count}')
+
+    lines.append("# HELP akm_stage_total Завершения этапов по результату.")
+    lines.append("# TYPE akm_stage_total counter")
+    for name, _, _, _, ok, failed in snapshot:
+        lines.append(f'akm_stage_total{{stage="{name}",result="ok"}} {ok}')
+        lines.append(f'akm_stage_total{{stage="{name}",result="error"}} {failed}')
+    return "\n".join(lines) + "\n"
+
+def format_summary(window: Optional[float] = None) -> str:
+    """Сводка для heartbeat (Markdown)."""
+    rows = []
+    for name, s in summary(window).items():
+        rows.append(
+            f"`{name}` p50 {s['p50_ms']:.0f} / p95 {s['p95_ms']:.0f} ms · "
+            f"{s['per_min']:.1f}/мин · err {s['error_rate']:.0%}"
+        )
+    return "\n".join(rows)
+
+async def _metrics_handler(_req) -> tuple:
+    return 200, "text/plain; version=0.0.4; charset=utf-8", render_prometheus().encode("utf-8")
+
+def build_metrics_server(host: str, port: int):
+    from http_server import HttpServer
+    server = HttpServer(host, port)
+    server.route("GET", "/metrics", _metrics_handler)
+    return server
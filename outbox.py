@@ -0,0 +1,270 @@
+"""Надёжная очередь заявок (outbox) на SQLite.
+
+Заявка сначала записывается в БД (WAL), пользователь сразу получает
+подтверждение, а рендер, письмо и отчёт выполняют фоновые воркеры.
+Каждый этап отмечается в job_stages после успеха, поэтому после
+перезапуска контейнера задача продолжается с первого невыполненного этапа.
+Ошибка этапа — повтор с экспоненциальной задержкой, после max_attempts
+задача помечается failed.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+import logs
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id              INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind            TEXT    NOT NULL,
+    user_id         INTEGER,
+    chat_id         INTEGER,
+    payload         TEXT    NOT NULL,
+    status          TEXT    NOT NULL DEFAULT 'pending',   -- pending | running | done | failed
+    attempts        INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL    NOT NULL,
+    last_error      TEXT,
+    pdf             BLOB,
+    pdf_name        TEXT,
+    created_at      REAL    NOT NULL,
+    updated_at      REAL    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_due ON jobs(status, next_attempt_at);
+CREATE TABLE IF NOT EXISTS job_stages (
+    job_id  INTEGER NOT NULL REFERENCES jobs(id) ON DELETE CASCADE,
+    stage   TEXT    NOT NULL,
+    done_at REAL    NOT NULL,
+    PRIMARY KEY (job_id, stage)
+);
+"""
+
+
+class Job:
+    __slots__ = ("id", "kind", "user_id", "chat_id", "payload", "attempts", "pdf", "pdf_name", "done_stages")
+
+    def __init__(self, id: int, kind: str, user_id: Optional[int], chat_id: Optional[int], payload: Dict,
+                 attempts: int = 0, pdf: Optional[bytes] = None, pdf_name: Optional[str] = None,
+                 done_stages: Sequence[str] = ()):
+        self.id = id
+        self.kind = kind
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.payload = payload
+        self.attempts = attempts
+        self.pdf = pdf
+        self.pdf_name = pdf_name
+        self.done_stages = set(done_stages)
+
+
+Stage = Callable[[Job], Awaitable[None]]
+
+
+class Outbox:
+    """Синхронный слой над SQLite; из event loop вызывается через asyncio.to_thread."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def enqueue(self, kind: str, payload: Dict, user_id: Optional[int] = None,
+                chat_id: Optional[int] = None) -> int:
+        now = time.time()
+        with self._lock:
+            cur = self._db.execute(
+                "INSERT INTO jobs(kind, user_id, chat_id, payload, next_attempt_at, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (kind, user_id, chat_id, json.dumps(payload, ensure_ascii=False), now, now, now),
+            )
+            return cur.lastrowid
+
+    def recover(self) -> int:
+        """После рестарта «running» — это прерванные задачи: возвращаем их в очередь."""
+        with self._lock:
+            cur = self._db.execute(
+                "UPDATE jobs SET status='pending', updated_at=? WHERE status='running'", (time.time(),))
+            return cur.rowcount
+
+    def claim_due(self, limit: int = 1) -> List[Job]:
+        """Атомарно забирает готовые к выполнению задачи (pending → running)."""
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._db.execute(
+                    "SELECT id, kind, user_id, chat_id, payload, attempts, pdf, pdf_name FROM jobs"
+                    " WHERE status='pending' AND next_attempt_at<=? ORDER BY next_attempt_at, id LIMIT ?",
+                    (now, limit),
+                ).fetchall()
+                jobs = []
+                for r in rows:
+                    self._db.execute("UPDATE jobs SET status='running', updated_at=? WHERE id=?", (now, r[0]))
+                    stages = [s for (s,) in self._db.execute(
+                        "SELECT stage FROM job_stages WHERE job_id=?", (r[0],))]
+                    jobs.append(Job(r[0], r[1], r[2], r[3], json.loads(r[4]), r[5], r[6], r[7], stages))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return jobs
+
+    def next_due_in(self) -> Optional[float]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT MIN(next_attempt_at) FROM jobs WHERE status='pending'").fetchone()
+        if row is None or row[0] is None:
+            return None
+        return max(0.0, row[0] - time.time())
+
+    def complete_stage(self, job: Job, stage: str) -> None:
+        """Этап и его результат (PDF) фиксируются одной транзакцией."""
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                self._db.execute("INSERT OR IGNORE INTO job_stages(job_id, stage, done_at) VALUES (?, ?, ?)",
+                                 (job.id, stage, now))
+                self._db.execute("UPDATE jobs SET pdf=?, pdf_name=?, updated_at=? WHERE id=?",
+                                 (job.pdf, job.pdf_name, now, job.id))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        job.done_stages.add(stage)
+
+    def finish(self, job: Job) -> None:
+        with self._lock:
+            self._db.execute("UPDATE jobs SET status='done', pdf=NULL, last_error=NULL, updated_at=? WHERE id=?",
+                             (time.time(), job.id))
+
+    def retry(self, job: Job, error: str, delay: float, give_up: bool) -> None:
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status=?, attempts=attempts+1, next_attempt_at=?, last_error=?, updated_at=?"
+                " WHERE id=?",
+                ("failed" if give_up else "pending", now + delay, error[:2000], now, job.id),
+            )
+
+    def prune(self, older_than: float) -> int:
+        """Удаляет завершённые задачи старше older_than секунд."""
+        with self._lock:
+            cur = self._db.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at<?",
+                                   (time.time() - older_than,))
+            return cur.rowcount
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+
+class OutboxWorker:
+    """
+    Фоновые воркеры: выполняют этапы задачи по порядку, пропуская уже
+    выполненные. on_give_up вызывается, когда попытки исчерпаны.
+    """
+
+    def __init__(self, outbox: Outbox, stages: Sequence[Tuple[str, Stage]], *, workers: int = 2,
+                 max_attempts: int = 8, backoff_base: float = 5.0, backoff_max: float = 600.0,
+                 on_give_up: Optional[Callable[[Job, BaseException], Awaitable[None]]] = None):
+        self.outbox = outbox
+        self.stages = list(stages)
+        self.workers = max(1, workers)
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.on_give_up = on_give_up
+
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    def backoff(self, attempts: int) -> float:
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempts))
+        return delay * random.uniform(0.8, 1.2)
+
+    async def submit(self, kind: str, payload: Dict, user_id: Optional[int] = None,
+                     chat_id: Optional[int] = None) -> int:
+        job_id = await asyncio.to_thread(self.outbox.enqueue, kind, payload, user_id, chat_id)
+        self._wakeup.set()
+        return job_id
+
+    async def start(self) -> None:
+        recovered = await asyncio.to_thread(self.outbox.recover)
+        if recovered:
+            logger.warning("Outbox: %d незавершённых задач возвращены в очередь", recovered)
+        await asyncio.to_thread(self.outbox.prune, 7 * 24 * 3600)
+        self._tasks = [asyncio.create_task(self._run(i), name=f"outbox-{i}") for i in range(self.workers)]
+
+    async def stop(self) -> None:
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self, idx: int) -> None:
+        while True:
+            self._wakeup.clear()
+            jobs = await asyncio.to_thread(self.outbox.claim_due, 1)
+            if not jobs:
+                timeout = await asyncio.to_thread(self.outbox.next_due_in)
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=min(timeout or 60.0, 60.0))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            for job in jobs:
+                await self._process(job)
+
+    async def _process(self, job: Job) -> None:
+        token = logs.set_correlation_id(job.payload.get("cid") or f"job{job.id}")
+        try:
+            await self._run_stages(job)
+        finally:
+            logs.correlation_id.reset(token)
+
+    async def _run_stages(self, job: Job) -> None:
+        try:
+            for name, stage in self.stages:
+                if name in job.done_stages:
+                    continue
+                await stage(job)
+                await asyncio.to_thread(self.outbox.complete_stage, job, name)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            give_up = job.attempts + 1 >= self.max_attempts
+            delay = self.backoff(job.attempts)
+            await asyncio.to_thread(self.outbox.retry, job, repr(exc), delay, give_up)
+            if give_up:
+                logger.error("Outbox: задача %s не выполнена после %d попыток: %s",
+                             job.id, job.attempts + 1, exc)
+                if self.on_give_up is not None:
+                    try:
+                        await self.on_give_up(job, exc)
+                    except Exception as e:
+                        logger.error("Outbox: on_give_up для задачи %s упал: %s", job.id, e)
+            else:
+                logger.warning("Outbox: задача %s, попытка %d не удалась (%s), повтор через %.0f с",
+                               job.id, job.attempts + 1, exc, delay)
+            return
+        await asyncio.to_thread(self.outbox.finish, job)
+        logger.info("Outbox: задача %s выполнена", job.id)
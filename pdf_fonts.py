@@ -0,0 +1,186 @@
+"""Встраивание TrueType-шрифта в оверлей: маленькое подмножество из кэша.
+
+Стандартный TTFont reportlab на каждый документ заново вырезает
+подмножество из файла шрифта и сжимает его, а коды символов раздаёт в
+порядке появления в тексте — одинаковый набор символов даёт разные байты.
+Для TimesNewRoman в подмножество к тому же попадают вся ASCII и хинтинг
+(fpgm/prep/cvt и инструкции в каждом глифе) — ~40 КБ на документ.
+
+SubsetTTFont:
+  * reserve() до первой строки раздаёт коды символам документа в
+    отсортированном порядке — набор символов однозначно задаёт шрифт;
+  * в подмножество идут только эти глифы (и составные части глифов), без
+    хинтинга и таблицы name: при отрисовке в PDF они не нужны;
+  * готовая программа шрифта, ToUnicode и ширины — в LRU-кэше по набору
+    символов: повтор набора (строки одного пакета, повторная заявка) не
+    режет и не сжимает шрифт заново, а байты объектов совпадают и
+    merge_pdfs сводит их в один.
+"""
+from __future__ import annotations
+
+import struct
+import zlib
+from functools import lru_cache
+from typing import Dict, Iterable, NamedTuple, Tuple
+
+from reportlab.pdfbase import pdfdoc
+from reportlab.pdfbase.ttfonts import (
+    FF_NONSYMBOLIC, FF_SYMBOLIC, GF_ARG_1_AND_2_ARE_WORDS, GF_MORE_COMPONENTS, GF_WE_HAVE_A_SCALE,
+    GF_WE_HAVE_A_TWO_BY_TWO, GF_WE_HAVE_AN_X_AND_Y_SCALE, GF_WE_HAVE_INSTRUCTIONS,
+    SUBSETN, TTFont, TTFontMaker, makeToUnicodeCMap,
+)
+
+SUBSET_CACHE_SIZE = 256
+DROP_TABLES = ("cvt ", "fpgm", "prep", "name")
+
+
+# ────────────────────────── ПРОГРАММА ШРИФТА ──────────────────────────
+def _tables(font: bytes) -> Dict[str, bytes]:
+    count = struct.unpack(">H", font[4:6])[0]
+    out = {}
+    for i in range(count):
+        tag, _, offset, length = struct.unpack(">4sLLL", font[12 + 16 * i:28 + 16 * i])
+        out[tag.decode("latin-1")] = font[offset:offset + length]
+    return out
+
+def _strip_glyph(glyph: bytes) -> bytes:
+    """Глиф без инструкций хинтинга (простой или составной)."""
+    if len(glyph) < 10:
+        return glyph
+    contours = struct.unpack(">h", glyph[:2])[0]
+    if contours >= 0:
+        pos = 10 + 2 * contours
+        size = struct.unpack(">H", glyph[pos:pos + 2])[0]
+        return glyph[:pos] + b"\0\0" + glyph[pos + 2 + size:]
+
+    out = bytearray(glyph)
+    pos = 10
+    flags = GF_MORE_COMPONENTS
+    while flags & GF_MORE_COMPONENTS:
+        flags = struct.unpack(">H", out[pos:pos + 2])[0]
+        out[pos:pos + 2] = struct.pack(">H", flags & ~GF_WE_HAVE_INSTRUCTIONS)
+        pos += 4 + (4 if flags & GF_ARG_1_AND_2_ARE_WORDS else 2)
+        if flags & GF_WE_HAVE_A_SCALE:
+            pos += 2
+        elif flags & GF_WE_HAVE_AN_X_AND_Y_SCALE:
+            pos += 4
+        elif flags & GF_WE_HAVE_A_TWO_BY_TWO:
+            pos += 8
+    return bytes(out[:pos])
+
+def strip_hinting(font: bytes) -> bytes:
+    """Подмножество от makeSubset без хинтинга: glyf/loca пересобираются, DROP_TABLES выбрасываются."""
+    tables = _tables(font)
+    head, loca, glyf = tables["head"], tables["loca"], tables["glyf"]
+    if struct.unpack(">h", head[50:52])[0]:
+        offsets = struct.unpack(f">{len(loca) // 4}L", loca)
+    else:
+        offsets = [o * 2 for o in struct.unpack(f">{len(loca) // 2}H", loca)]
+
+    new_glyf = bytearray()
+    new_offsets = []
+    for start, end in zip(offsets, offsets[1:]):
+        new_offsets.append(len(new_glyf))
+        new_glyf += _strip_glyph(glyf[start:end])
+        new_glyf += b"\0" * (-len(new_glyf) % 4)
+    new_offsets.append(len(new_glyf))
+
+    if new_offsets[-1] >> 1 > 0xFFFF:
+        loc_format, loca = 1, struct.pack(f">{len(new_offsets)}L", *new_offsets)
+    else:
+        loc_format, loca = 0, struct.pack(f">{len(new_offsets)}H", *(o >> 1 for o in new_offsets))
+
+    maker = TTFontMaker()
+    for tag, data in tables.items():
+        if tag in DROP_TABLES:
+            continue
+        if tag == "glyf":
+            data = bytes(new_glyf)
+        elif tag == "loca":
+            data = loca
+        elif tag == "head":
+            data = head[:50] + struct.pack(">h", loc_format) + head[52:]
+        maker.add(tag, data)
+    return maker.makeStream()
+
+
+class SubsetProgram(NamedTuple):
+    font_file: bytes        # программа шрифта, FlateDecode
+    length1: int            # длина без сжатия
+    to_unicode: bytes       # CMap ToUnicode, FlateDecode
+    widths: Tuple[float, ...]
+
+
+def _flate_stream(data: bytes) -> pdfdoc.PDFStream:
+    """Поток с уже сжатыми данными: reportlab не сжимает его повторно."""
+    stream = pdfdoc.PDFStream(content=data, filters=[])
+    stream.dictionary["Filter"] = pdfdoc.PDFArray([pdfdoc.PDFName("FlateDecode")])
+    return stream
+
+
+# ────────────────────────── ШРИФТ ──────────────────────────
+class SubsetTTFont(TTFont):
+    """TTFont с детерминированными, урезанными и закэшированными подмножествами."""
+
+    def __init__(self, name: str, filename: str, cache_size: int = SUBSET_CACHE_SIZE):
+        super().__init__(name, filename, asciiReadable=False)
+        self._program = lru_cache(maxsize=cache_size)(self._make_program)
+
+    def reserve(self, doc, chars: Iterable[str]) -> None:
+        """Раздаёт коды символам документа до первой строки — по порядку, а не по появлению."""
+        if doc in self.state:
+            return
+        self._assignState(doc)
+        self.splitString("".join(sorted(set(chars) | {" "})), doc)
+
+    def _make_program(self, base_font: str, subset: Tuple[int, ...]) -> SubsetProgram:
+        program = strip_hinting(self.face.makeSubset(subset))
+        return SubsetProgram(
+            font_file=zlib.compress(program),
+            length1=len(program),
+            to_unicode=zlib.compress(makeToUnicodeCMap(base_font, subset).encode("latin-1")),
+            widths=tuple(map(self.face.getCharWidth, subset)),
+        )
+
+    def cache_info(self):
+        return self._program.cache_info()
+
+    def addObjects(self, doc) -> None:
+        """Как TTFont.addObjects, но программа шрифта, ToUnicode и ширины — из кэша."""
+        state = self._assignState(doc)
+        state.frozen = 1
+        face = self.face
+        flags = (face.flags & ~FF_NONSYMBOLIC) | FF_SYMBOLIC
+        for n, subset in enumerate(state.subsets):
+            internal_name = self.getSubsetInternalName(n, doc)[1:]
+            base_font = b"".join((SUBSETN(n), b"+", face.name, face.subfontNameX)).decode("pdfdoc")
+            program = self._program(base_font, tuple(subset))
+
+            font_file = _flate_stream(program.font_file)
+            font_file.dictionary["Length1"] = program.length1
+            descriptor = pdfdoc.PDFDictionary({
+                "Type": "/FontDescriptor",
+                "Ascent": face.ascent,
+                "CapHeight": face.capHeight,
+                "Descent": face.descent,
+                "Flags": flags,
+                "FontBBox": pdfdoc.PDFArray(face.bbox),
+                "FontName": pdfdoc.PDFName(base_font),
+                "ItalicAngle": face.italicAngle,
+                "StemV": face.stemV,
+                "FontFile2": doc.Reference(font_file, f"fontFile:{face.filename}({base_font})"),
+                "MissingWidth": face.defaultWidth,
+            })
+
+            pdf_font = pdfdoc.PDFTrueTypeFont()
+            pdf_font.Name = internal_name
+            pdf_font.BaseFont = base_font
+            pdf_font.FirstChar = 0
+            pdf_font.LastChar = len(subset) - 1
+            pdf_font.Widths = pdfdoc.PDFArray(list(program.widths))
+            pdf_font.ToUnicode = doc.Reference(_flate_stream(program.to_unicode), "toUnicodeCMap:" + base_font)
+            pdf_font.FontDescriptor = doc.Reference(descriptor, "fontDescriptor:" + base_font)
+
+            doc.Reference(pdf_font, internal_name)
+            doc.idToObject["BasicFonts"].dict[internal_name] = pdf_font
+        del self.state[doc]
@@ -0,0 +1,115 @@
+"""Сжатие готового PDF Ghostscript'ом (pdfwrite) перед отправкой.
+
+gs пересобирает документ: сжимает потоки, объединяет одинаковые шрифты
+и картинки, пишет object streams (gs ≥ 10.02). fill_pdf уже пишет
+сжатые наложения с урезанным общим шрифтом (единицы КБ), поэтому по
+умолчанию выключено (PDF_OPTIMIZE=0): имеет смысл для тяжёлых шаблонов.
+
+gs запускается подпроцессом, не больше slots одновременно, с таймаутом.
+Любая неудача — нет gs, ненулевой код, таймаут, результат не меньше
+исходного — возвращает исходный PDF: оптимизация не может сорвать заявку.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import shutil
+import signal
+import tempfile
+import time
+from typing import Dict, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+GS_ARGS = (
+    "-q", "-dNOPAUSE", "-dBATCH", "-dSAFER",
+    "-sDEVICE=pdfwrite",
+    "-dCompatibilityLevel=1.5",          # object streams и xref stream
+    "-dWriteObjStms=true", "-dWriteXRefStm=true",
+    "-dCompressPages=true", "-dCompressFonts=true",
+    "-dSubsetFonts=true", "-dEmbedAllFonts=true",
+    "-dDetectDuplicateImages=true",
+    "-dAutoRotatePages=/None",
+)
+
+
+class PdfOptimizer:
+    def __init__(self, slots: int = 2, timeout: float = 20.0, binary: Optional[str] = None):
+        self.binary = binary or shutil.which("gs")
+        self.timeout = timeout
+        self._slots = asyncio.Semaphore(max(1, slots))
+        self.documents = 0
+        self.fallbacks = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.binary is not None
+
+    async def optimize(self, pdf: bytes, name: str = "") -> bytes:
+        """Сжатый PDF или исходный, если сжать не вышло."""
+        if not self.enabled:
+            return pdf
+        t0 = time.perf_counter()
+        async with self._slots:
+            try:
+                with metrics.timer("optimize"):
+                    out = await self._run(pdf)
+            except Exception as e:
+                out = None
+                logger.warning("gs: %s не сжат (%s), отправляю как есть", name, str(e) or type(e).__name__)
+        ms = (time.perf_counter() - t0) * 1000
+        self.documents += 1
+        self.bytes_in += len(pdf)
+        if out is None or len(out) >= len(pdf):
+            self.fallbacks += 1
+            self.bytes_out += len(pdf)
+            if out is not None:
+                logger.info("gs: %s не уменьшился (%d → %d байт) за %.0f мс", name, len(pdf), len(out), ms)
+            return pdf
+        self.bytes_out += len(out)
+        logger.info("gs: %s %d → %d байт (−%.0f%%) за %.0f мс",
+                    name, len(pdf), len(out), 100.0 * (len(pdf) - len(out)) / len(pdf), ms)
+        return out
+
+    async def _run(self, pdf: bytes) -> bytes:
+        with tempfile.TemporaryDirectory(prefix="gs-") as tmp:
+            src, dst = os.path.join(tmp, "in.pdf"), os.path.join(tmp, "out.pdf")
+            await asyncio.to_thread(_write, src, pdf)
+            proc = await asyncio.create_subprocess_exec(
+                self.binary, *GS_ARGS, f"-sOutputFile={dst}", src,
+                stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE, start_new_session=True,
+            )
+            try:
+                _, err = await asyncio.wait_for(proc.communicate(), self.timeout)
+            except BaseException:                   # таймаут или отмена — не оставляем gs висеть
+                try:
+                    os.killpg(proc.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                await proc.wait()
+                raise
+            if proc.returncode != 0:
+                raise RuntimeError(f"gs код {proc.returncode}: {err.decode(errors='replace').strip()[:300]}")
+            out = await asyncio.to_thread(_read, dst)
+        if not out.startswith(b"%PDF"):
+            raise RuntimeError("gs вернул не PDF")
+        return out
+
+    def stats(self) -> Dict[str, int]:
+        return {"documents": self.documents, "fallbacks": self.fallbacks,
+                "bytes_in": self.bytes_in, "bytes_out": self.bytes_out}
+
+
+def _write(path: str, data: bytes) -> None:
+    with open(path, "wb") as f:
+        f.write(data)
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
@@ -0,0 +1,77 @@
+"""Пул процессов для генерации PDF.
+
+Рендер (reportlab + pdfrw) полностью синхронный и грузит CPU, поэтому он
+выполняется в отдельных процессах, а не в event loop бота. Воркеры создаются
+через forkserver с предзагруженным fill_pdf (шрифт уже зарегистрирован) и при
+старте компилируют шаблоны — первая заявка не платит за прогрев.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+# ────────────────────────── ВОРКЕР ──────────────────────────
+def _init_worker(templates: tuple, engine: Optional[str]) -> None:
+    from fill_pdf import get_engine, get_template
+    get_engine(engine)
+    for t in templates:
+        try:
+            get_template(t)
+        except Exception as e:
+            logging.getLogger(__name__).warning("Шаблон %s не прогрет: %s", t, e)
+
+def _ping() -> int:
+    return os.getpid()
+
+def _render(template: str, data: Dict, engine: Optional[str]) -> bytes:
+    from fill_pdf import fill_pdf
+    return fill_pdf(template, None, data, engine=engine)
+
+# ────────────────────────── API ──────────────────────────
+def new_output_name(prefix: str = "form") -> str:
+    """Уникальное имя файла заявки: заявки не перезаписывают друг друга."""
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return f"{prefix}_{stamp}_{uuid.uuid4().hex[:8]}.pdf"
+
+async def start_pool(workers: int, templates: Iterable[str] = (), engine: Optional[str] = None) -> None:
+    """Поднимает пул и прогревает все воркеры. workers=0 — рендер в потоке."""
+    global _pool
+    if _pool is not None or workers <= 0:
+        return
+
+    templates = tuple(templates)
+    ctx = multiprocessing.get_context("forkserver")
+    ctx.set_forkserver_preload(["fill_pdf"])
+    _pool = ProcessPoolExecutor(
+        max_workers=workers, mp_context=ctx,
+        initializer=_init_worker, initargs=(templates, engine),
+    )
+
+    loop = asyncio.get_running_loop()
+    pids = await asyncio.gather(*(loop.run_in_executor(_pool, _ping) for _ in range(workers)))
+    logger.info("PDF pool: %d воркеров готовы (pid=%s)", len(set(pids)), sorted(set(pids)))
+
+def shutdown_pool() -> None:
+    global _pool
+    if _pool is None:
+        return
+    _pool.shutdown(wait=True, cancel_futures=True)
+    _pool = None
+
+async def render_pdf(template: str, data: Dict, engine: Optional[str] = None) -> bytes:
+    """Генерирует PDF вне event loop и возвращает его байты (без записи на диск)."""
+    if _pool is None:
+        return await asyncio.to_thread(_render, template, dict(data), engine)
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_pool, _render, template, dict(data), engine)
@@ -0,0 +1,220 @@
+"""Хранение состояния диалогов и user_data в SQLite.
+
+В отличие от PicklePersistence, который при каждом сбросе переписывает весь
+файл, здесь у каждого пользователя (чата, диалога) своя строка:
+
+* запись отложенная — Application раз в update_interval секунд передаёт
+  изменившиеся данные, они копятся в памяти и пишутся одной транзакцией;
+* user_data / chat_data читаются лениво — строка пользователя загружается
+  при первом его апдейте (refresh_user_data), а не вся таблица при старте;
+* состояния ConversationHandler загружаются целиком: их мало и они нужны
+  ConversationHandler'у сразу при инициализации.
+
+bot_data и callback_data не сохраняются: в bot_data нет ничего, что стоило
+бы переживать рестарт.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Set, Tuple
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_data (
+    user_id    INTEGER PRIMARY KEY,
+    data       BLOB    NOT NULL,
+    updated_at REAL    NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chat_data (
+    chat_id    INTEGER PRIMARY KEY,
+    data       BLOB    NOT NULL,
+    updated_at REAL    NOT NULL
+);
+CREATE TABLE IF NOT EXISTS conversations (
+    name       TEXT NOT NULL,
+    key        TEXT NOT NULL,            -- JSON-список, например [chat_id, user_id]
+    state      BLOB NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (name, key)
+);
+"""
+
+# Ключ отложенной записи: (таблица, id) → pickle-данные или None (удалить).
+PendingKey = Tuple[str, str]
+
+
+class SqlitePersistence(BasePersistence):
+    def __init__(self, path: str, update_interval: float = 5.0):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=True, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+        self._loaded_users: Set[int] = set()
+        self._loaded_chats: Set[int] = set()
+        self._pending: Dict[PendingKey, Optional[bytes]] = {}
+        self._commit_scheduled = False
+        self._commit_task: Optional[asyncio.Task] = None
+        self._closing = False
+
+    # ── чтение ──
+    def _load_row(self, table: str, column: str, key: int) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute(f"SELECT data FROM {table} WHERE {column}=?", (key,)).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    async def get_user_data(self) -> Dict[int, dict]:
+        return {}                                  # лениво, см. refresh_user_data
+
+    async def get_chat_data(self) -> Dict[int, dict]:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def get_conversations(self, name: str) -> Dict[tuple, object]:
+        def load():
+            with self._lock:
+                rows = self._db.execute("SELECT key, state FROM conversations WHERE name=?", (name,)).fetchall()
+            return {tuple(json.loads(k)): pickle.loads(s) for k, s in rows}
+        conversations = await asyncio.to_thread(load)
+        logger.info("Persistence: диалог %s — восстановлено %d состояний", name, len(conversations))
+        return conversations
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        if user_id in self._loaded_users:
+            return
+        self._loaded_users.add(user_id)
+        stored = await asyncio.to_thread(self._load_row, "user_data", "user_id", user_id)
+        if stored:
+            for k, v in stored.items():
+                user_data.setdefault(k, v)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        if chat_id in self._loaded_chats:
+            return
+        self._loaded_chats.add(chat_id)
+        stored = await asyncio.to_thread(self._load_row, "chat_data", "chat_id", chat_id)
+        if stored:
+            for k, v in stored.items():
+                chat_data.setdefault(k, v)
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+    # ── отложенная запись ──
+    def _stage(self, table: str, key: str, data: Optional[bytes]) -> None:
+        self._pending[(table, key)] = data
+        if not self._commit_scheduled:
+            # Application вызывает update_* пачкой через asyncio.gather; call_soon
+            # срабатывает после того, как все они положат данные в _pending.
+            self._commit_scheduled = True
+            asyncio.get_running_loop().call_soon(self._start_commit)
+
+    def _start_commit(self) -> None:
+        self._commit_scheduled = False
+        if self._closing:
+            return      # остаток допишет flush()
+        if self._commit_task is not None and not self._commit_task.done():
+            self._commit_task.add_done_callback(lambda _: self._start_commit())
+            return
+        if self._pending:
+            self._commit_task = asyncio.get_running_loop().create_task(self._commit())
+
+    async def _commit(self) -> None:
+        batch, self._pending = self._pending, {}
+        try:
+            await asyncio.to_thread(self._write, batch)
+        except Exception as e:
+            # Не теряем: вернём в очередь, если новых данных по этим ключам ещё нет.
+            for k, v in batch.items():
+                self._pending.setdefault(k, v)
+            logger.error("Persistence: не удалось записать %d строк: %s", len(batch), e)
+
+    def _write(self, batch: Dict[PendingKey, Optional[bytes]]) -> None:
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                for (table, key), data in batch.items():
+                    if table == "conversations":
+                        name, conv_key = key.split("\0", 1)
+                        if data is None:
+                            self._db.execute("DELETE FROM conversations WHERE name=? AND key=?", (name, conv_key))
+                        else:
+                            self._db.execute(
+                                "INSERT OR REPLACE INTO conversations(name, key, state, updated_at) VALUES (?, ?, ?, ?)",
+                                (name, conv_key, data, now))
+                        continue
+                    column = "user_id" if table == "user_data" else "chat_id"
+                    if data is None:
+                        self._db.execute(f"DELETE FROM {table} WHERE {column}=?", (int(key),))
+                    else:
+                        self._db.execute(
+                            f"INSERT OR REPLACE INTO {table}({column}, data, updated_at) VALUES (?, ?, ?)",
+                            (int(key), data, now))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        self._stage("user_data", str(user_id), pickle.dumps(data) if data else None)
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        self._stage("chat_data", str(chat_id), pickle.dumps(data) if data else None)
+
+    async def update_bot_data(self, data: dict) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def update_conversation(self, name: str, key: tuple, new_state: Optional[object]) -> None:
+        conv_key = json.dumps(list(key))
+        self._stage("conversations", f"{name}\0{conv_key}",
+                    None if new_state is None else pickle.dumps(new_state))
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._stage("user_data", str(user_id), None)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._stage("chat_data", str(chat_id), None)
+
+    async def flush(self) -> None:
+        """Вызывается Application при остановке: дописывает всё и закрывает БД."""
+        # После _closing новые коммиты не стартуют, но пока ждём текущий,
+        # отложенный call_soon мог успеть запустить следующий — ждём до конца.
+        self._closing = True
+        while self._commit_task is not None and not self._commit_task.done():
+            await asyncio.gather(self._commit_task, return_exceptions=True)
+        if self._pending:
+            batch, self._pending = self._pending, {}
+            await asyncio.to_thread(self._write, batch)
+        with self._lock:
+            self._db.close()
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            return {t: self._db.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0]
+                    for t in ("user_data", "chat_data", "conversations")}
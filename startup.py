@@ -0,0 +1,59 @@
+"""Профиль холодного старта.
+
+Отсчёт идёт от запуска процесса (по /proc/self/stat, иначе — от импорта
+этого модуля). Фазы (импорты, post_init, прогрев) и отметки («первый
+getUpdates») пишутся в лог и попадают в стартовое сообщение бота.
+"""
+from __future__ import annotations
+
+import os
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Dict, List, Tuple
+
+
+def _process_started_at() -> float:
+    """Момент запуска процесса в шкале perf_counter (учитывает старт интерпретатора)."""
+    now = perf_counter()
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        age = uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+        return now - max(0.0, age)
+    except (OSError, ValueError, IndexError):
+        return now
+
+
+T0 = _process_started_at()
+_phases: List[Tuple[str, float]] = []
+_marks: Dict[str, float] = {}
+
+@contextmanager
+def phase(name: str):
+    t = perf_counter()
+    try:
+        yield
+    finally:
+        _phases.append((name, perf_counter() - t))
+
+def mark(name: str) -> float:
+    """Первая отметка с этим именем: секунды от запуска процесса."""
+    return _marks.setdefault(name, perf_counter() - T0)
+
+def marked(name: str) -> bool:
+    return name in _marks
+
+def elapsed() -> float:
+    return perf_counter() - T0
+
+def report() -> str:
+    """Markdown для стартового сообщения."""
+    lines = [f"`{name}` {sec * 1000:.0f} ms" for name, sec in _phases]
+    lines += [f"`{name}` через {sec:.2f} s" for name, sec in _marks.items()]
+    return "\n".join(lines)
+
+def as_text() -> str:
+    return "; ".join([f"{n}={s * 1000:.0f}ms" for n, s in _phases] +
+                     [f"{n}@{s:.2f}s" for n, s in _marks.items()])
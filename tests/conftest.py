@@ -0,0 +1,11 @@
+"""Корень репозитория в sys.path и окружение как у бенчмарков: config/bot импортируются без .env."""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from bench.common import setup_env  # noqa: E402
+
+setup_env()
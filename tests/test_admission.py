@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from admission import FairLimiter, TokenBuckets
+
+
+def test_round_robin_between_users_fifo_within_user():
+    async def scenario():
+        limiter = FairLimiter("render", capacity=1)
+        order = []
+        positions = {}
+
+        async def job(owner, tag):
+            async with limiter.slot(owner, lambda pos, tag=tag: positions.setdefault(tag, []).append(pos)):
+                order.append(tag)
+                await asyncio.sleep(0)
+
+        await limiter.acquire("holder")
+        tasks = [asyncio.create_task(job(o, t)) for o, t in
+                 [("a", "a1"), ("a", "a2"), ("a", "a3"), ("b", "b1"), ("c", "c1")]]
+        await asyncio.sleep(0)
+        assert limiter.stats() == {"active": 1, "waiting": 5, "capacity": 1}
+        limiter.release()
+        await asyncio.gather(*tasks)
+        return order, positions, limiter.stats()
+
+    order, positions, stats = asyncio.run(scenario())
+    assert order == ["a1", "b1", "c1", "a2", "a3"]
+    assert positions["c1"][-1] == 1 and positions["a3"][0] == 3 and positions["a3"][-1] == 1
+    assert stats == {"active": 0, "waiting": 0, "capacity": 1}
+
+
+def test_cancelled_waiter_leaves_queue_and_keeps_capacity():
+    async def scenario():
+        limiter = FairLimiter("smtp", capacity=1)
+        await limiter.acquire("x")
+        waiting = asyncio.create_task(limiter.acquire("y"))
+        later = asyncio.create_task(limiter.acquire("z"))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        assert limiter.waiting == 1
+        limiter.release()
+        await asyncio.wait_for(later, 1)
+        assert limiter.stats() == {"active": 1, "waiting": 0, "capacity": 1}
+
+    asyncio.run(scenario())
+
+
+def test_token_bucket_burst_then_wait(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr("admission.time.monotonic", lambda: now[0])
+    buckets = TokenBuckets(rate=0.5, burst=2)
+    assert buckets.take(1) == 0 and buckets.take(1) == 0
+    assert buckets.take(1) == pytest.approx(2.0)
+    assert buckets.take(2) == 0
+    now[0] += 2.0
+    assert buckets.take(1) == 0
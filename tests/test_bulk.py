@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+from bulk import CHUNK, BulkError, load_rows
+
+HEADER = "date;time_range;company;car_model;car_plate;person\r\n"
+ROW = '15.08.2025;10:00 - 18:00;ООО "Ромашка";ГАЗель;А123ВС 178;Иванов\r\n'
+
+
+def _write(tmp_path, name, data: bytes):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_semicolon_cp1251_with_ragged_rows(tmp_path):
+    text = HEADER + ROW + "16.08.2025;09:00 - 10:00;ИП Петров;Ford;В777ХХ 98;Петров;лишнее;поле\r\n" + ROW.replace(";Иванов", "")
+    rows, errors = load_rows(_write(tmp_path, "passes.csv", text.encode("cp1251")), "passes.csv", 100)
+    assert [r["car_plate"] for r in rows] == ["А123ВС 178", "В777ХХ 98", "А123ВС 178"]
+    assert rows[0]["company"] == 'ООО "Ромашка"'
+    assert errors == []
+
+
+@pytest.mark.parametrize("sep", [",", ";", "\t"])
+def test_delimiter_fallback_uses_header(tmp_path, sep):
+    header = sep.join(["date", "time_range", "company", "car_model", "car_plate"])
+    lines = [header, sep.join(["15.08.2025", "10:00", "ООО", "ГАЗель", "А1"]), sep.join(["16.08.2025", "10:00"])]
+    rows, errors = load_rows(_write(tmp_path, "f.csv", "\n".join(lines).encode("utf-8")), "f.csv", 100)
+    assert [r["car_plate"] for r in rows] == ["А1"]
+    assert errors == ["строка 2: не заполнено: company, car_model, car_plate"]
+
+
+def test_bad_bytes_after_first_chunk_raise_bulk_error(tmp_path):
+    rows = (HEADER + ROW).encode("utf-8") + ROW.encode("utf-8") * (CHUNK // len(ROW.encode("utf-8")) + 10)
+    path = _write(tmp_path, "big.csv", rows + b"\xff\xfe;broken\r\n")
+    with pytest.raises(BulkError, match="UTF-8"):
+        load_rows(path, "big.csv", 10_000)
+
+
+def test_json_array(tmp_path):
+    data = [{"date": "2025-08-15", "time_range": "10:00", "company": "ООО", "car_model": "ГАЗель",
+             "car_plate": "А1", "mail3": "ABC"}, {"date": "xx"}]
+    rows, errors = load_rows(_write(tmp_path, "f.json", json.dumps(data).encode()), "f.json", 100)
+    assert rows[0]["date"] == "15.08.2025" and rows[0]["mail3"] == "abc"
+    assert errors == ["строка 2: не заполнено: time_range, company, car_model, car_plate"]
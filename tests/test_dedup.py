@@ -0,0 +1,37 @@
+from dedup import SubmissionCache, submission_key
+
+FORM = {"date": "15.08.2025", "company": 'ООО "Ромашка"', "car_plate": "А123ВС 178", "urgent": False}
+
+
+def test_key_ignores_whitespace_case_order_and_empty_fields():
+    messy = {"car_plate": "  а123вс   178 ", "urgent": True, "company": 'ооо  "РОМАШКА"',
+             "date": "15.08.2025", "cargo": "  ", "person": None}
+    assert submission_key(1, messy, ["B@x.ru", "a@x.ru"]) == submission_key(1, FORM, ["a@x.ru", "b@x.ru"])
+
+
+def test_key_depends_on_user_values_and_cc():
+    base = submission_key(1, FORM)
+    assert submission_key(2, FORM) != base
+    assert submission_key(1, {**FORM, "car_plate": "А124ВС 178"}) != base
+    assert submission_key(1, FORM, ["a@x.ru"]) != base
+
+
+def test_empty_and_bulk_payloads_hash():
+    assert submission_key(1, {}) != submission_key(1, {"rows": []})
+    rows = [{"car_plate": "А123ВС 178"}]
+    assert submission_key(1, {"rows": rows}) == submission_key(1, {"rows": [{"car_plate": "А123ВС 178"}]})
+
+
+def test_cache_reserve_discard_and_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("dedup.time.monotonic", lambda: now[0])
+    cache = SubmissionCache(ttl=10, max_size=2)
+    entry, fresh = cache.reserve("k")
+    assert fresh and cache.reserve("k") == (entry, False)
+    cache.discard("k")
+    assert cache.reserve("k")[1]
+    now[0] += 11
+    assert cache.reserve("k")[1]
+    cache.reserve("a")
+    cache.reserve("b")
+    assert cache.get("k") is None                  # вытеснен по LRU
@@ -0,0 +1,51 @@
+import pytest
+
+import email_sender
+
+
+class _Server:
+    calls = []
+
+    def __init__(self, host, port, timeout=None):
+        self.calls.append((type(self).__name__, port))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def starttls(self):
+        self.calls.append("starttls")
+
+    def login(self, user, password):
+        self.calls.append("login")
+
+    def send_message(self, msg):
+        self.calls.append("send")
+
+
+class SMTP(_Server):
+    pass
+
+
+class SMTP_SSL(_Server):
+    pass
+
+
+@pytest.mark.parametrize("security, port, expected", [
+    ("ssl", 465, [("SMTP_SSL", 465), "login", "send"]),
+    ("starttls", 587, [("SMTP", 587), "starttls", "login", "send"]),
+    ("none", 25, [("SMTP", 25), "login", "send"]),
+])
+def test_send_email_follows_smtp_security(monkeypatch, security, port, expected):
+    _Server.calls = []
+    monkeypatch.setattr(email_sender.smtplib, "SMTP", SMTP)
+    monkeypatch.setattr(email_sender.smtplib, "SMTP_SSL", SMTP_SSL)
+    monkeypatch.setattr(email_sender, "SMTP_SECURITY", security)
+    monkeypatch.setattr(email_sender, "SMTP_PORT", port)
+    monkeypatch.setattr(email_sender, "EMAIL_PASSWORD", "secret")
+
+    email_sender.send_email("subj", "body", b"%PDF-1.4", filename="a.pdf")
+
+    assert _Server.calls == expected
@@ -0,0 +1,66 @@
+import asyncio
+import logging
+
+from error_reports import TelegramErrorHandler
+
+
+class _Bot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await asyncio.sleep(0.005)
+        self.sent.append(text)
+
+
+class _App:
+    running = True
+
+    def __init__(self):
+        self.bot = _Bot()
+
+
+def test_storm_of_identical_errors_does_not_hide_a_different_one():
+    async def scenario():
+        app = _App()
+        handler = TelegramErrorHandler(app, chat_id=-100, window=0.3, max_queue=5)
+        handler.start()
+        log = logging.getLogger("test.storm")
+        log.propagate = False
+        log.addHandler(handler)
+        try:
+            for i in range(37):
+                log.error("SMTP timeout after %d ms", 1000 + i)
+            log.error("Template missing")
+            await asyncio.sleep(0.6)
+        finally:
+            log.removeHandler(handler)
+            await handler.stop()
+        return app.bot.sent, handler.dropped
+
+    sent, dropped = asyncio.run(scenario())
+    assert dropped == 0
+    assert len(sent) == 3
+    assert "SMTP timeout after 1000 ms" in sent[0]
+    assert "Template missing" in sent[1]
+    assert "×37" in sent[2] and "SMTP timeout" in sent[2]
+
+
+def test_new_window_reports_again():
+    async def scenario():
+        app = _App()
+        handler = TelegramErrorHandler(app, chat_id=-100, window=0.1, max_queue=5)
+        handler.start()
+        record = logging.LogRecord("test", logging.ERROR, __file__, 1, "boom %d", (1,), None)
+        try:
+            handler.emit(record)
+            handler.emit(record)
+            await asyncio.sleep(0.2)
+            handler.emit(record)
+            await asyncio.sleep(0.05)
+        finally:
+            await handler.stop()
+        return app.bot.sent
+
+    sent = asyncio.run(scenario())
+    assert [("×2" in t, "boom 1" in t) for t in sent] == [(False, True), (True, True), (False, True)]
@@ -0,0 +1,43 @@
+import fitz
+import pytest
+
+from bench.common import SAMPLE_FORM
+from fill_pdf import fill_pdf
+
+TEXT_FIELDS = ["date", "time_range", "company", "car_model", "car_plate", "cargo", "cargo_count", "person"]
+CHECK_FIELDS = ["use_lift", "materials_in", "materials_out", "unloading_big"]
+
+
+@pytest.fixture(scope="module")
+def template(tmp_path_factory):
+    doc = fitz.open()
+    page = doc.new_page(width=595, height=842)
+    for i, name in enumerate(TEXT_FIELDS + CHECK_FIELDS):
+        w = fitz.Widget()
+        w.field_name = name
+        if name in TEXT_FIELDS:
+            w.field_type, w.rect = fitz.PDF_WIDGET_TYPE_TEXT, fitz.Rect(100, 40 + 30 * i, 400, 58 + 30 * i)
+        else:
+            w.field_type, w.rect = fitz.PDF_WIDGET_TYPE_CHECKBOX, fitz.Rect(100, 40 + 30 * i, 112, 52 + 30 * i)
+        page.add_widget(w)
+    path = str(tmp_path_factory.mktemp("tpl") / "template.pdf")
+    doc.save(path)
+    return path
+
+
+def _text_lines(pdf: bytes) -> list:
+    return fitz.open(stream=pdf)[0].get_text().splitlines()[:len(TEXT_FIELDS)]
+
+
+@pytest.mark.parametrize("engine", ["pdfrw", "pymupdf", "incremental"])
+def test_extracted_text_matches_values(template, engine):
+    lines = _text_lines(fill_pdf(template, None, SAMPLE_FORM, engine=engine))
+    assert lines == [str(SAMPLE_FORM[f]) for f in TEXT_FIELDS]
+
+
+def test_pymupdf_embeds_font_only_when_drawing(template):
+    empty = fill_pdf(template, None, {}, engine="pymupdf")
+    assert len(empty) < 5_000
+    assert not [f for f in fitz.open(stream=empty)[0].get_fonts() if "Times" in f[3]]
+    full = fill_pdf(template, None, SAMPLE_FORM, engine="pymupdf")
+    assert len(full) < 2 * len(fill_pdf(template, None, SAMPLE_FORM, engine="pdfrw"))
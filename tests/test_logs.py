@@ -0,0 +1,23 @@
+import logging
+import queue
+import time
+
+from logs import DroppingQueueHandler
+
+
+def _record(level):
+    return logging.LogRecord("t", level, __file__, 1, "msg %d", (1,), None)
+
+
+def test_full_queue_drops_info_and_does_not_block_on_errors():
+    handler = DroppingQueueHandler(queue.Queue(1), put_timeout=0.05)
+    handler.handle(_record(logging.INFO))          # очередь заполнена, слушателя нет
+
+    handler.handle(_record(logging.INFO))
+    started = time.monotonic()
+    handler.handle(_record(logging.ERROR))
+    elapsed = time.monotonic() - started
+
+    assert handler.dropped == 2
+    assert elapsed < 1.0
+    assert handler.queue.get_nowait().getMessage() == "msg 1"
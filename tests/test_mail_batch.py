@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+import mail_batch
+from mail_batch import MailBatcher
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    calls = []
+
+    async def fake_send(subject, body, attachment, cc=None, filename=None):
+        calls.append({"subject": subject, "attachment": attachment, "cc": cc, "filename": filename})
+
+    monkeypatch.setattr(mail_batch, "send_email_async", fake_send)
+    return calls
+
+
+def _names(call):
+    if call["filename"] is not None:
+        return [call["filename"]]
+    return [name for name, _ in call["attachment"]]
+
+
+def test_groups_by_cc_within_window(sent):
+    async def scenario():
+        mailer = MailBatcher("Пропуск", "тело", window=0.05, max_size=10)
+        await asyncio.gather(
+            mailer.submit(b"1", "a.pdf"),
+            mailer.submit(b"2", "b.pdf"),
+            mailer.submit(b"3", "c.pdf", cc=["x@example.com"]),
+        )
+
+    asyncio.run(scenario())
+    assert sorted((tuple(c["cc"]), tuple(_names(c))) for c in sent) == [
+        ((), ("a.pdf", "b.pdf")),
+        (("x@example.com",), ("c.pdf",)),
+    ]
+    assert any("(2 шт.)" in c["subject"] for c in sent)
+
+
+def test_max_size_flushes_early_and_urgent_bypasses(sent):
+    async def scenario():
+        mailer = MailBatcher("Пропуск", "тело", window=60, max_size=2)
+        await asyncio.wait_for(asyncio.gather(mailer.submit(b"1", "a.pdf"), mailer.submit(b"2", "b.pdf")), 1)
+        await asyncio.wait_for(mailer.submit(b"3", "c.pdf", urgent=True), 1)
+
+    asyncio.run(scenario())
+    assert [_names(c) for c in sent] == [["a.pdf", "b.pdf"], ["c.pdf"]]
+
+
+def test_cancelled_waiter_is_not_mailed(sent):
+    async def scenario():
+        mailer = MailBatcher("Пропуск", "тело", window=0.1, max_size=10)
+        keep = asyncio.create_task(mailer.submit(b"1", "keep.pdf"))
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(mailer.submit(b"2", "drop.pdf"), 0.02)
+        await keep
+
+        alone = asyncio.create_task(mailer.submit(b"3", "alone.pdf"))
+        await asyncio.sleep(0)
+        alone.cancel()
+        await asyncio.gather(alone, return_exceptions=True)
+        assert not mailer._batches
+        await asyncio.sleep(0.15)
+        await mailer.close()
+
+    asyncio.run(scenario())
+    assert [_names(c) for c in sent] == [["keep.pdf"]]
+
+
+def test_cancelled_after_flush_is_skipped(sent):
+    async def scenario():
+        mailer = MailBatcher("Пропуск", "тело", window=60, max_size=2)
+        first = asyncio.create_task(mailer.submit(b"1", "a.pdf"))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(mailer.submit(b"2", "b.pdf"))   # набрал max_size: пакет ушёл в _deliver
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.gather(first, second, return_exceptions=True)
+        await mailer.close()
+
+    asyncio.run(scenario())
+    assert [_names(c) for c in sent] == [["b.pdf"]]
@@ -0,0 +1,107 @@
+import asyncio
+
+from outbox import Outbox, OutboxWorker
+
+
+def _worker(outbox, calls, block_deliver=None, fail_deliver=0):
+    failures = [fail_deliver]
+
+    async def render(job):
+        calls.append(("render", job.id))
+        job.pdf, job.pdf_name = b"%PDF-1.4 " + str(job.payload["n"]).encode(), f"pass_{job.id}.pdf"
+
+    async def deliver(job):
+        calls.append(("deliver", job.id, job.pdf))
+        if block_deliver is not None:
+            await block_deliver.wait()
+        if failures[0]:
+            failures[0] -= 1
+            raise RuntimeError("smtp down")
+
+    async def report(job):
+        calls.append(("report", job.id))
+
+    return OutboxWorker(outbox, [("render", render), ("deliver", deliver), ("report", report)],
+                        workers=1, backoff_base=0.0, backoff_max=0.0)
+
+
+async def _until(predicate, timeout=2.0):
+    for _ in range(int(timeout / 0.01)):
+        if predicate():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("не дождались")
+
+
+def test_resumes_from_first_unfinished_stage_after_restart(tmp_path):
+    path = str(tmp_path / "outbox.sqlite3")
+    calls = []
+
+    async def first_run():
+        outbox = Outbox(path)
+        worker = _worker(outbox, calls, block_deliver=asyncio.Event())
+        await worker.start()
+        job_id = await worker.submit("form", {"n": 7}, user_id=1, chat_id=1)
+        await _until(lambda: any(c[0] == "deliver" for c in calls))
+        await worker.stop()                           # «рестарт» посреди доставки
+        outbox.close()
+        return job_id
+
+    async def second_run():
+        outbox = Outbox(path)
+        assert outbox.counts() == {"running": 1}
+        worker = _worker(outbox, calls)
+        await worker.start()
+        await _until(lambda: outbox.counts() == {"done": 1})
+        await worker.stop()
+        outbox.close()
+
+    job_id = asyncio.run(first_run())
+    asyncio.run(second_run())
+    assert calls == [
+        ("render", job_id),
+        ("deliver", job_id, b"%PDF-1.4 7"),
+        ("deliver", job_id, b"%PDF-1.4 7"),         # PDF взят из БД, рендер не повторялся
+        ("report", job_id),
+    ]
+
+
+def test_failed_stage_is_retried_without_repeating_done_stages(tmp_path):
+    calls = []
+
+    async def scenario():
+        outbox = Outbox(str(tmp_path / "outbox.sqlite3"))
+        worker = _worker(outbox, calls, fail_deliver=2)
+        await worker.start()
+        job_id = await worker.submit("form", {"n": 1})
+        await _until(lambda: outbox.counts() == {"done": 1})
+        await worker.stop()
+        outbox.close()
+        return job_id
+
+    job_id = asyncio.run(scenario())
+    assert [c[0] for c in calls] == ["render", "deliver", "deliver", "deliver", "report"]
+    assert calls[0] == ("render", job_id)
+
+
+def test_gives_up_after_max_attempts(tmp_path):
+    given_up = []
+
+    async def scenario():
+        outbox = Outbox(str(tmp_path / "outbox.sqlite3"))
+        worker = _worker(outbox, [], fail_deliver=99)
+        worker.max_attempts = 3
+
+        async def on_give_up(job, exc):
+            given_up.append((job.id, str(exc)))
+
+        worker.on_give_up = on_give_up
+        await worker.start()
+        job_id = await worker.submit("form", {"n": 1})
+        await _until(lambda: outbox.counts() == {"failed": 1})
+        await worker.stop()
+        outbox.close()
+        return job_id
+
+    job_id = asyncio.run(scenario())
+    assert given_up == [(job_id, "smtp down")]
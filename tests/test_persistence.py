@@ -0,0 +1,46 @@
+import asyncio
+
+from persistence import SqlitePersistence
+
+
+def test_flush_writes_update_staged_right_after_commit(tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+
+    async def run():
+        p = SqlitePersistence(path)
+        await p.update_user_data(1, {"step": 1})
+        await asyncio.sleep(0)          # call_soon → первый коммит запущен
+        assert p._commit_task is not None and not p._commit_task.done()
+        await p.update_user_data(1, {"step": 2})
+        await p.update_chat_data(7, {"lang": "ru"})
+        await p.flush()
+
+    asyncio.run(run())
+
+    async def reopen():
+        p = SqlitePersistence(path)
+        user, chat = {}, {}
+        await p.refresh_user_data(1, user)
+        await p.refresh_chat_data(7, chat)
+        await p.flush()
+        return user, chat
+
+    assert asyncio.run(reopen()) == ({"step": 2}, {"lang": "ru"})
+
+
+def test_flush_waits_for_commit_started_while_waiting(tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+
+    async def run():
+        p = SqlitePersistence(path)
+        await p.update_user_data(1, {"step": 1})
+        await asyncio.sleep(0)
+        await p._commit_task
+        await p.update_user_data(2, {"step": 1})   # коммит №2 уже в call_soon
+        await p.flush()
+        assert p._commit_task.done() and not p._pending
+
+    asyncio.run(run())
+    reopened = SqlitePersistence(path)
+    assert reopened.counts()["user_data"] == 2
+    asyncio.run(reopened.flush())
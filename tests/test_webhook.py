@@ -0,0 +1,76 @@
+import asyncio
+import json
+
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+
+from bench.load import FakeBotApi
+from http_server import Request
+from webhook import SECRET_HEADER, BoundedUpdateProcessor, build_webhook_server
+
+SECRET = "s3cret"
+
+
+def _update(update_id: int) -> bytes:
+    return json.dumps({"update_id": update_id, "message": {
+        "message_id": update_id, "date": 0, "chat": {"id": 1, "type": "private"}, "text": "x"}}).encode()
+
+def _request(body: bytes, secret: str = SECRET) -> Request:
+    return Request("POST", "/tg", {SECRET_HEADER: secret}, body)
+
+def _app(processor) -> Application:
+    return (Application.builder().token("123:abc").request(FakeBotApi()).get_updates_request(FakeBotApi())
+            .updater(None).concurrent_updates(processor).build())
+
+async def _drained(processor: BoundedUpdateProcessor) -> None:
+    for _ in range(200):
+        if processor.pending == 0:
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"не обработано: {processor.pending}")
+
+
+def test_busy_once_pending_cap_is_hit():
+    async def scenario():
+        release = asyncio.Event()
+        done = []
+
+        async def slow(update, context):
+            await release.wait()
+            done.append(update.update_id)
+
+        processor = BoundedUpdateProcessor(2, max_pending=4)
+        app = _app(processor)
+        app.add_handler(TypeHandler(Update, slow))
+        handle = build_webhook_server(app, "127.0.0.1", 0, "/tg", SECRET)._routes[("POST", "/tg")]
+        await app.initialize()
+        await app.start()
+        try:
+            statuses = [(await handle(_request(_update(i))))[0] for i in range(10)]
+            assert statuses == [200] * 4 + [503] * 6
+            await asyncio.sleep(0.05)                  # очередь PTB уже пуста, а предел держится
+            assert app.update_queue.qsize() == 0
+            assert (await handle(_request(_update(10))))[0] == 503
+
+            release.set()
+            await _drained(processor)
+            assert sorted(done) == [0, 1, 2, 3]
+            assert (await handle(_request(_update(11))))[0] == 200
+            await _drained(processor)
+        finally:
+            release.set()
+            await app.stop()
+            await app.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_secret_mismatch_is_forbidden():
+    async def scenario():
+        app = _app(BoundedUpdateProcessor(1))
+        handle = build_webhook_server(app, "127.0.0.1", 0, "/tg", SECRET)._routes[("POST", "/tg")]
+        assert (await handle(_request(_update(1), secret="wrong")))[0] == 403
+        assert (await handle(_request(_update(1), secret="сЕкрет\xff")))[0] == 403
+        assert (await handle(Request("POST", "/tg", {}, _update(1))))[0] == 403
+
+    asyncio.run(scenario())
@@ -0,0 +1,175 @@
+"""Режим webhook: обновления приходят POST-запросами на встроенный HTTP-сервер.
+
+Альтернатива run_polling без long-poll соединения. Сервер проверяет
+X-Telegram-Bot-Api-Secret-Token, кладёт Update в очередь приложения, а
+обработка идёт параллельно (BoundedUpdateProcessor в concurrent_updates).
+Очередь PTB при параллельной обработке сразу пустеет, поэтому предел считает
+сам процессор: принятые и ещё не обработанные обновления. Если их уже
+max_pending, сервер отвечает 503 и Telegram повторит доставку позже.
+
+Проверка локально, без Telegram: записанные Update в JSON отправляются
+на сервер командой
+
+    python -m webhook post updates.json --url http://127.0.0.1:8443/telegram --secret ...
+"""
+from __future__ import annotations
+
+import asyncio
+import hmac
+import json
+import logging
+import signal
+from typing import Awaitable, Optional
+
+from telegram import Update
+from telegram.ext import Application, SimpleUpdateProcessor
+
+from http_server import HttpServer, Request
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+
+
+class BoundedUpdateProcessor(SimpleUpdateProcessor):
+    """
+    До concurrency обновлений обрабатываются параллельно; принятых и ещё не
+    обработанных (в очереди, ждут слота или выполняются) — не больше max_pending.
+    """
+    __slots__ = ("max_pending", "pending")
+
+    def __init__(self, concurrency: int, max_pending: Optional[int] = None):
+        super().__init__(concurrency)
+        self.max_pending = max(1, max_pending or concurrency)
+        self.pending = 0
+
+    def try_accept(self) -> bool:
+        if self.pending >= self.max_pending:
+            return False
+        self.pending += 1
+        return True
+
+    def release(self) -> None:
+        self.pending = max(0, self.pending - 1)
+
+    async def do_process_update(self, update: object, coroutine: Awaitable) -> None:
+        try:
+            await coroutine
+        finally:
+            self.release()
+
+
+def build_webhook_server(app: Application, host: str, port: int, path: str, secret: str) -> HttpServer:
+    """Приложение должно быть собрано с concurrent_updates(BoundedUpdateProcessor(...))."""
+    processor = app.update_processor
+    if not isinstance(processor, BoundedUpdateProcessor):
+        raise TypeError("Webhook: нужен concurrent_updates(BoundedUpdateProcessor(...))")
+    server = HttpServer(host, port)
+    expected = secret.encode()
+
+    async def handle(req: Request):
+        if not hmac.compare_digest(req.headers.get(SECRET_HEADER, "").encode(), expected):
+            return 403, "text/plain", b"forbidden"
+        try:
+            update = Update.de_json(json.loads(req.body), app.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning("Webhook: некорректный Update: %s", e)
+            return 400, "text/plain", b"bad update"
+        if not processor.try_accept():
+            return 503, "text/plain", b"busy"
+        try:
+            await app.update_queue.put(update)
+        except BaseException:
+            processor.release()
+            raise
+        return 200, "text/plain", b"ok"
+
+    server.route("POST", path, handle)
+    return server
+
+
+def run_webhook(app: Application, *, listen: str, port: int, path: str, url: Optional[str],
+                secret: Optional[str]) -> None:
+    """
+    Жизненный цикл как у Application.run_polling (post_init / post_shutdown,
+    stop_running() из хендлеров), только вместо Updater — свой HTTP-сервер.
+    Если url не задан, set_webhook не вызывается (локальная проверка).
+    Секрет обязателен: с ним же работает `python -m webhook post --secret`.
+    """
+    if not secret:
+        raise ValueError("Режим webhook требует WEBHOOK_SECRET")
+    server = build_webhook_server(app, listen, port, path, secret)
+    # stop_running() останавливает loop через loop.stop(), поэтому loop свой и run_forever.
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, loop.stop)
+        except NotImplementedError:
+            pass
+
+    try:
+        loop.run_until_complete(app.initialize())
+        if app.post_init:
+            loop.run_until_complete(app.post_init(app))
+        if url:
+            loop.run_until_complete(app.bot.set_webhook(
+                url=url, secret_token=secret, allowed_updates=Update.ALL_TYPES,
+                max_connections=min(100, app.update_processor.max_pending),
+            ))
+            logger.info("Webhook установлен: %s", url)
+        loop.run_until_complete(server.start())
+        loop.run_until_complete(app.start())
+        loop.run_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        loop.run_until_complete(server.stop())
+        if app.running:
+            loop.run_until_complete(app.stop())
+            if app.post_stop:
+                loop.run_until_complete(app.post_stop(app))
+        loop.run_until_complete(app.shutdown())
+        if app.post_shutdown:
+            loop.run_until_complete(app.post_shutdown(app))
+        loop.close()
+
+
+# ────────────────────────── ЛОКАЛЬНЫЙ REPLAY ──────────────────────────
+async def post_updates(url: str, secret: str, updates: list, concurrency: int = 8) -> dict:
+    """Отправляет записанные Update на webhook-сервер; возвращает счётчики по HTTP-статусам."""
+    import httpx
+
+    sem = asyncio.Semaphore(concurrency)
+    statuses: dict = {}
+
+    async with httpx.AsyncClient(timeout=10) as client:
+        async def one(u):
+            async with sem:
+                r = await client.post(url, json=u, headers={SECRET_HEADER: secret})
+                statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+
+        await asyncio.gather(*(one(u) for u in updates))
+    return statuses
+
+def main():
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Отправить записанные Update на локальный webhook")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("post")
+    p.add_argument("file", help="JSON: один Update или массив")
+    p.add_argument("--url", default="http://127.0.0.1:8443/telegram")
+    p.add_argument("--secret", required=True)
+    p.add_argument("--concurrency", type=int, default=8)
+    args = ap.parse_args()
+
+    with open(args.file, encoding="utf-8") as f:
+        updates = json.load(f)
+    if isinstance(updates, dict):
+        updates = [updates]
+    print(asyncio.run(post_updates(args.url, args.secret, updates, args.concurrency)))
+
+if __name__ == "__main__":
+    main()